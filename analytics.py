@@ -0,0 +1,116 @@
+"""
+Trend and forecast analytics over a user's daily totals.
+
+summarize() lays the daily_summary rows out as dense `array`s (one slot per
+calendar day, empty days zero) and builds prefix sums in a single pass;
+every rolling average, baseline and projection is then a difference of two
+prefix sums, so the cost is linear in the number of days and the whole
+result takes a few milliseconds even for many years of history.
+"""
+
+import calendar
+from array import array
+from datetime import timedelta
+
+ROLLING_WINDOWS = (7, 30)  # Days averaged for the rolling net series
+VELOCITY_WINDOW = 7  # Recent days compared against the baseline
+BASELINE_WINDOW = 30  # Days before a point that define "normal" spending
+ANOMALY_Z = 3.0  # Standard deviations above the baseline that flag a day
+ANOMALY_MIN_BASELINE = 7  # Days of history needed before a day can be flagged
+SERIES_DAYS = 90  # Trailing days returned in the rolling series and scanned for anomalies
+
+
+def dense_arrays(rows, today):
+    """Daily earnings and expenses from the first row's day through ``today``.
+
+    ``rows`` are (day, earning, expense), oldest first. Returns the first
+    day and two array('q') of equal length.
+    """
+    start = rows[0][0]
+    length = max((today - start).days, 0) + 1
+    earnings = array('q', bytes(8 * length))
+    expenses = array('q', bytes(8 * length))
+    for day, earning, expense in rows:
+        index = (day - start).days
+        if index < length:
+            earnings[index] = earning
+            expenses[index] = expense
+    return start, earnings, expenses
+
+
+def window_sum(prefix, end, size):
+    """Sum of the ``size`` values before index ``end`` (clamped at the start)."""
+    return prefix[end] - prefix[max(end - size, 0)]
+
+
+def summarize(rows, today):
+    """Rolling averages, month-end projection, spending velocity and anomalies.
+
+    Returns None when there are no rows.
+    """
+    if not rows:
+        return None
+    start, earnings, expenses = dense_arrays(rows, today)
+    length = len(earnings)
+
+    # One pass: prefix sums of net, expenses and squared expenses
+    net_prefix = array('q', [0]) * (length + 1)
+    spend_prefix = array('q', [0]) * (length + 1)
+    spend_sq_prefix = array('d', [0.0]) * (length + 1)
+    for i in range(length):
+        net_prefix[i + 1] = net_prefix[i] + earnings[i] - expenses[i]
+        spend_prefix[i + 1] = spend_prefix[i] + expenses[i]
+        spend_sq_prefix[i + 1] = spend_sq_prefix[i] + float(expenses[i]) ** 2
+
+    def average(prefix, end, size):
+        size = min(size, end)
+        return window_sum(prefix, end, size) / size if size else 0.0
+
+    # Trailing rolling averages of net per day
+    first = max(length - SERIES_DAYS, 0)
+    series = {
+        'days': [(start + timedelta(days=i)).isoformat() for i in range(first, length)],
+        'net': [earnings[i] - expenses[i] for i in range(first, length)],
+    }
+    for window in ROLLING_WINDOWS:
+        series[f'rolling_{window}'] = [round(average(net_prefix, i + 1, window), 2) for i in range(first, length)]
+
+    # Month-to-date net plus the 30-day average for each remaining day
+    month_start = max((today.replace(day=1) - start).days, 0)
+    month_to_date = net_prefix[length] - net_prefix[month_start]
+    remaining = calendar.monthrange(today.year, today.month)[1] - today.day
+    daily_net = average(net_prefix, length, BASELINE_WINDOW)
+
+    # Spending per day lately vs the baseline period just before it
+    recent = average(spend_prefix, length, VELOCITY_WINDOW)
+    baseline_end = max(length - VELOCITY_WINDOW, 0)
+    baseline = average(spend_prefix, baseline_end, BASELINE_WINDOW)
+
+    # Days whose spending is far above the mean of the days before them
+    anomalies = []
+    for i in range(max(first, ANOMALY_MIN_BASELINE), length):
+        size = min(BASELINE_WINDOW, i)
+        mean = window_sum(spend_prefix, i, size) / size
+        variance = window_sum(spend_sq_prefix, i, size) / size - mean * mean
+        if variance <= 0:
+            continue
+        z = (expenses[i] - mean) / variance ** 0.5
+        if z >= ANOMALY_Z:
+            anomalies.append({
+                'day': (start + timedelta(days=i)).isoformat(),
+                'expenses': expenses[i],
+                'baseline': round(mean, 2),
+                'z': round(z, 1),
+            })
+
+    return {
+        'days_tracked': length,
+        'rolling_net': {window: round(average(net_prefix, length, window), 2) for window in ROLLING_WINDOWS},
+        'month_to_date_net': month_to_date,
+        'projected_month_net': round(month_to_date + daily_net * remaining),
+        'spending_velocity': round(recent, 2),
+        'spending_baseline': round(baseline, 2),
+        'spending_change': round((recent - baseline) / baseline * 100, 1) if baseline else None,
+        'anomalies': anomalies[::-1],
+        'series': series,
+    }
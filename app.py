@@ -1,52 +1,105 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import Flask, Response, g, jsonify, render_template, request, redirect, url_for, flash, session, make_response
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 import json
 import os
 import csv
-import csv
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from datetime import datetime
-from contextlib import contextmanager
+import hashlib
+import io
+import itertools
+import math
+import re
+import time
+from datetime import datetime, date
+from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
+from markupsafe import Markup
+from storage import QueryTimeout, create_storage
+import analytics
+import metrics
+from cache import TTLCache
 
 load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY')
+# Largest accepted request body, i.e. /upload file
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('UPLOAD_MAX_MB', '100')) * 1024 * 1024
+
+# Calendar days (history cards, daily totals) are cut in this time zone.
+# ZoneInfo() rejects unknown names, which also keeps it safe to embed in DDL.
+APP_TIMEZONE = os.getenv('APP_TIMEZONE', 'UTC')
+APP_TZ = ZoneInfo(APP_TIMEZONE)
+
+# PostgreSQL, or an embedded SQLite file for sqlite:/// URLs (see storage.py)
+storage = create_storage(os.getenv('DATABASE_URL'), APP_TIMEZONE)
 
 # Flask-Login setup
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
+
+# Per-route latency/SQL histograms and the /metrics endpoint
+metrics.init_app(
+    app,
+    pool_stats=storage.stats,
+    token=os.getenv('METRICS_TOKEN'),
+    slow_request_ms=float(os.getenv('SLOW_REQUEST_MS', '0')) or None,
+)
 from werkzeug.security import generate_password_hash, check_password_hash
 # User model for Flask-Login
+# Identities (never password hashes) are cached so authenticated requests
+# don't need a users query.
+user_cache = TTLCache(
+    maxsize=int(os.getenv('USER_CACHE_SIZE', '1024')),
+    ttl=float(os.getenv('USER_CACHE_TTL', '300')),
+)
+
 class User(UserMixin):
-    def __init__(self, id, username, password_hash):
+    def __init__(self, id, username):
         self.id = id
         self.username = username
-        self.password_hash = password_hash
 
     @staticmethod
     def get(user_id):
-        with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM users WHERE id = %s', (user_id,))
-            user = cursor.fetchone()
-            if user:
-                return User(user['id'], user['username'], user['password_hash'])
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+        identity = user_cache.get_or_load(user_id, lambda: User._load_identity(user_id))
+        if identity:
+            return User(*identity)
         return None
 
+    @staticmethod
+    def _load_identity(user_id):
+        return storage.get_user(user_id)
+
     @staticmethod
     def get_by_username(username):
-        with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM users WHERE username = %s', (username,))
-            user = cursor.fetchone()
-            if user:
-                return User(user['id'], user['username'], user['password_hash'])
+        user = storage.find_user(username)
+        if user:
+            return User(user['id'], user['username'])
         return None
 
+    @staticmethod
+    def authenticate(username, password):
+        """Return the User if the password matches, otherwise None."""
+        user = storage.find_user(username)
+        if user and check_password_hash(user['password_hash'], password):
+            user_cache.set(user['id'], (user['id'], user['username']))
+            return User(user['id'], user['username'])
+        return None
+
+    @staticmethod
+    def set_password(user_id, password):
+        storage.set_password_hash(user_id, generate_password_hash(password))
+        User.invalidate(user_id)
+
+    @staticmethod
+    def invalidate(user_id):
+        """Forget the cached identity so the next request reloads it."""
+        user_cache.invalidate(int(user_id))
+
 @login_manager.user_loader
 def load_user(user_id):
     return User.get(user_id)
@@ -62,10 +115,8 @@ def register():
         if User.get_by_username(username):
             flash('Username already exists.')
             return redirect(url_for('register'))
-        password_hash = generate_password_hash(password)
-        with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute('INSERT INTO users (username, password_hash) VALUES (%s, %s)', (username, password_hash))
+        user_id = storage.create_user(username, generate_password_hash(password))
+        User.invalidate(user_id)
         flash('Registration successful. Please log in.')
         return redirect(url_for('login'))
     return render_template('register.html')
@@ -76,8 +127,8 @@ def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        user = User.get_by_username(username)
-        if user and check_password_hash(user.password_hash, password):
+        user = User.authenticate(username, password)
+        if user:
             login_user(user)
             flash('Logged in successfully.')
             return redirect(url_for('home'))
@@ -94,50 +145,65 @@ def logout():
     flash('Logged out.')
     return redirect(url_for('login'))
 
-DB_FILE = "tracker_data.db"
 DATA_FILE = "tracker_data.json"  # Keep for backward compatibility
-CSV_FILE = "tracker_data.csv"
 
-@contextmanager
-def get_db():
-    """Context manager for database connections."""
-    conn = psycopg2.connect(os.getenv('DATABASE_URL'), cursor_factory=RealDictCursor)
-    try:
-        yield conn
-        conn.commit()
-    except Exception:
-        conn.rollback()
-        raise
-    finally:
-        conn.close()
+def get_db(write=False):
+    """Context manager for a storage transaction (see storage.py).
 
-def init_db():
-    """Initialize the PostgreSQL database with required tables."""
-    with get_db() as conn:
-        cursor = conn.cursor()
-        
-        # Create users table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL
-            )
-        ''')
-        # Create transactions table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS transactions (
-                id SERIAL PRIMARY KEY,
-                date TEXT NOT NULL,
-                description TEXT NOT NULL,
-                amount INTEGER NOT NULL,
-                type TEXT CHECK(type IN ('earning','expense')) NOT NULL,
-                user_id INTEGER NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-            )
-        ''')
-        
-        conn.commit()
+    Nested blocks join the outer transaction, which is committed when the
+    outermost block exits; ``write`` marks blocks that will modify data.
+    """
+    return storage.connection(write)
+
+@app.teardown_appcontext
+def release_db(exc):
+    """Hand back the request's connection, if one was checked out."""
+    storage.release()
+
+# Longest a single statement may run, per request (0 = no limit). Routes that
+# scan a lot of history get their own budget; the streamed export has none.
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '5000'))
+ROUTE_STATEMENT_TIMEOUTS = {
+    'history': 10000,
+    'api_series': 15000,
+    'api_analytics': 15000,
+    'reports': 15000,
+    'search': 15000,
+    'api_search': 15000,
+    'upload': 0,
+    'api_bulk_transactions': 30000,
+}
+# After a write, the same session reads from the primary for this many
+# seconds so it never misses its own changes on a lagging replica.
+REPLICA_STICKY_SECONDS = float(os.getenv('DATABASE_REPLICA_STICKY', '10'))
+
+@app.before_request
+def configure_db():
+    """Pick this request's statement timeout and whether reads must use the primary."""
+    if DB_STATEMENT_TIMEOUT_MS:
+        g.db_statement_timeout = ROUTE_STATEMENT_TIMEOUTS.get(request.endpoint, DB_STATEMENT_TIMEOUT_MS)
+    else:
+        g.db_statement_timeout = 0
+    g.db_primary_reads = session.get('primary_until', 0) > time.time()
+
+@app.after_request
+def stick_to_primary(response):
+    if g.get('db_wrote') and os.getenv('DATABASE_REPLICA_URL'):
+        session['primary_until'] = time.time() + REPLICA_STICKY_SECONDS
+    return response
+
+@app.errorhandler(QueryTimeout)
+def query_timeout(e):
+    """A statement ran past the request's timeout: 503 rather than a hung worker."""
+    message = "The database took too long to answer. Try a smaller date range, or try again shortly."
+    if request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json' \
+            or request.path.startswith('/api/'):
+        return jsonify(error=message), 503
+    return render_template('error.html', error_message=message), 503
+
+def init_db(force=False):
+    """Bring the database schema up to date; True if it was (re)applied."""
+    return storage.init_schema(force)
 
 def save_record_to_db(earning_items, total_earning, expense_items, total_expenses):
     """Save record to SQLite database."""
@@ -158,46 +224,50 @@ def load_existing_data():
             return {"records": []}
     return {"records": []}
 
-def export_to_csv():
-    """Export all records from database to CSV file."""
-    try:
-        with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM records ORDER BY date')
-            records = cursor.fetchall()
-            
-            if not records:
-                return False
-            
-            with open(CSV_FILE, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow(["Date", "Earnings", "Total Earning", "Expenses", "Total Expenses", "Net"])
-                
-                for record in records:
-                    record_id = record['id']
-                    
-                    # Fetch earnings and expenses for this record
-                    cursor.execute('SELECT name, amount FROM earnings WHERE record_id = %s', (record_id,))
-                    earnings = cursor.fetchall()
-                    earnings_str = ", ".join([f"{e['name']}: {e['amount']}" for e in earnings])
-                    
-                    cursor.execute('SELECT name, amount FROM expenses WHERE record_id = %s', (record_id,))
-                    expenses = cursor.fetchall()
-                    expenses_str = ", ".join([f"{e['name']}: {e['amount']}" for e in expenses])
-                    
-                    writer.writerow([
-                        record['date'],
-                        earnings_str,
-                        record['total_earning'],
-                        expenses_str,
-                        record['total_expenses'],
-                        record['net']
-                    ])
-            
-            return True
-    except Exception as e:
-        print(f"Error exporting to CSV: {e}")
-        return False
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+}
+EXPORT_COLUMNS = ('id', 'date', 'type', 'description', 'amount')
+EXPORT_CHUNK_BYTES = 64 * 1024  # Response chunk size
+
+def export_chunks(rows, fmt):
+    """Encode rows as CSV or JSON Lines, yielding ~EXPORT_CHUNK_BYTES at a time."""
+    buffer = io.StringIO()
+    if fmt == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        write = writer.writerow
+    else:
+        def write(row):
+            buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False))
+            buffer.write('\n')
+    for row in rows:
+        write(row)
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+@app.route('/export')
+@login_required
+def export():
+    """Stream the current user's transactions as CSV (default) or JSONL.
+
+    Optional ``from``/``to`` (YYYY-MM-DD, inclusive) limit the date range.
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return render_template('error.html', error_message=f"Unsupported export format: {fmt}"), 400
+    date_from = parse_day(request.args.get('from'))
+    date_to = parse_day(request.args.get('to'))
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    rows = storage.stream_transactions(current_user.id, date_from, date_to)
+    return Response(export_chunks(rows, fmt), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=transactions.{extension}',
+    })
 
 @app.route('/')
 @login_required
@@ -205,43 +275,68 @@ def home():
     """Display the main form page."""
     if not current_user.is_authenticated:
         return redirect(url_for('login'))
-    return render_template('index.html', user=current_user)
+    return render_template('index.html', user=current_user, categories=category_names(current_user.id),
+                           balance=storage.balance(current_user.id))
+
+LINE_ITEM_PREFIXES = {'earning_name_': 'earning', 'expense_name_': 'expense'}
+
+def parse_line_items(form):
+    """Collect earning and expense items from the form in a single pass.
+
+    Fields come in pairs named ``<kind>_name_<n>`` / ``<kind>_amount_<n>``;
+    pairs with an empty name or a non-positive amount are skipped.
+    """
+    items = {'earning': [], 'expense': []}
+    for key, value in form.items():
+        for prefix, kind in LINE_ITEM_PREFIXES.items():
+            if key.startswith(prefix):
+                amount = form.get(f'{kind}_amount_{key[len(prefix):]}')
+                if amount is not None:
+                    name = value.strip()
+                    amount = int(amount or 0)
+                    if name and amount > 0:
+                        items[kind].append({"name": name, "amount": amount})
+                break
+    return items['earning'], items['expense']
+
+def ensure_categories(user_id, names):
+    """Create any missing categories for ``names`` in one batched upsert."""
+    if storage.ensure_categories(user_id, names):
+        category_cache.invalidate(user_id)
+
+def save_transactions(rows):
+    """Insert (date, description, amount, type, user_id) rows.
+
+    Categories are resolved with one upsert per user, then every row is
+    written in a single batched insert. Returns the new ids.
+    """
+    if not rows:
+        return []
+    names_by_user = {}
+    for row in rows:
+        names_by_user.setdefault(row[4], set()).add(row[1])
+    with get_db(write=True):
+        for user_id, names in names_by_user.items():
+            ensure_categories(user_id, names)
+        return storage.insert_transactions(rows)
+
+# Category names for the entry form's autocomplete, per user
+category_cache = TTLCache(
+    maxsize=int(os.getenv('CATEGORY_CACHE_SIZE', '1024')),
+    ttl=float(os.getenv('CATEGORY_CACHE_TTL', '600')),
+)
+CATEGORY_SUGGESTIONS = 500  # Most-used categories offered for autocomplete
+
+def category_names(user_id):
+    """The user's most-used category names, cached."""
+    return category_cache.get_or_load(user_id, lambda: storage.category_names(user_id, CATEGORY_SUGGESTIONS))
 
 @app.route('/calculate', methods=['POST'])
 @login_required
 def calculate():
     """Process the form data and calculate the summary."""
     try:
-        # Get all form data
-        form_data = request.form.to_dict()
-        
-        # Parse earnings
-        earning_items = []
-        for key, value in form_data.items():
-            if key.startswith('earning_name_'):
-                item_id = key.replace('earning_name_', '')
-                amount_key = f'earning_amount_{item_id}'
-                
-                if amount_key in form_data:
-                    name = value.strip()
-                    amount = int(form_data[amount_key] or 0)
-                    
-                    if name and amount > 0:
-                        earning_items.append({"name": name, "amount": amount})
-        
-        # Parse expenses
-        expense_items = []
-        for key, value in form_data.items():
-            if key.startswith('expense_name_'):
-                item_id = key.replace('expense_name_', '')
-                amount_key = f'expense_amount_{item_id}'
-                
-                if amount_key in form_data:
-                    name = value.strip()
-                    amount = int(form_data[amount_key] or 0)
-                    
-                    if name and amount > 0:
-                        expense_items.append({"name": name, "amount": amount})
+        earning_items, expense_items = parse_line_items(request.form)
         
         # Calculate totals
         total_earning = sum(item['amount'] for item in earning_items)
@@ -260,20 +355,11 @@ def calculate():
             status_color = "blue"
         
         # Save transactions for the logged-in user
-        with get_db() as conn:
-            cursor = conn.cursor()
-            user_id = current_user.id
-            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            for item in earning_items:
-                cursor.execute('''
-                    INSERT INTO transactions (date, description, amount, type, user_id)
-                    VALUES (%s, %s, %s, 'earning', %s)
-                ''', (now, item['name'], item['amount'], user_id))
-            for item in expense_items:
-                cursor.execute('''
-                    INSERT INTO transactions (date, description, amount, type, user_id)
-                    VALUES (%s, %s, %s, 'expense', %s)
-                ''', (now, item['name'], item['amount'], user_id))
+        user_id = current_user.id
+        now = datetime.now(APP_TZ)
+        rows = [(now, item['name'], item['amount'], 'earning', user_id) for item in earning_items]
+        rows += [(now, item['name'], item['amount'], 'expense', user_id) for item in expense_items]
+        save_transactions(rows)
         
         # Prepare data to send to results page
         result_data = {
@@ -288,83 +374,580 @@ def calculate():
         
         return render_template('results.html', data=result_data)
     
+    except QueryTimeout:
+        raise
     except Exception as e:
         return render_template('error.html', error_message=str(e))
 
+MAX_AMOUNT = 2**31 - 1  # Largest amount the INTEGER amount column holds
+
+UPLOAD_BATCH_ROWS = 5000  # Rows validated and sent to the database at a time
+UPLOAD_MAX_ERRORS = 50  # Rejected rows listed in the summary; the rest are only counted
+UPLOAD_MAX_DESCRIPTION = 200
+
+def iter_upload_rows(stream):
+    """Yield (line number, row dict) from a CSV (with header) or JSONL text stream.
+
+    The format is taken from the first line; unparsable JSONL lines yield None.
+    """
+    first = stream.readline()
+    if not first:
+        return
+    lines = itertools.chain([first], stream)
+    if first.lstrip().startswith('{'):
+        for number, line in enumerate(lines, 1):
+            if line.strip():
+                try:
+                    yield number, json.loads(line)
+                except ValueError:
+                    yield number, None
+    else:
+        reader = csv.DictReader(lines)
+        if reader.fieldnames:
+            reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+        for row in reader:
+            yield reader.line_num, row
+
+def parse_upload_row(row):
+    """Validate one uploaded row into (date, description, amount, type).
+
+    ``type`` may be left out, in which case a negative amount is an expense.
+    Naive dates are taken in APP_TZ. Raises ValueError with the reason.
+    """
+    if not isinstance(row, dict):
+        raise ValueError("not a row with date, type, description and amount")
+    try:
+        when = datetime.fromisoformat(str(row.get('date') or '').strip())
+    except ValueError:
+        raise ValueError(f"bad date {row.get('date')!r}")
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=APP_TZ)
+    description = str(row.get('description') or row.get('name') or '').strip()
+    if not description:
+        raise ValueError("missing description")
+    if len(description) > UPLOAD_MAX_DESCRIPTION:
+        raise ValueError(f"description longer than {UPLOAD_MAX_DESCRIPTION} characters")
+    if '\x00' in description:
+        raise ValueError("description contains a NUL character")
+    try:
+        amount = int(str(row.get('amount')).strip())
+    except ValueError:
+        raise ValueError(f"amount must be a whole number, got {row.get('amount')!r}")
+    kind = str(row.get('type') or '').strip().lower()
+    if not kind:
+        kind = 'expense' if amount < 0 else 'earning'
+        amount = abs(amount)
+    if kind not in ('earning', 'expense'):
+        raise ValueError(f"type must be earning or expense, got {row.get('type')!r}")
+    if amount < 0:
+        raise ValueError("amount must not be negative")
+    if amount > MAX_AMOUNT:
+        raise ValueError(f"amount must not exceed {MAX_AMOUNT}")
+    return when, description, amount, kind
+
+def upload_batches(rows, summary):
+    """Group valid rows into batches, recording counts and rejects in ``summary``."""
+    batch = []
+    for number, row in rows:
+        summary['rows'] += 1
+        try:
+            parsed = parse_upload_row(row)
+        except ValueError as e:
+            summary['rejected'] += 1
+            if len(summary['errors']) < UPLOAD_MAX_ERRORS:
+                summary['errors'].append({'line': number, 'error': str(e)})
+            continue
+        summary['days'].add(parsed[0].astimezone(APP_TZ).date())
+        batch.append(parsed)
+        if len(batch) >= UPLOAD_BATCH_ROWS:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+@app.route('/upload', methods=['GET', 'POST'])
+@login_required
+def upload():
+    """Load a CSV/JSONL file of dated transactions for the current user.
+
+    The file is parsed as a stream and validated in batches that are
+    loaded (COPY on PostgreSQL) inside one transaction; invalid rows are
+    skipped and reported. Answers with JSON when the client asks for it.
+    """
+    wants_json = request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+    if request.method != 'POST':
+        return render_template('upload.html', summary=None)
+    file = request.files.get('file')
+    if not file or not file.filename:
+        if wants_json:
+            return jsonify(error="no file uploaded"), 400
+        flash('Choose a file to upload.')
+        return redirect(url_for('upload'))
+
+    summary = {'rows': 0, 'loaded': 0, 'rejected': 0, 'errors': [], 'days': set()}
+    stream = io.TextIOWrapper(file.stream, encoding='utf-8-sig', newline='')
+    started = time.perf_counter()
+    try:
+        with get_db(write=True):
+            summary['loaded'] = storage.load_transactions(
+                current_user.id, upload_batches(iter_upload_rows(stream), summary))
+    except (UnicodeDecodeError, csv.Error) as e:
+        message = f"could not read the file: {e}"
+        if wants_json:
+            return jsonify(error=message), 400
+        return render_template('error.html', error_message=message), 400
+    if summary['loaded']:
+        category_cache.invalidate(current_user.id)
+    summary['days'] = len(summary['days'])
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    if wants_json:
+        return jsonify(summary)
+    return render_template('upload.html', summary=summary, filename=file.filename)
+
+HISTORY_PAGE_SIZE = 20  # Day cards per /history page
+HISTORY_MAX_PAGE_SIZE = 100
+
+def parse_day(value):
+    """Parse a YYYY-MM-DD query parameter, returning None if absent or invalid."""
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+# Rendered day cards keyed by (user, day, data version). Any write bumps the
+# user's version, so outdated cards are simply never asked for again.
+history_card_cache = TTLCache(
+    maxsize=int(os.getenv('HISTORY_CARD_CACHE_SIZE', '4096')),
+    ttl=float(os.getenv('HISTORY_CARD_CACHE_TTL', '600')),
+)
+
+def template_digest(*names):
+    """Short hash of template sources, so ETags change along with the markup."""
+    digest = hashlib.sha1()
+    for name in names:
+        digest.update(app.jinja_loader.get_source(app.jinja_env, name)[0].encode())
+    return digest.hexdigest()[:12]
+
+HISTORY_TEMPLATES = template_digest('base.html', 'history.html', 'day_card.html', 'analytics_panel.html')
+
+def history_etag(user_id, version):
+    """ETag for /history: who is asking, their data version, the day and the query.
+
+    The day is included because the analytics panel projects from today.
+    """
+    query = '&'.join(f'{key}={value}' for key, value in sorted(request.args.items(multi=True)))
+    today = datetime.now(APP_TZ).date()
+    return hashlib.sha1(f'{user_id}:{version}:{today}:{HISTORY_TEMPLATES}:{query}'.encode()).hexdigest()
+
+# Analytics are cached per (user, data version, day): any write bumps the
+# version, and the projection moves on with the calendar.
+analytics_cache = TTLCache(
+    maxsize=int(os.getenv('ANALYTICS_CACHE_SIZE', '1024')),
+    ttl=float(os.getenv('ANALYTICS_CACHE_TTL', '3600')),
+)
+
+def user_analytics(user_id, version):
+    """Trends, projection and anomalies for the user (see analytics.py), or None."""
+    today = datetime.now(APP_TZ).date()
+    return analytics_cache.get_or_load(
+        (user_id, version, today), lambda: analytics.summarize(storage.daily_totals(user_id), today))
+
+def history_cards(user_id, version, days):
+    """Rendered cards for ``days``, taking transactions only for uncached days."""
+    cards = {row['day']: history_card_cache.get((user_id, row['day'], version)) for row in days}
+    missing = [row for row in days if cards[row['day']] is None]
+    if missing:
+        records = {}
+        for row in missing:
+            records[row['day']] = {
+                'date': row['day'].isoformat(),
+                'earnings': [],
+                'expenses': [],
+                'total_earning': row['total_earning'],
+                'total_expenses': row['total_expenses'],
+                'net': row['total_earning'] - row['total_expenses']
+            }
+        for txn in storage.day_transactions(user_id, missing[-1]['day'], missing[0]['day']):
+            record = records.get(txn['day'])
+            if record is not None:
+                key = 'earnings' if txn['type'] == 'earning' else 'expenses'
+                record[key].append(txn)
+        for day, record in records.items():
+            # A day with totals but no rows belongs to an archived month
+            record['archived'] = not record['earnings'] and not record['expenses']
+            cards[day] = Markup(render_template('day_card.html', record=record))
+            history_card_cache.set((user_id, day, version), cards[day])
+    return [cards[row['day']] for row in days]
+
 @app.route('/history')
 def history():
-    """Display all saved records from database."""
+    """Display saved records, newest day first, one page of days at a time.
+
+    Day totals come straight from daily_summary. Pagination is keyset-based:
+    ``before`` is the oldest day on the previous page, so every page costs
+    the same no matter how much history the user has. Optional ``from``/``to``
+    (YYYY-MM-DD, inclusive) narrow the range via the same index.
+
+    The page carries an ETag built from the user's data version: a repeat
+    visit with nothing changed costs one version lookup and gets a 304, and
+    unchanged day cards are served from history_card_cache.
+    """
     try:
         if not current_user.is_authenticated:
             return redirect(url_for('login'))
-        with get_db() as conn:
-            cursor = conn.cursor()
-            user_id = current_user.id
-            cursor.execute('''
-                SELECT id, date, description, amount, type
-                FROM transactions
-                WHERE user_id = %s
-                ORDER BY date DESC
-            ''', (user_id,))
-            all_transactions = cursor.fetchall()
-            # Aggregate by date, keeping transaction objects with IDs
-            history = {}
-            for txn in all_transactions:
-                date = txn['date']
-                if date not in history:
-                    history[date] = {'earnings': [], 'expenses': [], 'total_earning': 0, 'total_expenses': 0}
-                txn_obj = dict(txn)  # Convert sqlite3.Row to dict
-                if txn['type'] == 'earning':
-                    history[date]['earnings'].append(txn_obj)
-                    history[date]['total_earning'] += txn['amount']
-                else:
-                    history[date]['expenses'].append(txn_obj)
-                    history[date]['total_expenses'] += txn['amount']
-            # Prepare records for template
-            records = []
-            for date, data in history.items():
-                net = data['total_earning'] - data['total_expenses']
-                records.append({
-                    'date': date,
-                    'earnings': data['earnings'],
-                    'expenses': data['expenses'],
-                    'total_earning': data['total_earning'],
-                    'total_expenses': data['total_expenses'],
-                    'net': net
-                })
-            return render_template('history.html', records=records)
+        before = parse_day(request.args.get('before'))
+        date_from = parse_day(request.args.get('from'))
+        date_to = parse_day(request.args.get('to'))
+        limit = min(max(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), 1), HISTORY_MAX_PAGE_SIZE)
+        user_id = current_user.id
+        with get_db():
+            version = storage.data_version(user_id)
+            etag = history_etag(user_id, version)
+            # A pending flash message is part of the page, so render it then
+            if '_flashes' not in session and request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                # One extra day tells us whether an older page exists
+                days = storage.history_days(user_id, before, date_from, date_to, limit + 1)
+                has_more = len(days) > limit
+                days = days[:limit]
+                cards = history_cards(user_id, version, days)
+                next_before = days[-1]['day'].isoformat() if has_more else None
+                filters = {
+                    'from': date_from.isoformat() if date_from else None,
+                    'to': date_to.isoformat() if date_to else None,
+                }
+                response = make_response(render_template('history.html', cards=cards, next_before=next_before,
+                                                         limit=limit, filters=filters,
+                                                         analytics=user_analytics(user_id, version)))
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    except QueryTimeout:
+        raise
     except Exception as e:
         return render_template('error.html', error_message=str(e))
 
+@app.route('/api/analytics')
+@login_required
+def api_analytics():
+    """Rolling net averages, month-end projection, spending velocity and anomalies."""
+    with get_db():
+        summary = user_analytics(current_user.id, storage.data_version(current_user.id))
+    if summary is None:
+        return jsonify(error="no records yet"), 404
+    return jsonify(summary)
+
+SERIES_BUCKETS = ('day', 'week', 'month')
+SERIES_MAX_POINTS = 200  # Default cap on points returned by /api/series
+SERIES_MAX_POINTS_LIMIT = 2000
+
+@app.route('/api/series')
+@login_required
+def api_series():
+    """Chart data as columnar arrays, aggregated in SQL from daily_summary.
+
+    ``bucket`` is day, week or month; ``from``/``to`` (YYYY-MM-DD) bound the
+    range. ``balance`` is the running balance at the end of each point. When there are more buckets than ``max_points``, neighbouring
+    buckets are merged so the response never exceeds that many points.
+    """
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in SERIES_BUCKETS:
+        return jsonify(error=f"bucket must be one of {', '.join(SERIES_BUCKETS)}"), 400
+    max_points = min(max(request.args.get('max_points', SERIES_MAX_POINTS, type=int), 1), SERIES_MAX_POINTS_LIMIT)
+    date_from = parse_day(request.args.get('from'))
+    date_to = parse_day(request.args.get('to'))
+    rows = storage.series(current_user.id, bucket, date_from, date_to, max_points)
+    earnings = [earning for _, earning, _, _ in rows]
+    expenses = [expense for _, _, expense, _ in rows]
+    return jsonify(
+        bucket=bucket,
+        labels=[label for label, _, _, _ in rows],
+        earnings=earnings,
+        expenses=expenses,
+        net=[e - x for e, x in zip(earnings, expenses)],
+        balance=[balance for _, _, _, balance in rows],
+    )
+
+TOP_CATEGORIES_LIMIT = 10
+TOP_CATEGORIES_MAX_LIMIT = 100
+
+@app.route('/api/top-categories')
+@login_required
+def api_top_categories():
+    """Largest categories by total amount, grouped on category_id.
+
+    Optional ``type`` (earning/expense), ``from``/``to`` (YYYY-MM-DD) and
+    ``limit`` narrow the result.
+    """
+    kind = request.args.get('type')
+    if kind not in (None, 'earning', 'expense'):
+        return jsonify(error="type must be earning or expense"), 400
+    limit = min(max(request.args.get('limit', TOP_CATEGORIES_LIMIT, type=int), 1), TOP_CATEGORIES_MAX_LIMIT)
+    date_from = parse_day(request.args.get('from'))
+    date_to = parse_day(request.args.get('to'))
+    categories = storage.top_categories(current_user.id, kind, date_from, date_to, limit)
+    return jsonify(categories=categories)
+
+SEARCH_PAGE_SIZE = 20  # Matches per /search page
+SEARCH_MAX_PAGE_SIZE = 100
+SEARCH_MAX_TERMS = 8
+
+def search_options(args):
+    """Parse the /search query string; raises ValueError on a bad type."""
+    kind = args.get('type') or None
+    if kind not in (None, 'earning', 'expense'):
+        raise ValueError("type must be earning or expense")
+    return {
+        'q': args.get('q', '').strip(),
+        'type': kind,
+        'from': parse_day(args.get('from')),
+        'to': parse_day(args.get('to')),
+        'page': max(args.get('page', 1, type=int), 1),
+        'limit': min(max(args.get('limit', SEARCH_PAGE_SIZE, type=int), 1), SEARCH_MAX_PAGE_SIZE),
+    }
+
+def run_search(user_id, options):
+    """Search the user's transactions; None if the query has no words.
+
+    Every word of the query must start a word of the description, so
+    "internet data" and "inter dat" both find "Internet Data".
+    """
+    terms = re.findall(r'\w+', options['q'].lower())[:SEARCH_MAX_TERMS]
+    if not terms:
+        return None
+    result = storage.search_transactions(
+        user_id, terms, options['type'], options['from'], options['to'],
+        options['limit'], (options['page'] - 1) * options['limit'])
+    result['net'] = result['total_earning'] - result['total_expenses']
+    result['pages'] = math.ceil(result['matches'] / options['limit'])
+    return result
+
+@app.route('/search')
+@login_required
+def search():
+    """Find transactions by description, with optional type and date filters."""
+    try:
+        options = search_options(request.args)
+    except ValueError as e:
+        return render_template('error.html', error_message=str(e)), 400
+    result = run_search(current_user.id, options)
+    query_args = {
+        'q': options['q'],
+        'type': options['type'],
+        'from': options['from'].isoformat() if options['from'] else None,
+        'to': options['to'].isoformat() if options['to'] else None,
+        'limit': options['limit'],
+    }
+    return render_template('search.html', result=result, page=options['page'], query_args=query_args)
+
+@app.route('/api/search')
+@login_required
+def api_search():
+    """JSON variant of /search: one page of matches plus totals for the query."""
+    try:
+        options = search_options(request.args)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    result = run_search(current_user.id, options)
+    if result is None:
+        return jsonify(error="q must contain at least one word"), 400
+    return jsonify(
+        query=options['q'],
+        page=options['page'],
+        limit=options['limit'],
+        pages=result['pages'],
+        matches=result['matches'],
+        total_earning=result['total_earning'],
+        total_expenses=result['total_expenses'],
+        net=result['net'],
+        transactions=[
+            {'id': txn['id'], 'date': txn['date'].isoformat(), 'day': txn['day'].isoformat(),
+             'type': txn['type'], 'description': txn['description'], 'amount': txn['amount']}
+            for txn in result['transactions']
+        ],
+    )
+
+# Reports are cached per (user, data version, year, month); month None is the
+# year report. Any write bumps the version in the database, so every worker
+# stops serving the old totals, whichever one (or import script) made it.
+report_cache = TTLCache(
+    maxsize=int(os.getenv('REPORT_CACHE_SIZE', '2048')),
+    ttl=float(os.getenv('REPORT_CACHE_TTL', '600')),
+)
+
+def build_report(user_id, year, month=None):
+    """Compute a month (or whole-year) report with SQL aggregates."""
+    start = date(year, month or 1, 1)
+    if month:
+        end = date(year + (month == 12), month % 12 + 1, 1)
+    else:
+        end = date(year + 1, 1, 1)
+    data = storage.report_data(user_id, start, end, 'day' if month else 'month')
+    totals, extremes = data['totals'], data['extremes']
+    breakdown = data['breakdown']
+    total_earning = int(totals['total_earning'])
+    total_expenses = int(totals['total_expenses'])
+    net = total_earning - total_expenses
+    return {
+        'year': year,
+        'month': month,
+        'total_earning': total_earning,
+        'total_expenses': total_expenses,
+        'net': net,
+        'active_days': totals['active_days'],
+        'savings_rate': round(net / total_earning * 100, 1) if total_earning else None,
+        'best_day': extremes[0] if extremes else None,
+        'worst_day': extremes[-1] if extremes else None,
+        'earnings': [row for row in breakdown if row['type'] == 'earning'],
+        'expenses': [row for row in breakdown if row['type'] == 'expense'],
+        'timeline': data['timeline'],
+    }
+
+@app.route('/reports')
+@login_required
+def reports_index():
+    """Jump to the current month's report."""
+    today = datetime.now(APP_TZ).date()
+    return redirect(url_for('reports', year=today.year, month=today.month))
+
+@app.route('/reports/<int:year>')
+@app.route('/reports/<int:year>/<int:month>')
+@login_required
+def reports(year, month=None):
+    """Monthly or yearly totals, breakdowns and best/worst days."""
+    if not 1 <= year < 9999 or (month is not None and not 1 <= month <= 12):
+        return render_template('error.html', error_message="No such report period."), 404
+    user_id = current_user.id
+    with get_db():
+        version = storage.data_version(user_id)
+        report = report_cache.get_or_load((user_id, version, year, month),
+                                          lambda: build_report(user_id, year, month))
+    if month:
+        previous = {'year': year - (month == 1), 'month': (month - 2) % 12 + 1}
+        following = {'year': year + (month == 12), 'month': month % 12 + 1}
+    else:
+        previous, following = {'year': year - 1}, {'year': year + 1}
+    # Trends and the month-end projection belong with the current period
+    today = datetime.now(APP_TZ).date()
+    summary = None
+    if today.year == year and month in (None, today.month):
+        summary = user_analytics(user_id, version)
+    return render_template('reports.html', report=report, previous=previous, following=following,
+                           analytics=summary)
+
+def parse_edit_form(form):
+    """(description, amount) from the edit form; ValueError if either is invalid."""
+    description = (form.get('description') or '').strip()
+    if not description:
+        raise ValueError("Description must not be empty.")
+    if '\x00' in description:
+        raise ValueError("Description must not contain NUL characters.")
+    try:
+        amount = int(form.get('amount', ''))
+    except ValueError:
+        raise ValueError("Amount must be a whole number.") from None
+    if amount < 0:
+        raise ValueError("Amount must not be negative.")
+    if amount > MAX_AMOUNT:
+        raise ValueError(f"Amount must not exceed {MAX_AMOUNT}.")
+    return description, amount
+
 # Edit transaction route
 @app.route('/edit/<int:transaction_id>', methods=['GET', 'POST'])
 @login_required
 def edit_transaction(transaction_id):
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM transactions WHERE id = %s AND user_id = %s', (transaction_id, current_user.id))
-        transaction = cursor.fetchone()
-        if not transaction:
-            flash('Transaction not found.')
-            return redirect(url_for('history'))
-        if request.method == 'POST':
-            description = request.form['description']
-            amount = request.form['amount']
-            cursor.execute('UPDATE transactions SET description = %s, amount = %s WHERE id = %s', (description, amount, transaction_id))
-            flash('Transaction updated.')
-            return redirect(url_for('history'))
+    transaction = storage.get_transaction(current_user.id, transaction_id)
+    if not transaction:
+        flash('Transaction not found.')
+        return redirect(url_for('history'))
+    if request.method != 'POST':
         return render_template('edit_transaction.html', transaction=transaction)
+    try:
+        description, amount = parse_edit_form(request.form)
+    except ValueError as e:
+        flash(f'Invalid input. {e}')
+        entered = dict(transaction, description=request.form.get('description', ''),
+                       amount=request.form.get('amount', ''))
+        return render_template('edit_transaction.html', transaction=entered), 400
+    with get_db(write=True):
+        ensure_categories(current_user.id, [description])
+        storage.update_transaction(current_user.id, transaction_id, description, amount)
+    flash('Transaction updated.')
+    return redirect(url_for('history'))
 
 # Delete transaction route
 @app.route('/delete/<int:transaction_id>', methods=['POST'])
 @login_required
 def delete_transaction(transaction_id):
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM transactions WHERE id = %s AND user_id = %s', (transaction_id, current_user.id))
-        flash('Transaction deleted.')
+    storage.delete_transaction(current_user.id, transaction_id)
+    flash('Transaction deleted.')
     return redirect(url_for('history'))
 
+BULK_MAX_ITEMS = 1000  # Ids per /api/transactions/bulk request
+
+def parse_bulk_request(payload):
+    """Validate a bulk payload into (delete ids, (id, description, amount) updates).
+
+    Raises ValueError with a message for the client on malformed input.
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("expected a JSON object with 'delete' and/or 'update'")
+    delete = payload.get('delete') or []
+    update = payload.get('update') or []
+    if not isinstance(delete, list) or not isinstance(update, list):
+        raise ValueError("'delete' and 'update' must be lists")
+    if len(delete) + len(update) > BULK_MAX_ITEMS:
+        raise ValueError(f"at most {BULK_MAX_ITEMS} ids per request")
+    if any(type(txn_id) is not int for txn_id in delete):
+        raise ValueError("'delete' must list transaction ids")
+    updates = []
+    for item in update:
+        if not isinstance(item, dict) or type(item.get('id')) is not int:
+            raise ValueError("each update needs an integer 'id'")
+        description = item.get('description')
+        amount = item.get('amount')
+        if description is not None and (not isinstance(description, str) or not description.strip()):
+            raise ValueError("'description' must be a non-empty string")
+        if description is not None and '\x00' in description:
+            raise ValueError("'description' must not contain NUL characters")
+        if amount is not None and (type(amount) is not int or not 0 <= amount <= MAX_AMOUNT):
+            raise ValueError(f"'amount' must be an integer from 0 to {MAX_AMOUNT}")
+        if description is None and amount is None:
+            raise ValueError("each update needs a 'description' or an 'amount'")
+        updates.append((item['id'], description.strip() if description else None, amount))
+    ids = delete + [txn_id for txn_id, _, _ in updates]
+    if len(set(ids)) != len(ids):
+        raise ValueError("each id may appear only once per request")
+    return delete, updates
+
+@app.route('/api/transactions/bulk', methods=['POST'])
+@login_required
+def api_bulk_transactions():
+    """Delete and/or update many transactions at once.
+
+    Body: {"delete": [id, ...], "update": [{"id": id, "description": ..., "amount": ...}, ...]}.
+    Ownership of every id is checked in one query and each kind of change is
+    one statement, all in a single transaction: if any id is not the user's,
+    nothing is changed.
+    """
+    try:
+        delete, updates = parse_bulk_request(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    ids = delete + [txn_id for txn_id, _, _ in updates]
+    with get_db(write=True):
+        owned = storage.owned_transactions(current_user.id, ids)
+        missing = [txn_id for txn_id in ids if txn_id not in owned]
+        if missing:
+            return jsonify(error="transactions not found", missing=missing), 404
+        deleted = storage.delete_transactions(current_user.id, delete) if delete else 0
+        updated = 0
+        if updates:
+            ensure_categories(current_user.id, [description for _, description, _ in updates if description])
+            updated = storage.update_transactions(current_user.id, updates)
+    return jsonify(deleted=deleted, updated=updated)
+
 if __name__ == '__main__':
     init_db()  # Initialize database on startup
     app.run(debug=os.getenv('FLASK_DEBUG', '0') == '1', port=5000)
@@ -0,0 +1,48 @@
+"""
+Calendar-month helpers shared by the partitioning and archival code.
+
+Transactions are partitioned (PostgreSQL) and archived (both backends) by
+calendar month in the app's time zone. A closed month's detail rows are
+written to a gzip-compressed CSV file in ARCHIVE_DIR, named after the month
+and the time it was archived, so a month archived twice keeps both files.
+"""
+
+import os
+import time
+from datetime import date, datetime
+
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archive')  # Where archived months are written
+ARCHIVE_KEEP_MONTHS = int(os.getenv('ARCHIVE_KEEP_MONTHS', '24'))  # Months of detail kept online
+# Columns of an archive file, in order; enough to restore the rows as they were
+ARCHIVE_COLUMNS = ('id', 'date', 'description', 'category_id', 'amount', 'type', 'user_id')
+
+
+def month_start(day):
+    """The first day of ``day``'s month."""
+    return day.replace(day=1)
+
+
+def add_months(month, count):
+    """The first day of the month ``count`` months after ``month`` (negative: before)."""
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_bounds(month, tz):
+    """Aware datetimes for midnight on the first of ``month`` and of the next month in ``tz``."""
+    following = add_months(month, 1)
+    return (datetime(month.year, month.month, 1, tzinfo=tz),
+            datetime(following.year, following.month, 1, tzinfo=tz))
+
+
+def archive_cutoff(today, keep_months=ARCHIVE_KEEP_MONTHS):
+    """First month still kept online: months before it are archived.
+
+    The current month is never archived, however small ``keep_months`` is.
+    """
+    return add_months(month_start(today), -max(keep_months, 0))
+
+
+def archive_path(directory, month):
+    """A new file name for ``month``'s rows, e.g. archive/transactions_2023-04_20260101T020000.csv.gz."""
+    return os.path.join(directory, f"transactions_{month:%Y-%m}_{time.strftime('%Y%m%dT%H%M%S')}.csv.gz")
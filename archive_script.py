@@ -0,0 +1,38 @@
+import sys
+from datetime import datetime
+
+from app import APP_TZ, storage
+from archive import ARCHIVE_DIR, ARCHIVE_KEEP_MONTHS, archive_cutoff
+
+USAGE = "Usage: python archive_script.py [--partitions | --restore YYYY-MM | [--detach] [months_to_keep]]"
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if arg != "--detach"]
+    detach = "--detach" in sys.argv[1:]
+    try:
+        created = storage.ensure_partitions()
+        if created:
+            print(f"Created partitions: {', '.join(created)}")
+        if args[:1] == ["--partitions"]:
+            print("Partitions are up to date.")
+        elif args[:1] == ["--restore"]:
+            month = datetime.strptime(args[1], "%Y-%m").date() if len(args) > 1 else None
+            if month is None:
+                print(USAGE)
+                sys.exit(2)
+            rows = storage.restore_month(month)
+            print(f"Restored {rows} transactions for {month:%Y-%m}." if rows else f"{month:%Y-%m} is not archived.")
+        else:
+            keep = int(args[0]) if args else ARCHIVE_KEEP_MONTHS
+            before = archive_cutoff(datetime.now(APP_TZ).date(), keep)
+            print(f"Archiving months before {before:%Y-%m}" + (" (detaching)..." if detach else f" to '{ARCHIVE_DIR}'..."))
+            archived = storage.archive_months(before, ARCHIVE_DIR, detach)
+            for month, rows, location in archived:
+                print(f"  {month:%Y-%m}: {rows} transactions" + (f" -> {location}" if location else ""))
+            print(f"Archived {len(archived)} month(s)." if archived else "Nothing to archive.")
+    except ValueError as e:
+        print(f"Error: {e}\n{USAGE}")
+        sys.exit(2)
+    except Exception as e:
+        print(f"Error archiving transactions: {e}")
+        sys.exit(1)
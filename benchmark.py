@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Load and latency benchmark for the Flask routes.
+
+    python benchmark.py seed --users 20 --transactions 5000
+    python benchmark.py run --iterations 200 --save bench_baseline.json
+    python benchmark.py run --compare bench_baseline.json
+    python benchmark.py run --mode http --url http://127.0.0.1:8000 --concurrency 16 --duration 30
+
+`seed` fills DATABASE_URL (PostgreSQL or a sqlite:/// file) with bench_user_<n> accounts (password "bench"),
+each with the requested number of transactions spread over past days.
+
+`run` logs in as the seeded users and exercises /login, /calculate,
+/history, /edit/<id> and /delete/<id>. In the default `client` mode
+requests go through Flask's test client in-process, which also counts the
+SQL statements each request issues. `http` mode drives a running server
+(e.g. gunicorn) from concurrent threads. Both report throughput and
+p50/p95/p99 latency per route; --save writes the results as a baseline and
+--compare exits non-zero if any route got slower than --threshold.
+"""
+
+import argparse
+import http.cookiejar
+import json
+import math
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from flask import g
+
+import app as tracker
+
+BENCH_USER_PREFIX = "bench_user_"
+BENCH_PASSWORD = "bench"
+DESCRIPTIONS = ["work", "freelance", "food", "rent", "internet data", "travel", "clothes", "fuel"]
+SEED_BATCH = 5000  # Transactions per insert while seeding
+
+# SQL statements issued by the last request on this thread (client mode)
+_query_counts = threading.local()
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def seed(users, transactions, days):
+    tracker.init_db()
+    storage = tracker.storage
+    password_hash = tracker.generate_password_hash(BENCH_PASSWORD)
+    now = datetime.now(tracker.APP_TZ)
+    for n in range(users):
+        username = f"{BENCH_USER_PREFIX}{n}"
+        user = storage.find_user(username)
+        if user:
+            user_id = user['id']
+            storage.set_password_hash(user_id, password_hash)
+        else:
+            user_id = storage.create_user(username, password_hash)
+        for start in range(0, transactions, SEED_BATCH):
+            rows = [
+                (now - timedelta(days=random.random() * days), DESCRIPTIONS[i % len(DESCRIPTIONS)],
+                 random.randint(1, 1000), 'earning' if random.random() < 0.4 else 'expense', user_id)
+                for i in range(start, min(start + SEED_BATCH, transactions))
+            ]
+            tracker.save_transactions(rows)
+        print(f"  {username}: +{transactions} transactions")
+
+
+def seeded_users():
+    return tracker.storage.list_users(BENCH_USER_PREFIX)
+
+
+def latest_transaction_id(user_id):
+    return tracker.storage.latest_transaction_id(user_id)
+
+
+def calculate_form():
+    form = {}
+    for n in range(1, random.randint(2, 6)):
+        form[f"earning_name_{n}"] = random.choice(DESCRIPTIONS)
+        form[f"earning_amount_{n}"] = str(random.randint(1, 1000))
+    for n in range(1, random.randint(2, 10)):
+        form[f"expense_name_{n}"] = random.choice(DESCRIPTIONS)
+        form[f"expense_amount_{n}"] = str(random.randint(1, 500))
+    return form
+
+
+class Results:
+    """Per-route latency samples and query counts, safe to share across threads."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def record(self, route, seconds, queries=None, ok=True):
+        with self.lock:
+            self.latencies[route].append(seconds)
+            if queries is not None:
+                self.queries[route].append(queries)
+            if not ok:
+                self.errors[route] += 1
+
+    def summary(self, wall_seconds):
+        report = {}
+        for route, samples in sorted(self.latencies.items()):
+            ordered = sorted(samples)
+            queries = self.queries.get(route)
+            report[route] = {
+                "requests": len(samples),
+                "errors": self.errors.get(route, 0),
+                "rps": len(samples) / wall_seconds if wall_seconds else 0.0,
+                "p50_ms": percentile(ordered, 50) * 1000,
+                "p95_ms": percentile(ordered, 95) * 1000,
+                "p99_ms": percentile(ordered, 99) * 1000,
+                "queries_per_request": sum(queries) / len(queries) if queries else None,
+            }
+        return report
+
+
+class ClientDriver:
+    """Issues requests through Flask's test client and counts SQL per request."""
+
+    def __init__(self):
+        tracker.app.config.update(TESTING=True)
+        if not tracker.app.secret_key:
+            tracker.app.secret_key = "benchmark"
+
+        @tracker.app.after_request
+        def count_queries(response):
+            # g still holds the request's SQL count until teardown
+            _query_counts.value = g.get('sql_count', 0)
+            return response
+
+        self.client = tracker.app.test_client()
+
+    def request(self, method, path, data=None):
+        _query_counts.value = 0
+        response = self.client.open(path, method=method, data=data)
+        ok = response.status_code < 400 and b'class="error-icon"' not in response.data
+        return ok, _query_counts.value
+
+
+class HttpDriver:
+    """Issues requests against a running server, one cookie jar per driver."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(req) as response:
+                response.read()
+                return response.status < 400, None
+        except urllib.error.URLError:
+            return False, None
+
+
+def timed(results, driver, route, method, path, data=None):
+    started = time.perf_counter()
+    ok, queries = driver.request(method, path, data)
+    results.record(route, time.perf_counter() - started, queries, ok)
+
+
+def scenario(results, driver, user):
+    """One user session: log in, save a day, view history, edit and delete."""
+    timed(results, driver, "POST /login", "POST", "/login",
+          {"username": user['username'], "password": BENCH_PASSWORD})
+    timed(results, driver, "POST /calculate", "POST", "/calculate", calculate_form())
+    timed(results, driver, "GET /history", "GET", "/history")
+    transaction_id = latest_transaction_id(user['id'])
+    if transaction_id:
+        timed(results, driver, "GET /edit/<id>", "GET", f"/edit/{transaction_id}")
+        timed(results, driver, "POST /edit/<id>", "POST", f"/edit/{transaction_id}",
+              {"description": random.choice(DESCRIPTIONS), "amount": str(random.randint(1, 500))})
+        timed(results, driver, "POST /delete/<id>", "POST", f"/delete/{transaction_id}")
+
+
+def run_client(users, iterations):
+    results = Results()
+    driver = ClientDriver()
+    started = time.perf_counter()
+    for i in range(iterations):
+        scenario(results, driver, users[i % len(users)])
+    return results.summary(time.perf_counter() - started)
+
+
+def run_http(users, base_url, concurrency, duration):
+    results = Results()
+    deadline = time.monotonic() + duration
+
+    def worker(n):
+        driver = HttpDriver(base_url)
+        user = users[n % len(users)]
+        while time.monotonic() < deadline:
+            scenario(results, driver, user)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results.summary(time.perf_counter() - started)
+
+
+def print_report(report, baseline=None):
+    header = f"{'route':<20}{'reqs':>7}{'err':>5}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'q/req':>7}"
+    print(header)
+    print("-" * len(header))
+    for route, row in report.items():
+        queries = f"{row['queries_per_request']:.1f}" if row['queries_per_request'] is not None else "-"
+        print(f"{route:<20}{row['requests']:>7}{row['errors']:>5}{row['rps']:>9.1f}"
+              f"{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}{row['p99_ms']:>9.2f}{queries:>7}")
+        if baseline and route in baseline:
+            base = baseline[route]
+            print(f"{'  vs baseline':<41}{delta(row['p50_ms'], base['p50_ms']):>9}"
+                  f"{delta(row['p95_ms'], base['p95_ms']):>9}{delta(row['p99_ms'], base['p99_ms']):>9}")
+
+
+def delta(current, previous):
+    if not previous:
+        return "-"
+    return f"{(current - previous) / previous * 100:+.0f}%"
+
+
+def regressions(report, baseline, threshold):
+    """Routes whose p95 latency or query count grew beyond the threshold."""
+    found = []
+    for route, row in report.items():
+        base = baseline.get(route)
+        if not base:
+            continue
+        if base['p95_ms'] and row['p95_ms'] > base['p95_ms'] * (1 + threshold):
+            found.append(f"{route}: p95 {base['p95_ms']:.2f} -> {row['p95_ms']:.2f} ms")
+        if base.get('queries_per_request') is not None and row['queries_per_request'] is not None \
+                and row['queries_per_request'] > base['queries_per_request']:
+            found.append(f"{route}: queries/request {base['queries_per_request']:.1f} -> "
+                         f"{row['queries_per_request']:.1f}")
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Daily Tracker routes.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = sub.add_parser("seed", help="create benchmark users and transactions")
+    seed_parser.add_argument("--users", type=int, default=10)
+    seed_parser.add_argument("--transactions", type=int, default=1000, help="per user")
+    seed_parser.add_argument("--days", type=int, default=365, help="spread transactions over this many days")
+
+    run_parser = sub.add_parser("run", help="drive the routes and report latency")
+    run_parser.add_argument("--mode", choices=("client", "http"), default="client")
+    run_parser.add_argument("--iterations", type=int, default=100, help="client mode: sessions to run")
+    run_parser.add_argument("--url", default="http://127.0.0.1:8000", help="http mode: server address")
+    run_parser.add_argument("--concurrency", type=int, default=8, help="http mode: parallel sessions")
+    run_parser.add_argument("--duration", type=float, default=30, help="http mode: seconds to run")
+    run_parser.add_argument("--save", metavar="FILE", help="write results as a baseline")
+    run_parser.add_argument("--compare", metavar="FILE", help="compare against a saved baseline")
+    run_parser.add_argument("--threshold", type=float, default=0.2,
+                            help="allowed p95 slowdown vs baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    if args.command == "seed":
+        print(f"Seeding {args.users} users x {args.transactions} transactions...")
+        seed(args.users, args.transactions, args.days)
+        return 0
+
+    users = seeded_users()
+    if not users:
+        print("✗ No benchmark users found. Run `python benchmark.py seed` first.")
+        return 1
+    if args.mode == "client":
+        report = run_client(users, args.iterations)
+    else:
+        report = run_http(users, args.url, args.concurrency, args.duration)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)["routes"]
+    print_report(report, baseline)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({"mode": args.mode, "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+                       "routes": report}, f, indent=4)
+        print(f"\n✓ Baseline saved to '{args.save}'")
+    if baseline:
+        found = regressions(report, baseline, args.threshold)
+        if found:
+            print("\n🚨 Regressions:")
+            for line in found:
+                print(f"  {line}")
+            return 1
+        print("\n✓ No regressions against baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
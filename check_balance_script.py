@@ -0,0 +1,26 @@
+import sys
+
+from app import storage
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if arg != "--repair"]
+    repair = "--repair" in sys.argv[1:]
+    user_id = int(args[0]) if args else None
+    print(("Repairing" if repair else "Checking") + " balances" +
+          (f" for user {user_id}..." if user_id else " for all users..."))
+    try:
+        drifted = storage.check_balances(user_id, repair)
+    except Exception as e:
+        print(f"Error checking balances: {e}")
+        sys.exit(2)
+    for row in drifted:
+        print(f"  user {row['user_id']}: stored balance {row['stored_earning'] - row['stored_expenses']} "
+              f"({row['stored_entries']} entries), actual {row['actual_earning'] - row['actual_expenses']} "
+              f"({row['actual_entries']} entries)")
+    if not drifted:
+        print("Balances are consistent.")
+    elif repair:
+        print(f"Repaired {len(drifted)} balance(s).")
+    else:
+        print(f"{len(drifted)} balance(s) drifted; run with --repair to fix.")
+        sys.exit(1)
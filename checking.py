@@ -1,73 +1,185 @@
 import json
 import os
 import csv
+import itertools
+import shutil
+import sys
+import tempfile
 from datetime import datetime
 
-DATA_FILE = "tracker_data.json"
+DATA_FILE = "tracker_data.jsonl"  # One JSON record per line, only ever appended to
+LEGACY_DATA_FILE = "tracker_data.json"  # Old {"records": [...]} file, converted once
+CSV_FILE = "tracker_data.csv"
+EXPORT_STATE_FILE = "tracker_data.csv.state"  # How far into DATA_FILE the CSV export has got
 
-def load_existing_data():
-    """Load existing data from the file if it exists."""
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, 'r') as f:
-            return json.load(f)
-    return {"records": []}
+# Set TRACKER_FSYNC=1 to flush every saved record to disk before returning
+FSYNC = os.getenv("TRACKER_FSYNC", "0") == "1"
 
-def save_data_to_file(earning_items, total_earning, expense_items, total_expenses):
-    """Save the items and totals to a JSON file."""
-    data = load_existing_data()
-    
-    record = {
-        "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+CSV_HEADER = ["Date", "Earnings", "Total Earning", "Expenses", "Total Expenses", "Net"]
+
+IMPORT_COLUMNS = ["date", "type", "name", "amount"]  # One entry per CSV row / JSONL line
+IMPORT_MAX_ERRORS = 20  # Rejected lines listed before the rest are only counted
+
+def convert_legacy_data():
+    """Convert the old tracker_data.json into the JSONL log, once.
+
+    The old file is renamed to tracker_data.json.migrated afterwards so it is
+    not converted again.
+    """
+    if os.path.exists(DATA_FILE) or not os.path.exists(LEGACY_DATA_FILE):
+        return
+    with open(LEGACY_DATA_FILE, 'r') as f:
+        records = json.load(f).get("records", [])
+    temp_file = DATA_FILE + ".tmp"
+    with open(temp_file, 'w') as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, DATA_FILE)
+    os.replace(LEGACY_DATA_FILE, LEGACY_DATA_FILE + ".migrated")
+    print(f"✓ Converted {len(records)} records from '{LEGACY_DATA_FILE}' to '{DATA_FILE}'")
+
+def iter_records(offset=0):
+    """Yield (record, end offset) for each complete line of the log after `offset`.
+
+    A partly written last line (e.g. after a crash) is left for later.
+    """
+    if not os.path.exists(DATA_FILE):
+        return
+    with open(DATA_FILE, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                print(f"Skipping unreadable line ending at byte {offset} of '{DATA_FILE}'")
+                continue
+            yield record, offset
+
+def ends_with_newline(f):
+    with open(f.name, 'rb') as reader:
+        reader.seek(-1, os.SEEK_END)
+        return reader.read(1) == b"\n"
+
+def open_log():
+    """Open the log for appending binary lines."""
+    f = open(DATA_FILE, 'ab')
+    if f.tell() and not ends_with_newline(f):
+        # Seal off a line left incomplete by an interrupted save
+        f.write(b"\n")
+    return f
+
+def sync(f):
+    if FSYNC:
+        f.flush()
+        os.fsync(f.fileno())
+
+def build_record(date, earning_items, total_earning, expense_items, total_expenses):
+    return {
+        "date": date,
         "earnings": earning_items,
         "total_earning": total_earning,
         "expenses": expense_items,
         "total_expenses": total_expenses,
         "net": total_earning - total_expenses
     }
+
+def make_item(name, amount):
+    """Validate one earning/expense item; raises ValueError with the reason."""
+    try:
+        amount = int(amount)
+    except (TypeError, ValueError):
+        raise ValueError("Please enter a number for the amount.")
+    return {"name": name, "amount": amount}
+
+def load_existing_data():
+    """Load all saved records."""
+    return {"records": [record for record, _ in iter_records()]}
+
+def save_data_to_file(earning_items, total_earning, expense_items, total_expenses):
+    """Append the items and totals to the JSONL log."""
+    record = build_record(datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                          earning_items, total_earning, expense_items, total_expenses)
     
-    data["records"].append(record)
-    
-    with open(DATA_FILE, 'w') as f:
-        json.dump(data, f, indent=4)
+    with open_log() as f:
+        f.write(json.dumps(record).encode() + b"\n")
+        sync(f)
     
     print(f"\n✓ Data saved to '{DATA_FILE}'")
 
+def load_export_state():
+    """Where the last export stopped: offsets into the log and the CSV."""
+    if not os.path.exists(EXPORT_STATE_FILE) or not os.path.exists(CSV_FILE):
+        return {"data_offset": 0, "csv_size": 0}
+    with open(EXPORT_STATE_FILE, 'r') as f:
+        state = json.load(f)
+    data_size = os.path.getsize(DATA_FILE) if os.path.exists(DATA_FILE) else 0
+    if state["data_offset"] > data_size or state["csv_size"] > os.path.getsize(CSV_FILE):
+        # The log or the CSV was replaced; export everything again
+        return {"data_offset": 0, "csv_size": 0}
+    return state
+
+def save_export_state(state):
+    temp_file = EXPORT_STATE_FILE + ".tmp"
+    with open(temp_file, 'w') as f:
+        json.dump(state, f)
+    os.replace(temp_file, EXPORT_STATE_FILE)
+
+def csv_row(record):
+    earnings_str = ", ".join([f"{e['name']}: {e['amount']}" for e in record["earnings"]])
+    expenses_str = ", ".join([f"{e['name']}: {e['amount']}" for e in record["expenses"]])
+    return [
+        record["date"],
+        earnings_str,
+        record["total_earning"],
+        expenses_str,
+        record["total_expenses"],
+        record["net"]
+    ]
+
 def export_to_csv():
-    """Export all saved data from JSON to CSV file."""
-    data = load_existing_data()
-    
-    if not data["records"]:
-        print("No data to export!")
+    """Append the records saved since the last export to the CSV file."""
+    state = load_export_state()
+    new_records = iter_records(state["data_offset"])
+    first = next(new_records, None)
+    if first is None:
+        if state["data_offset"] == 0:
+            print("No data to export!")
+        else:
+            print(f"\n✓ '{CSV_FILE}' is up to date")
         return
     
-    csv_file = "tracker_data.csv"
-    
-    with open(csv_file, 'w', newline='') as f:
+    with open(CSV_FILE, 'a' if state["csv_size"] else 'w', newline='') as f:
+        # Drop anything written after the last recorded export (e.g. an interrupted one)
+        f.truncate(state["csv_size"])
         writer = csv.writer(f)
+        if not state["csv_size"]:
+            writer.writerow(CSV_HEADER)
         
-        # Write header data
-        writer.writerow(["Date", "Earnings", "Total Earning", "Expenses", "Total Expenses", "Net"])
-        
-        # Write each record
-        for record in data["records"]:
-            earnings_str = ", ".join([f"{e['name']}: {e['amount']}" for e in record["earnings"]])
-            expenses_str = ", ".join([f"{e['name']}: {e['amount']}" for e in record["expenses"]])
-            
-            writer.writerow([
-                record["date"],
-                earnings_str,
-                record["total_earning"],
-                expenses_str,
-                record["total_expenses"],
-                record["net"]
-            ])
+        count = 0
+        offset = state["data_offset"]
+        for record, offset in itertools.chain([first], new_records):
+            writer.writerow(csv_row(record))
+            count += 1
+        f.flush()
+        state = {"data_offset": offset, "csv_size": f.tell()}
+    save_export_state(state)
     
-    print(f"\n✓ Data exported to '{csv_file}'")
+    print(f"\n✓ {count} new record(s) exported to '{CSV_FILE}'")
 
 def main():
 
  # --- Main Program ---
 
+ # Move data from the old JSON file to the JSONL log the first time
+ convert_legacy_data()
+
  # Get all earning items and the total earning
  earning_items, total_earning = get_items("Earning")
 
@@ -128,19 +240,140 @@ def get_items(category_name):
 
         # Get the price/amount for that item
         try:
-            item_amount = int(input(f"Enter amount for '{item_name}': "))
+            item = make_item(item_name, input(f"Enter amount for '{item_name}': "))
             
             # Add the amount to the total
-            total_amount += item_amount
+            total_amount += item["amount"]
             
             # Store the item name and amount together in a dictionary
-            items_list.append({"name": item_name, "amount": item_amount})
+            items_list.append(item)
 
-        except ValueError:
-            print("Invalid input. Please enter a number for the amount.")
+        except ValueError as e:
+            print(f"Invalid input. {e}")
     
     return items_list, total_amount
 
+def iter_entries(lines):
+    """Yield (line number, entry) from CSV (with a header) or JSONL lines.
+
+    The format is taken from the first line; unparsable JSONL lines yield None.
+    """
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is None:
+        return
+    lines = itertools.chain([first], lines)
+    if first.lstrip().startswith("{"):
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                yield number, json.loads(line)
+            except ValueError:
+                yield number, None
+    else:
+        reader = csv.DictReader(lines)
+        if reader.fieldnames:
+            # "Date,Type,Name,Amount" works as well as "date,type,name,amount"
+            reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+        for row in reader:
+            yield reader.line_num, row
+
+def parse_entry(entry):
+    """Validate one import entry into (timestamp, type, item); raises ValueError."""
+    if not isinstance(entry, dict):
+        raise ValueError(f"expected {', '.join(IMPORT_COLUMNS)}")
+    try:
+        when = datetime.fromisoformat(str(entry.get("date") or "").strip())
+    except ValueError:
+        raise ValueError(f"bad date {entry.get('date')!r}")
+    kind = str(entry.get("type") or "").strip().lower()
+    if kind not in ("earning", "expense"):
+        raise ValueError(f"type must be earning or expense, got {entry.get('type')!r}")
+    name = str(entry.get("name") or "").strip()
+    if not name:
+        raise ValueError("missing name")
+    item = make_item(name, entry.get("amount"))
+    if item["amount"] < 0:
+        raise ValueError("amount must not be negative")
+    return when, kind, item
+
+def import_entries(source):
+    """Import entries from a CSV/JSONL file (or stdin for "-") as one record per day.
+
+    Entries are streamed and a day is closed when the date changes, so only
+    one day's items are held in memory. Input must be grouped by day: a date
+    that comes back after another day is rejected like an invalid line, as
+    it would otherwise be saved as a second record for that day. Records
+    are staged in a temporary file and appended to the log in one
+    go, and only if every line was valid. Returns the exit status.
+    """
+    convert_legacy_data()
+    stream = sys.stdin if source == "-" else open(source, 'r', newline='', encoding='utf-8')
+    day = current = None
+    seen = set()  # Dates already started, to catch a day that comes back
+    errors = entries = days = 0
+    with stream, tempfile.TemporaryFile() as batch:
+        def reject(number, message):
+            nonlocal errors
+            errors += 1
+            if errors <= IMPORT_MAX_ERRORS:
+                print(f"✗ line {number}: {message}")
+
+        def close_day():
+            nonlocal days
+            if day is None:
+                return
+            record = build_record(day["date"], day["earnings"], day["total_earning"],
+                                  day["expenses"], day["total_expenses"])
+            batch.write(json.dumps(record).encode() + b"\n")
+            days += 1
+            print(f"  {record['date'][:10]}: {len(record['earnings']) + len(record['expenses'])} entries, "
+                  f"earned {record['total_earning']}, spent {record['total_expenses']}, net {record['net']}")
+
+        for number, entry in iter_entries(stream):
+            try:
+                when, kind, item = parse_entry(entry)
+            except ValueError as e:
+                reject(number, e)
+                continue
+            date = when.strftime("%Y-%m-%d")
+            new_day = date != current
+            if new_day and date in seen:
+                reject(number, f"{date} appeared earlier in the file; entries must be grouped by day")
+                continue
+            current = date
+            seen.add(date)
+            entries += 1
+            if errors:
+                continue  # Nothing will be written; keep validating the rest
+            if new_day:
+                close_day()
+                day = build_record(when.strftime("%Y-%m-%d %H:%M:%S"), [], 0, [], 0)
+            # The same totalling as get_items()
+            items_key, total_key = ("earnings", "total_earning") if kind == "earning" else ("expenses", "total_expenses")
+            day[items_key].append(item)
+            day[total_key] += item["amount"]
+
+        if errors:
+            print(f"\n✗ {errors} invalid line(s); nothing was saved")
+            return 1
+        close_day()
+        if not days:
+            print("No entries to import!")
+            return 0
+        batch.seek(0)
+        with open_log() as f:
+            shutil.copyfileobj(batch, f)
+            sync(f)
+    print(f"\n✓ Imported {entries} entries as {days} daily record(s) into '{DATA_FILE}'")
+    export_to_csv()
+    return 0
+
 if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "import":
+        sys.exit(import_entries(sys.argv[2]))
+    if len(sys.argv) > 1:
+        sys.exit("usage: python checking.py [import <file.csv|file.jsonl|->]")
     main()
  
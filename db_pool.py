@@ -0,0 +1,246 @@
+"""
+Connection pools for the PostgreSQL database.
+
+One pool per database lives in each process (gunicorn worker): the primary
+at DATABASE_URL and, if DATABASE_REPLICA_URL is set, a read replica. Pools
+are created lazily on first use and re-created after a fork, so a pool
+built in the gunicorn master is never shared with its workers.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions
+
+from metrics import InstrumentedCursor
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection became free within the wait timeout."""
+
+
+class QueryTimeout(Exception):
+    """Raised when a statement ran past the request's statement timeout."""
+
+
+class TrackedConnection(extensions.connection):
+    """Connection that remembers the statement_timeout (ms) last set on it.
+
+    None means unknown (e.g. the SET was rolled back), so it is set again.
+    """
+
+    statement_timeout = 0
+
+
+class ConnectionPool:
+    """Thread-safe pool of psycopg2 connections with checkout health checks."""
+
+    def __init__(self, dsn, minconn=1, maxconn=5, timeout=10.0, check_after=30.0, **connect_kwargs):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_after = check_after
+        self.connect_kwargs = connect_kwargs
+        self.pid = os.getpid()
+
+        self._lock = threading.Condition()
+        self._idle = deque()  # (conn, returned_at)
+        self._used = set()
+        self._stats = {
+            "connects": 0,
+            "checkouts": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+            "health_check_failures": 0,
+            "timeouts": 0,
+        }
+
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, **self.connect_kwargs)
+        self._stats["connects"] += 1
+        return conn
+
+    def _healthy(self, conn, returned_at):
+        """Return True if an idle connection can be handed out again."""
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < self.check_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        """Check out a connection, waiting up to `timeout` seconds for one."""
+        started = time.monotonic()
+        waited = False
+        with self._lock:
+            while True:
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    break
+                if len(self._used) < self.maxconn:
+                    conn, returned_at = None, None
+                    break
+                waited = True
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0 or not self._lock.wait(remaining):
+                    if not self._idle and len(self._used) >= self.maxconn:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(
+                            f"no database connection available after {self.timeout}s "
+                            f"(pool size {self.maxconn})"
+                        )
+            # Reserve the slot before doing any I/O outside the lock.
+            placeholder = object()
+            self._used.add(placeholder)
+            self._stats["checkouts"] += 1
+            if waited:
+                self._stats["waits"] += 1
+                self._stats["wait_seconds"] += time.monotonic() - started
+
+        try:
+            if conn is not None and not self._healthy(conn, returned_at):
+                self._stats["health_check_failures"] += 1
+                self._discard(conn)
+                conn = None
+            if conn is None:
+                conn = self._connect()
+        except Exception:
+            with self._lock:
+                self._used.discard(placeholder)
+                self._lock.notify()
+            raise
+
+        with self._lock:
+            self._used.discard(placeholder)
+            self._used.add(conn)
+        return conn
+
+    def putconn(self, conn, close=False):
+        """Return a connection to the pool (or close it if it is broken)."""
+        if not conn.closed and conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                close = True
+        with self._lock:
+            self._used.discard(conn)
+            if close or conn.closed or len(self._idle) >= self.maxconn:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._lock.notify()
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def closeall(self):
+        with self._lock:
+            while self._idle:
+                self._discard(self._idle.pop()[0])
+            for conn in list(self._used):
+                self._discard(conn)
+            self._used.clear()
+
+    def stats(self):
+        """Snapshot of pool usage counters."""
+        with self._lock:
+            data = dict(self._stats)
+            data.update({
+                "size": len(self._idle) + len(self._used),
+                "used": len(self._used),
+                "idle": len(self._idle),
+                "max": self.maxconn,
+            })
+        return data
+
+
+_pools = {}  # name -> this process's pool
+_pool_lock = threading.Lock()
+# Pools inherited from a parent process. Their sockets belong to the parent,
+# so they are kept referenced (never closed or garbage-collected) here.
+_inherited = []
+
+POOL_URLS = {'primary': 'DATABASE_URL', 'replica': 'DATABASE_REPLICA_URL'}
+
+
+def build_pool(name='primary', **overrides):
+    """Create a pool configured from the environment; `overrides` win.
+
+    Replica connections are opened read-only.
+    """
+    options = f"-c timezone={os.getenv('APP_TIMEZONE', 'UTC')}"
+    if name == 'replica':
+        options += " -c default_transaction_read_only=on"
+    kwargs = dict(
+        minconn=int(os.getenv('DB_POOL_MIN', '1')),
+        maxconn=int(os.getenv('DB_POOL_MAX', '5')),
+        timeout=float(os.getenv('DB_POOL_TIMEOUT', '10')),
+        check_after=float(os.getenv('DB_POOL_CHECK_AFTER', '30')),
+        cursor_factory=InstrumentedCursor,
+        connection_factory=TrackedConnection,
+        # Render timestamps and cut days in the app's time zone
+        options=options,
+    )
+    kwargs.update(overrides)
+    return ConnectionPool(os.getenv(POOL_URLS[name]), **kwargs)
+
+
+def get_pool(name='primary'):
+    """Return this process's pool, creating it on first use or after a fork."""
+    pool = _pools.get(name)
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+    with _pool_lock:
+        pool = _pools.get(name)
+        if pool is not None and pool.pid != os.getpid():
+            _inherited.append(pool)
+            pool = None
+        if pool is None:
+            pool = _pools[name] = build_pool(name)
+        return pool
+
+
+def get_replica_pool():
+    """This process's replica pool, or None when DATABASE_REPLICA_URL is unset."""
+    if not os.getenv('DATABASE_REPLICA_URL'):
+        return None
+    return get_pool('replica')
+
+
+def reset_pool():
+    """Drop this process's pools; the next get_pool() call builds fresh ones.
+
+    Call this from a post-fork hook when the app was preloaded in a parent.
+    """
+    with _pool_lock:
+        for pool in _pools.values():
+            if pool.pid == os.getpid():
+                pool.closeall()
+            else:
+                _inherited.append(pool)
+        _pools.clear()
+
+
+def pool_stats(name='primary'):
+    """Usage counters for this process's pool, or None if not created yet."""
+    pool = _pools.get(name)
+    if pool is None or pool.pid != os.getpid():
+        return None
+    return pool.stats()
@@ -0,0 +1,54 @@
+"""
+Gunicorn settings for production (used by the Procfile).
+
+The app is preloaded once in the master so workers fork warm. The master
+brings the schema up to date before any worker starts, and each worker
+builds its own connection pool (or SQLite connections) after the fork.
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+# Requests spend most of their time waiting on Postgres, so a few processes
+# with several threads each go further than many single-threaded workers.
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() + 1))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+
+# One pooled connection per thread, plus one for a streaming export
+os.environ.setdefault("DB_POOL_MAX", str(threads + 1))
+
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then so slow leaks can't accumulate
+max_requests = 2000
+max_requests_jitter = 200
+
+accesslog = "-"
+errorlog = "-"
+
+
+def when_ready(server):
+    """Apply pending schema changes and create upcoming partitions, before workers are spawned."""
+    from app import init_db, storage
+
+    if init_db():
+        server.log.info("Database schema updated")
+    else:
+        server.log.info("Database schema is current")
+    created = storage.ensure_partitions()
+    if created:
+        server.log.info("Created partitions: %s", ", ".join(created))
+    # Close the master's connections so none are inherited by workers
+    storage.reset()
+
+
+def post_fork(server, worker):
+    from app import storage
+
+    storage.reset()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Import legacy tracker data into the transactions table.
+
+Reads the old command-line tracker's files for one user:
+  - tracker_data.jsonl (one record per line, as written by checking.py)
+  - tracker_data.json  ({"records": [...]}, written by older checking.py)
+  - tracker_data.csv   (the export produced by checking.py)
+
+Files are streamed record by record and loaded with COPY in batches. Rows
+already present (same date, description, amount and type) are skipped, and
+progress is checkpointed in the import_progress table together with each
+batch, so an interrupted import resumes where it stopped.
+
+Usage:
+    python import_legacy.py USERNAME [FILE ...] [--batch-size N] [--restart]
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+
+from app import APP_TIMEZONE, init_db, storage
+from db_pool import get_pool
+
+DEFAULT_FILES = ["tracker_data.jsonl", "tracker_data.json"]
+BATCH_SIZE = 5000  # Transactions per COPY batch
+READ_CHUNK = 64 * 1024
+
+
+def iter_json_records(path):
+    """Yield each object of the top-level "records" array without loading the file."""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = ''
+        # Skip ahead to the opening bracket of the records array
+        while True:
+            chunk = f.read(READ_CHUNK)
+            if not chunk:
+                return
+            buffer += chunk
+            key = buffer.find('"records"')
+            if key == -1:
+                buffer = buffer[-len('"records"'):]
+                continue
+            bracket = buffer.find('[', key)
+            if bracket != -1:
+                buffer = buffer[bracket + 1:]
+                break
+        eof = False
+        while True:
+            buffer = buffer.lstrip().lstrip(',').lstrip()
+            if buffer.startswith(']'):
+                return
+            try:
+                record, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = f.read(READ_CHUNK)
+                eof = not chunk
+                buffer += chunk
+                continue
+            yield record
+            buffer = buffer[end:]
+
+
+def iter_jsonl_records(path):
+    """Yield the records of a checking.py JSONL log, one per line."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def parse_items(text):
+    """Parse "name: amount, name: amount" as written by checking.export_to_csv()."""
+    items = []
+    for part in text.split(', '):
+        name, sep, amount = part.rpartition(': ')
+        if sep and name:
+            items.append({"name": name, "amount": int(amount)})
+    return items
+
+
+def iter_csv_records(path):
+    """Yield records from a checking.py CSV export in the JSON record shape."""
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            yield {
+                "date": row["Date"],
+                "earnings": parse_items(row["Earnings"]),
+                "expenses": parse_items(row["Expenses"]),
+            }
+
+
+def iter_records(path):
+    if path.lower().endswith('.csv'):
+        return iter_csv_records(path)
+    if path.lower().endswith('.jsonl'):
+        return iter_jsonl_records(path)
+    return iter_json_records(path)
+
+
+def record_rows(record):
+    """Flatten one legacy record into (date, description, amount, type) rows."""
+    for kind, key in (('earning', 'earnings'), ('expense', 'expenses')):
+        for item in record.get(key, []):
+            name = (item.get('name') or '').strip()
+            if name:
+                yield (record['date'], name, int(item.get('amount') or 0), kind)
+
+
+def load_batch(cursor, user_id, rows):
+    """COPY rows into the staging table and insert the ones not yet present.
+
+    New descriptions are added to the user's categories first.
+
+    Legacy dates are naive local times and are read in APP_TIMEZONE.
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(
+        'COPY import_staging (date, description, amount, type) FROM STDIN WITH (FORMAT csv)',
+        buffer,
+    )
+    cursor.execute('''
+        INSERT INTO categories (user_id, name, normalized)
+        SELECT DISTINCT ON (normalize_category(description)) %s, btrim(description), normalize_category(description)
+        FROM import_staging
+        ORDER BY normalize_category(description), description
+        ON CONFLICT (user_id, normalized) DO NOTHING
+    ''', (user_id,))
+    cursor.execute('''
+        INSERT INTO transactions (date, description, amount, type, user_id, category_id)
+        SELECT DISTINCT s.date::timestamp AT TIME ZONE %s, s.description, s.amount, s.type, %s, c.id
+        FROM import_staging s
+        JOIN categories c ON c.user_id = %s AND c.normalized = normalize_category(s.description)
+        WHERE NOT EXISTS (
+            SELECT 1 FROM transactions t
+            WHERE t.user_id = %s AND t.date = s.date::timestamp AT TIME ZONE %s
+              AND t.description = s.description AND t.amount = s.amount AND t.type = s.type
+        )
+    ''', (APP_TIMEZONE, user_id, user_id, user_id, APP_TIMEZONE))
+    return cursor.rowcount
+
+
+def import_file(conn, user_id, path, batch_size=BATCH_SIZE, restart=False):
+    """Import one file for a user, committing and checkpointing every batch."""
+    source = os.path.abspath(path)
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS import_staging (
+            date TEXT NOT NULL,
+            description TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            type TEXT NOT NULL
+        ) ON COMMIT DELETE ROWS
+    ''')
+    if restart:
+        cursor.execute('DELETE FROM import_progress WHERE source = %s AND user_id = %s', (source, user_id))
+    cursor.execute('SELECT position FROM import_progress WHERE source = %s AND user_id = %s', (source, user_id))
+    row = cursor.fetchone()
+    done = row['position'] if row else 0
+    conn.commit()
+    if done:
+        print(f"  Resuming after record {done}")
+
+    started = time.monotonic()
+    position = 0
+    read = inserted = 0
+    rows = []
+
+    def flush():
+        nonlocal inserted
+        if rows:
+            inserted += load_batch(cursor, user_id, rows)
+        cursor.execute('''
+            INSERT INTO import_progress (source, user_id, position, updated_at)
+            VALUES (%s, %s, %s, now())
+            ON CONFLICT (source, user_id) DO UPDATE
+            SET position = EXCLUDED.position, updated_at = EXCLUDED.updated_at
+        ''', (source, user_id, position))
+        conn.commit()
+        rows.clear()
+        elapsed = time.monotonic() - started
+        print(f"  {position} records, {read} rows read, {inserted} inserted "
+              f"({read / elapsed if elapsed else 0:,.0f} rows/s)")
+
+    for record in iter_records(path):
+        position += 1
+        if position <= done:
+            continue
+        for item in record_rows(record):
+            rows.append(item)
+            read += 1
+        if len(rows) >= batch_size:
+            flush()
+    flush()
+    return read, inserted, time.monotonic() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import legacy tracker JSON/CSV files for a user.")
+    parser.add_argument("username")
+    parser.add_argument("files", nargs="*", default=DEFAULT_FILES)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--restart", action="store_true", help="ignore saved progress and start over")
+    args = parser.parse_args(argv)
+
+    if storage.name != 'postgresql':
+        print("✗ import_legacy.py loads data with COPY and needs a PostgreSQL DATABASE_URL.")
+        return 1
+    init_db()
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT id FROM users WHERE username = %s', (args.username,))
+        user = cursor.fetchone()
+        conn.commit()
+        if not user:
+            print(f"✗ No user named '{args.username}'. Register in the web app first.")
+            return 1
+        for path in args.files:
+            if not os.path.exists(path):
+                print(f"✗ {path} not found, skipping.")
+                continue
+            print(f"Importing {path} for {args.username}...")
+            read, inserted, elapsed = import_file(conn, user['id'], path, args.batch_size, args.restart)
+            print(f"✓ {path}: {read} rows read, {inserted} new, {read - inserted} already present "
+                  f"in {elapsed:.1f}s")
+    finally:
+        pool.putconn(conn)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""
+Request and SQL instrumentation exposed in the Prometheus text format.
+
+InstrumentedCursor (psycopg2) and InstrumentedSQLiteCursor count and time
+every statement run during a request;
+init_app() adds hooks that record per-route latency and query histograms and
+optionally log slow requests together with the SQL they ran. Metrics are
+kept per process, so with several gunicorn workers each scrape sees the
+worker that answered it.
+"""
+
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, g, has_request_context, request
+from psycopg2.extras import RealDictCursor
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SLOW_SQL_CHARS = 500  # Statement text kept per query in the slow-request log
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values."""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}  # labels -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted(self._series.items())
+            items = [(labels, list(series)) for labels, series in items]
+        for labels, series in items:
+            base = format_labels(self.label_names, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {series[-2]}')
+            lines.append(f'{self.name}_count{{{base}}} {series[-2]}')
+            lines.append(f'{self.name}_sum{{{base}}} {series[-1]:.6f}')
+        return lines
+
+
+def format_labels(names, values):
+    return ",".join(f'{name}="{escape(str(value))}"' for name, value in zip(names, values))
+
+
+def escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Request latency by route.",
+    ("method", "route", "status"), LATENCY_BUCKETS)
+REQUEST_QUERIES = Histogram(
+    "http_request_sql_queries", "SQL statements issued per request.",
+    ("method", "route"), QUERY_BUCKETS)
+REQUEST_SQL_TIME = Histogram(
+    "http_request_sql_duration_seconds", "Time spent in SQL per request.",
+    ("method", "route"), LATENCY_BUCKETS)
+
+
+def _record_query(query, seconds):
+    if not has_request_context() or 'sql_count' not in g:
+        return
+    g.sql_count += 1
+    g.sql_seconds += seconds
+    if g.sql_log is not None:
+        if isinstance(query, bytes):
+            query = query.decode('utf-8', 'replace')
+        g.sql_log.append((seconds, (query or '')[:SLOW_SQL_CHARS]))
+
+
+class InstrumentedCursor(RealDictCursor):
+    """RealDictCursor that reports each statement to the current request."""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            _record_query(self.query, time.perf_counter() - started)
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            _record_query(self.query, time.perf_counter() - started)
+
+
+class InstrumentedSQLiteCursor(sqlite3.Cursor):
+    """sqlite3 cursor that reports each statement to the current request."""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record_query(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record_query(sql, time.perf_counter() - started)
+
+
+def init_app(app, pool_stats=None, token=None, slow_request_ms=None):
+    """Install the request hooks and the /metrics endpoint on `app`.
+
+    `pool_stats` is a callable returning connection pool counters (or None);
+    `token`, if given, must be sent as a Bearer token to read /metrics;
+    requests slower than `slow_request_ms` are logged with their SQL.
+    """
+
+    @app.before_request
+    def start_request_metrics():
+        g.request_started = time.perf_counter()
+        g.sql_count = 0
+        g.sql_seconds = 0.0
+        g.sql_log = [] if slow_request_ms else None
+
+    @app.after_request
+    def record_request_metrics(response):
+        started = g.get('request_started')
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_LATENCY.observe((request.method, route, response.status_code), elapsed)
+        REQUEST_QUERIES.observe((request.method, route), g.sql_count)
+        REQUEST_SQL_TIME.observe((request.method, route), g.sql_seconds)
+        if slow_request_ms and elapsed * 1000 >= slow_request_ms:
+            statements = "\n".join(f"  {seconds * 1000:8.2f} ms  {sql}" for seconds, sql in g.sql_log)
+            app.logger.warning(
+                "Slow request %s %s: %.1f ms, %d queries (%.1f ms in SQL)\n%s",
+                request.method, request.path, elapsed * 1000, g.sql_count,
+                g.sql_seconds * 1000, statements)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        if token and request.headers.get('Authorization') != f"Bearer {token}":
+            return Response("unauthorized\n", status=401, mimetype='text/plain')
+        lines = []
+        for histogram in (REQUEST_LATENCY, REQUEST_QUERIES, REQUEST_SQL_TIME):
+            lines.extend(histogram.render())
+        stats = pool_stats() if pool_stats else None
+        if stats:
+            for key, value in sorted(stats.items()):
+                lines.append(f"# TYPE db_pool_{key} gauge")
+                lines.append(f"db_pool_{key} {value}")
+        return Response("\n".join(lines) + "\n", mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,1460 @@
+"""
+PostgreSQL storage backend.
+
+Connections come from the per-process pools in db_pool. Read-only blocks go
+to the DATABASE_REPLICA_URL replica when one is configured, healthy and
+caught up; writes, and reads in a request that has already used the
+primary, stay on the primary. Per-day totals are kept in daily_summary by
+statement-level triggers, and calendar days are derived from the
+TIMESTAMPTZ date in the app's time zone by a generated column.
+
+transactions is range-partitioned by calendar month on date. Partitions are
+created ahead of time by ensure_partitions(); rows for a month without one
+land in transactions_default until the next run moves them out. Closed
+months can be archived: their per-category totals are kept in
+archived_categories and the partition is exported and dropped (or detached
+into the archive schema), while daily_summary and balances keep counting it.
+"""
+
+import csv
+import functools
+import gzip
+import io
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import psycopg2
+from flask import g, has_app_context
+from psycopg2.extras import execute_values
+
+from archive import ARCHIVE_COLUMNS, add_months, archive_path, month_bounds, month_start
+from db_pool import PoolTimeout, QueryTimeout, get_pool, get_replica_pool, pool_stats, reset_pool
+
+SCHEMA_VERSION = 6  # Bump whenever create_schema() changes
+SCHEMA_LOCK_KEY = 0x7472616B  # pg_advisory_xact_lock key for schema changes
+EXPORT_FETCH_ROWS = 2000  # Rows per server-side cursor round trip
+REPLICA_MAX_LAG = float(os.getenv('DATABASE_REPLICA_MAX_LAG', '5'))  # Seconds behind before reads skip it
+REPLICA_CHECK_INTERVAL = float(os.getenv('DATABASE_REPLICA_CHECK_INTERVAL', '5'))  # Seconds between lag checks
+REPLICA_RETRY_AFTER = float(os.getenv('DATABASE_REPLICA_RETRY_AFTER', '30'))  # Seconds to avoid a failed replica
+PARTITION_MONTHS_AHEAD = int(os.getenv('TRANSACTION_PARTITIONS_AHEAD', '3'))  # Future months created in advance
+ARCHIVE_SCHEMA = 'archive'  # Where detached partitions are kept by archive_months(detach=True)
+
+# Applies each statement's row changes to daily_summary as one grouped upsert,
+# so multi-row inserts, bulk edits and deletes cost one summary write each.
+# Each trigger event only exposes its own transition tables, hence one branch
+# per event.
+_DAILY_SUMMARY_UPSERT = '''
+            INSERT INTO daily_summary AS s (user_id, day, total_earning, total_expenses, entries)
+            SELECT user_id, day,
+                   SUM(CASE WHEN type = 'earning' THEN sign * amount ELSE 0 END),
+                   SUM(CASE WHEN type = 'expense' THEN sign * amount ELSE 0 END),
+                   SUM(sign)
+            FROM ({delta}) delta
+            GROUP BY 1, 2
+            ON CONFLICT (user_id, day) DO UPDATE SET
+                total_earning = s.total_earning + EXCLUDED.total_earning,
+                total_expenses = s.total_expenses + EXCLUDED.total_expenses,
+                entries = s.entries + EXCLUDED.entries;
+'''
+_NEW_ROWS = 'SELECT user_id, day, amount, type, 1 AS sign FROM new_rows'
+_OLD_ROWS = 'SELECT user_id, day, amount, type, -1 AS sign FROM old_rows'
+
+DAILY_SUMMARY_TRIGGER_SQL = f'''
+    CREATE OR REPLACE FUNCTION daily_summary_sync() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            {_DAILY_SUMMARY_UPSERT.format(delta=_NEW_ROWS)}
+        ELSIF TG_OP = 'UPDATE' THEN
+            {_DAILY_SUMMARY_UPSERT.format(delta=_OLD_ROWS + ' UNION ALL ' + _NEW_ROWS)}
+            DELETE FROM daily_summary WHERE entries <= 0;
+        ELSE
+            {_DAILY_SUMMARY_UPSERT.format(delta=_OLD_ROWS)}
+            DELETE FROM daily_summary WHERE entries <= 0;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+'''
+
+# Keeps each user's all-time totals in balances the same way, so the current
+# balance is a primary-key lookup rather than a scan of transactions.
+_BALANCE_UPSERT = '''
+            INSERT INTO balances AS b (user_id, total_earning, total_expenses, entries)
+            SELECT user_id,
+                   SUM(CASE WHEN type = 'earning' THEN sign * amount ELSE 0 END),
+                   SUM(CASE WHEN type = 'expense' THEN sign * amount ELSE 0 END),
+                   SUM(sign)
+            FROM ({delta}) delta
+            GROUP BY 1
+            ON CONFLICT (user_id) DO UPDATE SET
+                total_earning = b.total_earning + EXCLUDED.total_earning,
+                total_expenses = b.total_expenses + EXCLUDED.total_expenses,
+                entries = b.entries + EXCLUDED.entries;
+'''
+
+BALANCE_TRIGGER_SQL = f'''
+    CREATE OR REPLACE FUNCTION balance_sync() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            {_BALANCE_UPSERT.format(delta=_NEW_ROWS)}
+        ELSIF TG_OP = 'UPDATE' THEN
+            {_BALANCE_UPSERT.format(delta=_OLD_ROWS + ' UNION ALL ' + _NEW_ROWS)}
+        ELSE
+            {_BALANCE_UPSERT.format(delta=_OLD_ROWS)}
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+'''
+
+# Bumps users.data_version once per statement for every user it touched,
+# so pages can tell cheaply whether anything changed since they were built.
+DATA_VERSION_TRIGGER_SQL = '''
+    CREATE OR REPLACE FUNCTION bump_data_version() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            UPDATE users SET data_version = data_version + 1
+            WHERE id IN (SELECT user_id FROM old_rows);
+        ELSE
+            UPDATE users SET data_version = data_version + 1
+            WHERE id IN (SELECT user_id FROM new_rows);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+'''
+
+# Every amount a user ever recorded: live transactions plus the per-category
+# totals of archived months (see archive_months())
+LEDGER_SQL = '''
+    (SELECT user_id, type, amount, 1 AS entries FROM transactions
+     UNION ALL
+     SELECT user_id, type, total, entries FROM archived_categories) ledger
+'''
+
+
+class ReplicaUnavailable(Exception):
+    """The replica connection broke during a read block; it is now marked down."""
+
+
+def reads(method):
+    """Run a read-only method again if the replica failed under it.
+
+    The retry finds the replica marked down, so it runs on the primary.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        except ReplicaUnavailable:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class PostgresStorage:
+    """Storage backed by the PostgreSQL server at DATABASE_URL."""
+
+    name = 'postgresql'
+
+    def __init__(self, timezone):
+        # Validated by ZoneInfo() in the app, so it is safe to embed in DDL
+        self.timezone = timezone
+        # The calendar day of a transaction, in the app's time zone
+        self.day_sql = f"(date AT TIME ZONE '{timezone}')::date"
+        self.tz = ZoneInfo(timezone)
+        self._local = threading.local()  # Outside requests: this thread's connections
+        self._replica_lock = threading.Lock()
+        self._replica = {'usable': False, 'lag': None, 'checked_at': None, 'down_until': 0.0}
+
+    # -- connections --------------------------------------------------------
+
+    @contextmanager
+    def connection(self, write=False):
+        """Context manager for database connections.
+
+        Connections come from the per-process pools. Inside a request the same
+        connection is reused by every block and handed back to the pool when
+        the request ends; outside one it is returned when the outermost block
+        exits. Nested blocks join the outer transaction, which is committed
+        when the outermost block exits.
+
+        Read blocks use the replica when _use_replica() allows it. If the
+        replica connection breaks, it is dropped, the replica is marked down
+        and ReplicaUnavailable is raised, so that methods decorated with
+        @reads run again on the primary. Inside a request, statements are
+        limited to ``g.db_statement_timeout`` ms; a statement that runs past
+        it raises QueryTimeout.
+        """
+        in_request = has_app_context()
+        holder = g if in_request else self._local
+        role = 'replica' if not write and self._use_replica(holder, in_request) else 'primary'
+        conn, depth = self._checkout(holder, role)
+        if conn is None:
+            # The replica could not be reached; it is avoided for a while
+            role = 'primary'
+            conn, depth = self._checkout(holder, role)
+        if write and in_request:
+            g.db_wrote = True
+        try:
+            if depth == 0:
+                self._set_statement_timeout(conn, g.get('db_statement_timeout', 0) if in_request else 0)
+            yield conn
+            # Skipped if a nested block dropped a broken replica connection
+            if depth == 0 and getattr(holder, f'db_{role}_conn', None) is conn:
+                conn.commit()
+        except ReplicaUnavailable:
+            raise  # A nested block already dropped the connection
+        except Exception as e:
+            if role == 'replica' and isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)) \
+                    and not isinstance(e, psycopg2.errors.QueryCanceled):
+                self._drop_replica(holder, conn)
+                raise ReplicaUnavailable(str(e).strip()) from e
+            if depth == 0:
+                conn.rollback()
+                conn.statement_timeout = None  # A SET in the transaction was undone
+            if isinstance(e, psycopg2.errors.QueryCanceled):
+                raise QueryTimeout(str(e).strip()) from e
+            raise
+        finally:
+            if getattr(holder, f'db_{role}_conn', None) is conn:
+                setattr(holder, f'db_{role}_depth', depth)
+                if depth == 0 and not in_request:
+                    setattr(holder, f'db_{role}_conn', None)
+                    get_pool(role).putconn(conn)
+
+    def _checkout(self, holder, role):
+        """This holder's connection for ``role`` (checking one out if needed) and its depth.
+
+        Returns (None, 0) if a replica connection could not be opened.
+        """
+        conn = getattr(holder, f'db_{role}_conn', None)
+        if conn is None:
+            try:
+                conn = get_pool(role).getconn()
+            except (psycopg2.OperationalError, PoolTimeout):
+                if role == 'primary':
+                    raise
+                self._mark_replica_down()
+                return None, 0
+            setattr(holder, f'db_{role}_conn', conn)
+            setattr(holder, f'db_{role}_depth', 0)
+        depth = getattr(holder, f'db_{role}_depth')
+        setattr(holder, f'db_{role}_depth', depth + 1)
+        return conn, depth
+
+    @staticmethod
+    def _set_statement_timeout(conn, milliseconds):
+        """SET statement_timeout on ``conn`` unless it already has that value."""
+        if conn.statement_timeout != milliseconds:
+            conn.cursor().execute('SET statement_timeout = %s', (milliseconds,))
+            conn.statement_timeout = milliseconds
+
+    def _use_replica(self, holder, in_request):
+        """Whether a read block should go to the replica.
+
+        Not if no replica is configured, if the primary is already in use
+        (so reads see this request's writes), if the request asked for
+        primary reads (``g.db_primary_reads``), or if the replica is down,
+        lagging by more than REPLICA_MAX_LAG seconds, or not streaming WAL.
+        """
+        if getattr(holder, 'db_replica_conn', None) is not None:
+            return getattr(holder, 'db_primary_conn', None) is None
+        if getattr(holder, 'db_primary_conn', None) is not None:
+            return False
+        if in_request and g.get('db_primary_reads'):
+            return False
+        return self._replica_usable()
+
+    def _replica_usable(self):
+        """Replica health, re-checked at most every REPLICA_CHECK_INTERVAL seconds."""
+        pool = get_replica_pool()
+        if pool is None:
+            return False
+        state = self._replica
+        now = time.monotonic()
+        if now < state['down_until']:
+            return False
+        if state['checked_at'] is not None and now - state['checked_at'] < REPLICA_CHECK_INTERVAL:
+            return state['usable']
+        if not self._replica_lock.acquire(blocking=False):
+            return state['usable']  # Another thread is checking; use the last answer
+        try:
+            primary_lsn = self._primary_wal_lsn()
+            conn = pool.getconn()
+            try:
+                cursor = conn.cursor()
+                # No lag once the replica has replayed everything the primary had
+                # written when we asked, however long ago the last write was.
+                # Without a WAL receiver (the row is missing) it cannot catch up,
+                # so its lag is unknown; a status hidden from unprivileged roles
+                # (NULL) still counts as a receiver.
+                cursor.execute('''
+                    SELECT CASE
+                        WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver
+                                         WHERE status IS NULL OR status = 'streaming') THEN NULL
+                        WHEN pg_last_wal_replay_lsn() >= %s::pg_lsn THEN 0
+                        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+                    END AS lag
+                ''', (primary_lsn,))
+                lag = cursor.fetchone()['lag']
+                conn.rollback()
+            finally:
+                pool.putconn(conn)
+        except (psycopg2.Error, PoolTimeout):
+            self._mark_replica_down()
+            return False
+        finally:
+            self._replica_lock.release()
+        lag = None if lag is None else float(lag)
+        state.update(usable=lag is not None and lag <= REPLICA_MAX_LAG, lag=lag, checked_at=time.monotonic())
+        return state['usable']
+
+    @staticmethod
+    def _primary_wal_lsn():
+        """The primary's current WAL position, for comparing with the replica's."""
+        pool = get_pool('primary')
+        conn = pool.getconn()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT pg_current_wal_lsn()::text AS lsn')
+            lsn = cursor.fetchone()['lsn']
+            conn.rollback()
+        finally:
+            pool.putconn(conn)
+        return lsn
+
+    def _drop_replica(self, holder, conn):
+        """Close a broken replica connection and avoid the replica for a while."""
+        if getattr(holder, 'db_replica_conn', None) is conn:
+            setattr(holder, 'db_replica_conn', None)
+            setattr(holder, 'db_replica_depth', 0)
+            get_pool('replica').putconn(conn, close=True)
+        self._mark_replica_down()
+
+    def _mark_replica_down(self):
+        self._replica.update(usable=False, lag=None, checked_at=None,
+                             down_until=time.monotonic() + REPLICA_RETRY_AFTER)
+
+    def release(self):
+        """Return the request's pooled connections, if any were checked out."""
+        for role in ('primary', 'replica'):
+            conn = g.pop(f'db_{role}_conn', None)
+            g.pop(f'db_{role}_depth', None)
+            if conn is not None:
+                get_pool(role).putconn(conn)
+
+    def reset(self):
+        """Drop this process's connections (before or after a fork)."""
+        reset_pool()
+
+    def stats(self):
+        """Primary pool counters, plus replica_* ones when a replica is in use."""
+        stats = pool_stats()
+        replica = pool_stats('replica')
+        if replica:
+            stats = dict(stats or {})
+            stats.update({f'replica_{key}': value for key, value in replica.items()})
+            stats['replica_usable'] = int(self._replica['usable'])
+            if self._replica['lag'] is not None:
+                stats['replica_lag_seconds'] = self._replica['lag']
+        return stats
+
+    # -- schema -------------------------------------------------------------
+
+    def init_schema(self, force=False):
+        """Bring the database schema up to SCHEMA_VERSION.
+
+        Cheap when the schema is already current (one version lookup), and
+        safe to run from several processes at once: the first one to take
+        the advisory lock applies create_schema(), the rest find it done.
+        Returns True if the schema was (re)applied.
+        """
+        with self.connection(write=True) as conn:
+            if not force and self.schema_version(conn) >= SCHEMA_VERSION:
+                return False
+            cursor = conn.cursor()
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', (SCHEMA_LOCK_KEY,))
+            if not force and self.schema_version(conn) >= SCHEMA_VERSION:
+                return False
+            self.create_schema(conn)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER NOT NULL,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+            ''')
+            cursor.execute('DELETE FROM schema_version')
+            cursor.execute('INSERT INTO schema_version (version) VALUES (%s)', (SCHEMA_VERSION,))
+        return True
+
+    @staticmethod
+    def schema_version(conn):
+        """The schema version recorded in the database (0 if never bootstrapped)."""
+        cursor = conn.cursor()
+        cursor.execute("SELECT to_regclass('schema_version') IS NOT NULL AS present")
+        if not cursor.fetchone()['present']:
+            return 0
+        cursor.execute('SELECT max(version) AS version FROM schema_version')
+        return cursor.fetchone()['version'] or 0
+
+    def create_schema(self, conn):
+        """Create or upgrade all tables, indexes and triggers (idempotent)."""
+        cursor = conn.cursor()
+        # Create users table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id SERIAL PRIMARY KEY,
+                username TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL
+            )
+        ''')
+        cursor.execute('ALTER TABLE users ADD COLUMN IF NOT EXISTS data_version BIGINT NOT NULL DEFAULT 0')
+        # Per-user category dictionary; descriptions map to it case- and
+        # whitespace-insensitively through normalize_category()
+        cursor.execute(r'''
+            CREATE OR REPLACE FUNCTION normalize_category(name TEXT) RETURNS TEXT AS $$
+                SELECT lower(regexp_replace(btrim(name), '\s+', ' ', 'g'))
+            $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS categories (
+                id SERIAL PRIMARY KEY,
+                user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                name TEXT NOT NULL,
+                normalized TEXT NOT NULL,
+                UNIQUE (user_id, normalized)
+            )
+        ''')
+        # Full-text search over descriptions runs against the (far smaller)
+        # category dictionary through this index
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_categories_search
+            ON categories USING GIN (to_tsvector('simple', normalized))
+        ''')
+        # Create transactions table
+        self._create_transactions_table(cursor)
+        self.migrate_transaction_dates(cursor)
+        self.migrate_transaction_categories(cursor)
+        self.migrate_transaction_partitions(cursor)
+        # Newest-first walks (and ordered exports) use this index
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_transactions_user_date
+            ON transactions (user_id, date DESC, id)
+        ''')
+        # Day-range filters on /history and /export
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_transactions_user_day
+            ON transactions (user_id, day)
+        ''')
+        # Per-category totals group on the integer key
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_transactions_user_category
+            ON transactions (user_id, category_id)
+        ''')
+        # Per-day totals, kept in step with transactions by the triggers below
+        cursor.execute("SELECT to_regclass('daily_summary') IS NULL AS missing")
+        summary_missing = cursor.fetchone()['missing']
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS daily_summary (
+                user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                day DATE NOT NULL,
+                total_earning BIGINT NOT NULL DEFAULT 0,
+                total_expenses BIGINT NOT NULL DEFAULT 0,
+                entries INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, day)
+            )
+        ''')
+        # Emptied days are swept after every write; this keeps that cheap
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_daily_summary_empty
+            ON daily_summary (user_id) WHERE entries <= 0
+        ''')
+        # All-time totals per user, kept in step by the triggers below
+        cursor.execute("SELECT to_regclass('balances') IS NULL AS missing")
+        balances_missing = cursor.fetchone()['missing']
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS balances (
+                user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+                total_earning BIGINT NOT NULL DEFAULT 0,
+                total_expenses BIGINT NOT NULL DEFAULT 0,
+                entries BIGINT NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute(DAILY_SUMMARY_TRIGGER_SQL)
+        cursor.execute(BALANCE_TRIGGER_SQL)
+        cursor.execute(DATA_VERSION_TRIGGER_SQL)
+        for trigger, function in (('daily_summary', 'daily_summary_sync'),
+                                  ('balance', 'balance_sync'),
+                                  ('data_version', 'bump_data_version')):
+            for event, tables in (('INSERT', 'NEW TABLE AS new_rows'),
+                                  ('UPDATE', 'OLD TABLE AS old_rows NEW TABLE AS new_rows'),
+                                  ('DELETE', 'OLD TABLE AS old_rows')):
+                cursor.execute(f'''
+                    DROP TRIGGER IF EXISTS trg_{trigger}_{event.lower()} ON transactions;
+                    CREATE TRIGGER trg_{trigger}_{event.lower()}
+                    AFTER {event} ON transactions
+                    REFERENCING {tables}
+                    FOR EACH STATEMENT EXECUTE FUNCTION {function}()
+                ''')
+        # Closed months whose detail was archived: per-category totals, and
+        # where each batch of rows went (see archive_months())
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS archived_categories (
+                user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                month DATE NOT NULL,
+                category_id INTEGER NOT NULL REFERENCES categories(id),
+                type TEXT NOT NULL,
+                total BIGINT NOT NULL,
+                entries INTEGER NOT NULL,
+                PRIMARY KEY (user_id, month, category_id, type)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS archived_periods (
+                month DATE NOT NULL,
+                location TEXT NOT NULL,
+                rows BIGINT NOT NULL,
+                archived_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                PRIMARY KEY (month, location)
+            )
+        ''')
+        if summary_missing:
+            self._rebuild_daily_summary(cursor)
+        if balances_missing:
+            self._rebuild_balances(cursor)
+        self._ensure_partitions(cursor)
+        # Checkpoints for import_legacy.py so interrupted imports can resume
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS import_progress (
+                source TEXT NOT NULL,
+                user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                position BIGINT NOT NULL DEFAULT 0,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                PRIMARY KEY (source, user_id)
+            )
+        ''')
+
+    def _create_transactions_table(self, cursor):
+        """Create the partitioned transactions table and its default partition.
+
+        The primary key has to include the partition key, hence (id, date);
+        ids still come from one sequence and stay unique.
+        """
+        cursor.execute('CREATE SEQUENCE IF NOT EXISTS transactions_id_seq AS INTEGER')
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS transactions (
+                id INTEGER NOT NULL DEFAULT nextval('transactions_id_seq'),
+                date TIMESTAMPTZ NOT NULL DEFAULT now(),
+                day DATE GENERATED ALWAYS AS ({self.day_sql}) STORED,
+                description TEXT NOT NULL,
+                category_id INTEGER NOT NULL REFERENCES categories(id),
+                amount INTEGER NOT NULL,
+                type TEXT CHECK(type IN ('earning','expense')) NOT NULL,
+                user_id INTEGER NOT NULL,
+                PRIMARY KEY (id, date),
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+            ) PARTITION BY RANGE (date)
+        ''')
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = 'transactions'::regclass")
+        if cursor.fetchone()['relkind'] == 'p':
+            cursor.execute('ALTER SEQUENCE transactions_id_seq OWNED BY transactions.id')
+            cursor.execute('CREATE TABLE IF NOT EXISTS transactions_default PARTITION OF transactions DEFAULT')
+
+    def migrate_transaction_partitions(self, cursor):
+        """Move a plain (pre-partitioning) transactions table into monthly partitions.
+
+        Rows are copied with their ids before the summary triggers exist on
+        the new table, so daily_summary and balances are left as they are.
+        """
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = 'transactions'::regclass")
+        if cursor.fetchone()['relkind'] == 'p':
+            return
+        cursor.execute('LOCK TABLE transactions IN ACCESS EXCLUSIVE MODE')
+        cursor.execute('ALTER TABLE transactions RENAME TO transactions_unpartitioned')
+        # Free the names the partitioned table and its indexes will use
+        cursor.execute('ALTER TABLE transactions_unpartitioned DROP CONSTRAINT transactions_pkey')
+        cursor.execute('''
+            DROP INDEX IF EXISTS idx_transactions_user_date, idx_transactions_user_day,
+                                 idx_transactions_user_category
+        ''')
+        cursor.execute('ALTER TABLE transactions_unpartitioned ALTER COLUMN id DROP DEFAULT')
+        cursor.execute('ALTER SEQUENCE transactions_id_seq OWNED BY NONE')
+        self._create_transactions_table(cursor)
+        cursor.execute('SELECT min(day) AS first FROM transactions_unpartitioned')
+        first = cursor.fetchone()['first']
+        if first is not None:
+            self._ensure_partitions(cursor, first)
+        columns = ', '.join(ARCHIVE_COLUMNS)
+        cursor.execute(f'''
+            INSERT INTO transactions ({columns})
+            SELECT {columns} FROM transactions_unpartitioned
+        ''')
+        cursor.execute('DROP TABLE transactions_unpartitioned')
+
+    def migrate_transaction_dates(self, cursor):
+        """Convert a legacy TEXT date column to TIMESTAMPTZ plus a derived day.
+
+        Old rows hold naive "YYYY-MM-DD HH:MM:SS" strings written in server
+        local time; they are read as wall-clock times in the app's time zone.
+        """
+        cursor.execute('''
+            SELECT data_type FROM information_schema.columns
+            WHERE table_name = 'transactions' AND column_name = 'date'
+        ''')
+        if cursor.fetchone()['data_type'] != 'text':
+            return
+        cursor.execute(f'''
+            ALTER TABLE transactions
+            ALTER COLUMN date TYPE TIMESTAMPTZ USING date::timestamp AT TIME ZONE '{self.timezone}',
+            ALTER COLUMN date SET DEFAULT now()
+        ''')
+        cursor.execute(f'''
+            ALTER TABLE transactions
+            ADD COLUMN day DATE GENERATED ALWAYS AS ({self.day_sql}) STORED
+        ''')
+
+    @staticmethod
+    def migrate_transaction_categories(cursor):
+        """Add category_id to a transactions table created before categories."""
+        cursor.execute('''
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'transactions' AND column_name = 'category_id'
+        ''')
+        if cursor.fetchone():
+            return
+        cursor.execute('ALTER TABLE transactions ADD COLUMN category_id INTEGER REFERENCES categories(id)')
+        # The first spelling seen for each normalized name becomes its display name
+        cursor.execute('''
+            INSERT INTO categories (user_id, name, normalized)
+            SELECT DISTINCT ON (user_id, normalize_category(description))
+                   user_id, btrim(description), normalize_category(description)
+            FROM transactions
+            ORDER BY user_id, normalize_category(description), id
+            ON CONFLICT (user_id, normalized) DO NOTHING
+        ''')
+        cursor.execute('''
+            UPDATE transactions t SET category_id = c.id
+            FROM categories c
+            WHERE c.user_id = t.user_id AND c.normalized = normalize_category(t.description)
+        ''')
+        cursor.execute('ALTER TABLE transactions ALTER COLUMN category_id SET NOT NULL')
+
+    def rebuild_daily_summary(self, user_id=None):
+        """Recompute daily_summary from transactions (all users, or just one).
+
+        Writes to transactions are blocked while this runs so the rebuilt
+        totals cannot miss a concurrent change. Returns the number of days.
+        """
+        with self.connection(write=True) as conn:
+            return self._rebuild_daily_summary(conn.cursor(), user_id)
+
+    @staticmethod
+    def _rebuild_daily_summary(cursor, user_id=None):
+        """Days in archived months are kept as they are: their detail is gone."""
+        cursor.execute('LOCK TABLE transactions IN SHARE MODE')
+        archived = '''
+            EXISTS (SELECT 1 FROM archived_periods a
+                    WHERE day >= a.month AND day < a.month + interval '1 month')
+        '''
+        cursor.execute(f'''
+            DELETE FROM daily_summary
+            WHERE (%s::int IS NULL OR user_id = %s) AND NOT {archived}
+        ''', (user_id, user_id))
+        cursor.execute(f'''
+            INSERT INTO daily_summary (user_id, day, total_earning, total_expenses, entries)
+            SELECT user_id, day,
+                   SUM(CASE WHEN type = 'earning' THEN amount ELSE 0 END),
+                   SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END),
+                   COUNT(*)
+            FROM transactions
+            WHERE (%s::int IS NULL OR user_id = %s) AND NOT {archived}
+            GROUP BY 1, 2
+        ''', (user_id, user_id))
+        return cursor.rowcount
+
+    @staticmethod
+    def _rebuild_balances(cursor, user_ids=None):
+        """Recompute balances from transactions and archived months for ``user_ids`` (None: everyone)."""
+        cursor.execute('DELETE FROM balances WHERE %s::int[] IS NULL OR user_id = ANY(%s)', (user_ids, user_ids))
+        cursor.execute(f'''
+            INSERT INTO balances (user_id, total_earning, total_expenses, entries)
+            SELECT user_id,
+                   SUM(CASE WHEN type = 'earning' THEN amount ELSE 0 END),
+                   SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END),
+                   SUM(entries)
+            FROM {LEDGER_SQL}
+            WHERE %s::int[] IS NULL OR user_id = ANY(%s)
+            GROUP BY 1
+        ''', (user_ids, user_ids))
+
+    @reads
+    def check_balances(self, user_id=None, repair=False):
+        """Compare balances with totals recomputed from transactions and archived months.
+
+        Returns one dict per user whose stored (earning, expenses, entries)
+        differ from the actual ones. With ``repair`` writes to transactions
+        are blocked meanwhile and the drifted rows are rebuilt.
+        """
+        with self.connection(write=repair) as conn:
+            cursor = conn.cursor()
+            if repair:
+                cursor.execute('LOCK TABLE transactions IN SHARE MODE')
+            cursor.execute(f'''
+                WITH actual AS (
+                    SELECT user_id,
+                           SUM(CASE WHEN type = 'earning' THEN amount ELSE 0 END) AS total_earning,
+                           SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END) AS total_expenses,
+                           SUM(entries) AS entries
+                    FROM {LEDGER_SQL}
+                    WHERE %(user_id)s::int IS NULL OR user_id = %(user_id)s
+                    GROUP BY user_id
+                ), compared AS (
+                    SELECT u.id AS user_id,
+                           COALESCE(b.total_earning, 0) AS stored_earning,
+                           COALESCE(b.total_expenses, 0) AS stored_expenses,
+                           COALESCE(b.entries, 0) AS stored_entries,
+                           COALESCE(a.total_earning, 0) AS actual_earning,
+                           COALESCE(a.total_expenses, 0) AS actual_expenses,
+                           COALESCE(a.entries, 0) AS actual_entries
+                    FROM users u
+                    LEFT JOIN balances b ON b.user_id = u.id
+                    LEFT JOIN actual a ON a.user_id = u.id
+                    WHERE %(user_id)s::int IS NULL OR u.id = %(user_id)s
+                )
+                SELECT * FROM compared
+                WHERE (stored_earning, stored_expenses, stored_entries)
+                   <> (actual_earning, actual_expenses, actual_entries)
+                ORDER BY user_id
+            ''', {'user_id': user_id})
+            drifted = [{key: int(value) for key, value in row.items()} for row in cursor.fetchall()]
+            if repair and drifted:
+                self._rebuild_balances(cursor, [row['user_id'] for row in drifted])
+        return drifted
+
+    # -- partitions and archive ----------------------------------------------
+
+    @staticmethod
+    def _partition_name(month):
+        return f'transactions_p{month:%Y%m}'
+
+    def ensure_partitions(self):
+        """Create the monthly partitions due by now (see _ensure_partitions()).
+
+        Run at startup and by archive_script.py; returns the names created.
+        """
+        with self.connection(write=True) as conn:
+            return self._ensure_partitions(conn.cursor())
+
+    def _ensure_partitions(self, cursor, first=None):
+        """Create partitions from ``first``'s month through PARTITION_MONTHS_AHEAD months ahead.
+
+        Months with rows waiting in transactions_default get a partition
+        too, and their rows are moved into it. Each partition is built as a
+        plain table and then attached, so writes to the other months are
+        not blocked and the parent's triggers never see the moved rows.
+        """
+        current = month_start(datetime.now(self.tz).date())
+        month = month_start(first) if first else current
+        wanted = set()
+        while month <= add_months(current, PARTITION_MONTHS_AHEAD):
+            wanted.add(month)
+            month = add_months(month, 1)
+        cursor.execute("SELECT DISTINCT date_trunc('month', day)::date AS month FROM transactions_default")
+        waiting = {row['month'] for row in cursor.fetchall()}
+        columns = ', '.join(ARCHIVE_COLUMNS)
+        created = []
+        for month in sorted(wanted | waiting):
+            name = self._partition_name(month)
+            cursor.execute('SELECT to_regclass(%s) IS NOT NULL AS present', (name,))
+            if cursor.fetchone()['present']:
+                continue
+            start, end = month_bounds(month, self.tz)
+            cursor.execute(f'''
+                CREATE TABLE {name}
+                (LIKE transactions INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED)
+            ''')
+            if month in waiting:
+                cursor.execute(f'''
+                    INSERT INTO {name} ({columns})
+                    SELECT {columns} FROM transactions_default WHERE date >= %s AND date < %s
+                ''', (start, end))
+                cursor.execute('DELETE FROM transactions_default WHERE date >= %s AND date < %s', (start, end))
+            cursor.execute(f'ALTER TABLE transactions ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)',
+                           (start, end))
+            created.append(name)
+        return created
+
+    def _partition_months(self, cursor):
+        """Months that currently have their own partition, oldest first."""
+        cursor.execute('''
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'transactions'::regclass AND c.relname ~ '^transactions_p[0-9]{6}$'
+        ''')
+        return sorted(datetime.strptime(row['relname'][len('transactions_p'):], '%Y%m').date()
+                      for row in cursor.fetchall())
+
+    def archive_months(self, before, directory, detach=False):
+        """Archive every month before ``before`` (a month's first day).
+
+        Each month is handled in its own transaction: its per-category
+        totals are added to archived_categories, then its partition is
+        written to a gzip CSV file in ``directory`` and dropped, or with
+        ``detach`` moved into the archive schema instead. daily_summary and
+        balances are not touched, so history totals, charts and balances
+        still include the month. Returns (month, rows, location) per month.
+
+        The transaction takes the ACCESS EXCLUSIVE lock DETACH needs on
+        transactions before touching the partition, so it never upgrades a
+        lock while holding another one (which could deadlock with a
+        writer); queries on transactions wait until the month is done.
+        """
+        with self.connection(write=True) as conn:
+            self._ensure_partitions(conn.cursor())
+            months = [month for month in self._partition_months(conn.cursor()) if month < before]
+        archived = []
+        for month in months:
+            name = self._partition_name(month)
+            path = None
+            try:
+                with self.connection(write=True) as conn:
+                    cursor = conn.cursor()
+                    # Parent first (this also locks every partition), as DETACH would
+                    cursor.execute('LOCK TABLE transactions IN ACCESS EXCLUSIVE MODE')
+                    cursor.execute(f'SELECT count(*) AS rows, array_agg(DISTINCT user_id) AS users FROM {name}')
+                    row = cursor.fetchone()
+                    rows, users = row['rows'], row['users'] or []
+                    cursor.execute(f'''
+                        INSERT INTO archived_categories AS a (user_id, month, category_id, type, total, entries)
+                        SELECT user_id, %s, category_id, type, SUM(amount), COUNT(*)
+                        FROM {name}
+                        GROUP BY user_id, category_id, type
+                        ON CONFLICT (user_id, month, category_id, type) DO UPDATE SET
+                            total = a.total + EXCLUDED.total,
+                            entries = a.entries + EXCLUDED.entries
+                    ''', (month,))
+                    if rows and not detach:
+                        os.makedirs(directory, exist_ok=True)
+                        path = archive_path(directory, month)
+                        with gzip.open(path, 'wt', encoding='utf-8', newline='') as f:
+                            cursor.copy_expert(f'''
+                                COPY (SELECT {', '.join(ARCHIVE_COLUMNS)} FROM {name} ORDER BY id)
+                                TO STDOUT WITH (FORMAT csv, HEADER)
+                            ''', f)
+                    cursor.execute(f'ALTER TABLE transactions DETACH PARTITION {name}')
+                    if rows and detach:
+                        table = f'{name}_{datetime.now():%Y%m%d%H%M%S}'
+                        location = f'{ARCHIVE_SCHEMA}.{table}'
+                        cursor.execute(f'CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}')
+                        cursor.execute(f'ALTER TABLE {name} RENAME TO {table}')
+                        cursor.execute(f'ALTER TABLE {table} SET SCHEMA {ARCHIVE_SCHEMA}')
+                    else:
+                        location = path
+                        cursor.execute(f'DROP TABLE {name}')
+                    if rows:
+                        cursor.execute('''
+                            INSERT INTO archived_periods (month, location, rows) VALUES (%s, %s, %s)
+                        ''', (month, location, rows))
+                    # Cached pages of these users still list the month's rows
+                    cursor.execute('UPDATE users SET data_version = data_version + 1 WHERE id = ANY(%s)', (users,))
+            except Exception:
+                if path and os.path.exists(path):
+                    os.remove(path)
+                raise
+            archived.append((month, rows, location))
+        return archived
+
+    def restore_month(self, month):
+        """Bring an archived month's rows back into transactions; returns the row count.
+
+        Rows are loaded straight into the month's partition, bypassing the
+        parent's triggers: daily_summary and balances never stopped
+        counting them. Archive files are left in place.
+        """
+        month = month_start(month)
+        name = self._partition_name(month)
+        columns = ', '.join(ARCHIVE_COLUMNS)
+        with self.connection(write=True) as conn:
+            cursor = conn.cursor()
+            self._ensure_partitions(cursor)
+            cursor.execute('SELECT location FROM archived_periods WHERE month = %s ORDER BY archived_at', (month,))
+            locations = [row['location'] for row in cursor.fetchall()]
+            if not locations:
+                return 0
+            cursor.execute('SELECT to_regclass(%s) IS NOT NULL AS present', (name,))
+            attached = cursor.fetchone()['present']
+            if not attached:
+                cursor.execute(f'''
+                    CREATE TABLE {name}
+                    (LIKE transactions INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED)
+                ''')
+            for location in locations:
+                if location.startswith(f'{ARCHIVE_SCHEMA}.'):
+                    cursor.execute(f'INSERT INTO {name} ({columns}) SELECT {columns} FROM {location}')
+                    cursor.execute(f'DROP TABLE {location}')
+                else:
+                    with gzip.open(location, 'rt', encoding='utf-8', newline='') as f:
+                        cursor.copy_expert(f'COPY {name} ({columns}) FROM STDIN WITH (FORMAT csv, HEADER)', f)
+            if not attached:
+                start, end = month_bounds(month, self.tz)
+                cursor.execute(f'ALTER TABLE transactions ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)',
+                               (start, end))
+            cursor.execute('DELETE FROM archived_categories WHERE month = %s RETURNING user_id', (month,))
+            users = list({row['user_id'] for row in cursor.fetchall()})
+            cursor.execute('DELETE FROM archived_periods WHERE month = %s RETURNING rows', (month,))
+            restored = sum(row['rows'] for row in cursor.fetchall())
+            cursor.execute('UPDATE users SET data_version = data_version + 1 WHERE id = ANY(%s)', (users,))
+        return restored
+
+    # -- users --------------------------------------------------------------
+
+    @reads
+    def get_user(self, user_id):
+        """(id, username) for a user id, or None."""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id, username FROM users WHERE id = %s', (user_id,))
+            user = cursor.fetchone()
+        return (user['id'], user['username']) if user else None
+
+    @reads
+    def find_user(self, username):
+        """The user's id, username and password_hash, or None."""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id, username, password_hash FROM users WHERE username = %s', (username,))
+            user = cursor.fetchone()
+        return dict(user) if user else None
+
+    @reads
+    def list_users(self, prefix=''):
+        """Users whose name starts with ``prefix``, oldest first."""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id, username FROM users WHERE username LIKE %s ORDER BY id',
+                           (prefix.replace('%', r'\%').replace('_', r'\_') + '%',))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def create_user(self, username, password_hash):
+        """Insert a user and return the new id."""
+        with self.connection(write=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute('INSERT INTO users (username, password_hash) VALUES (%s, %s) RETURNING id',
+                           (username, password_hash))
+            return cursor.fetchone()['id']
+
+    def set_password_hash(self, user_id, password_hash):
+        with self.connection(write=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute('UPDATE users SET password_hash = %s WHERE id = %s', (password_hash, user_id))
+
+    @reads
+    def data_version(self, user_id):
+        """Counter bumped by every write to the user's transactions."""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT data_version FROM users WHERE id = %s', (user_id,))
+            row = cursor.fetchone()
+        return row['data_version'] if row else 0
+
+    @reads
+    def balance(self, user_id):
+        """All-time earning, expenses, entries and running balance from balances."""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT total_earning, total_expenses, entries FROM balances WHERE user_id = %s',
+                           (user_id,))
+            row = cursor.fetchone()
+        totals = {key: int(value) for key, value in row.items()} if row else \
+            {'total_earning': 0, 'total_expenses': 0, 'entries': 0}
+        totals['balance'] = totals['total_earning'] - totals['total_expenses']
+        return totals
+
+    # -- categories ---------------------------------------------------------
+
+    def ensure_categories(self, user_id, names):
+        """Create any missing categories for ``names`` in one batched upsert.
+
+        Returns the number of categories created.
+        """
+        with self.connection(write=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO categories (user_id, name, normalized)
+                SELECT DISTINCT ON (normalize_category(name)) %s, btrim(name), normalize_category(name)
+                FROM unnest(%s::text[]) AS name
+                ORDER BY normalize_category(name), name
+                ON CONFLICT (user_id, normalized) DO NOTHING
+            ''', (user_id, list(names)))
+            return cursor.rowcount
+
+    @reads
+    def category_names(self, user_id, limit):
+        """The user's category names, most-used first."""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT c.name
+                FROM categories c
+                LEFT JOIN (
+                    SELECT category_id, COUNT(*) AS uses
+                    FROM transactions WHERE user_id = %s
+                    GROUP BY category_id
+                ) u ON u.category_id = c.id
+                WHERE c.user_id = %s
+                ORDER BY u.uses DESC NULLS LAST, c.name
+                LIMIT %s
+            ''', (user_id, user_id, limit))
+            return [row['name'] for row in cursor.fetchall()]
+
+    # -- transactions -------------------------------------------------------
+
+    def insert_transactions(self, rows):
+        """Insert (date, description, amount, type, user_id) rows.
+
+        Every row is written in a single INSERT that looks its category_id
+        up by name, so the categories must already exist. Returns the new ids.
+        """
+        if not rows:
+            return []
+        with self.connection(write=True) as conn:
+            ids = execute_values(conn.cursor(), '''
+                INSERT INTO transactions (date, description, amount, type, user_id, category_id)
+                SELECT v.date, v.description, v.amount, v.type, v.user_id, c.id
+                FROM (VALUES %s) AS v (date, description, amount, type, user_id)
+                JOIN categories c
+                  ON c.user_id = v.user_id AND c.normalized = normalize_category(v.description)
+                RETURNING id
+            ''', rows, page_size=len(rows), fetch=True)
+        return [row['id'] for row in ids]
+
+    def load_transactions(self, user_id, batches):
+        """Bulk-load one user's (date, description, amount, type) rows.
+
+        Each batch from the ``batches`` iterable is streamed into a temp table
+        with COPY; missing categories and then the transactions are inserted
+        from it with one statement each. Returns the number of rows loaded.
+        """
+        with self.connection(write=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                CREATE TEMP TABLE IF NOT EXISTS upload_staging (
+                    date TIMESTAMPTZ NOT NULL,
+                    description TEXT NOT NULL,
+                    amount INTEGER NOT NULL,
+                    type TEXT NOT NULL
+                ) ON COMMIT DELETE ROWS
+            ''')
+            for batch in batches:
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(
+                    (when.isoformat(), description, amount, kind) for when, description, amount, kind in batch)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    'COPY upload_staging (date, description, amount, type) FROM STDIN WITH (FORMAT csv)', buffer)
+            cursor.execute('''
+                INSERT INTO categories (user_id, name, normalized)
+                SELECT DISTINCT ON (normalize_category(description)) %s, btrim(description), normalize_category(description)
+                FROM upload_staging
+                ORDER BY normalize_category(description), description
+                ON CONFLICT (user_id, normalized) DO NOTHING
+            ''', (user_id,))
+            cursor.execute('''
+                INSERT INTO transactions (date, description, amount, type, user_id, category_id)
+                SELECT s.date, s.description, s.amount, s.type, %s, c.id
+                FROM upload_staging s
+                JOIN categories c ON c.user_id = %s AND c.normalized = normalize_category(s.description)
+            ''', (user_id, user_id))
+            loaded = cursor.rowcount
+            cursor.execute('TRUNCATE upload_staging')
+            return loaded
+
+    @reads
+    def get_transaction(self, user_id, transaction_id):
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM transactions WHERE id = %s AND user_id = %s', (transaction_id, user_id))
+            transaction = cursor.fetchone()
+        return dict(transaction) if transaction else None
+
+    def update_transaction(self, user_id, transaction_id, description, amount):
+        """Change a transaction's description and amount; returns its day or None."""
+        with self.connection(write=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE transactions
+                SET description = %s, amount = %s,
+                    category_id = (SELECT id FROM categories WHERE user_id = %s AND normalized = normalize_category(%s))
+                WHERE id = %s AND user_id = %s
+                RETURNING day
+            ''', (description, amount, user_id, description, transaction_id, user_id))
+            updated = cursor.fetchone()
+        return updated['day'] if updated else None
+
+    def delete_transaction(self, user_id, transaction_id):
+        """Delete a transaction; returns its day, or None if there was none."""
+        with self.connection(write=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM transactions WHERE id = %s AND user_id = %s RETURNING day',
+                           (transaction_id, user_id))
+            deleted = cursor.fetchone()
+        return deleted['day'] if deleted else None
+
+    @reads
+    def owned_transactions(self, user_id, ids):
+        """{id: day} for those of ``ids`` that belong to the user, in one query."""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id, day FROM transactions WHERE user_id = %s AND id = ANY(%s)',
+                           (user_id, list(ids)))
+            return {row['id']: row['day'] for row in cursor.fetchall()}
+
+    def delete_transactions(self, user_id, ids):
+        """Delete many of the user's transactions in one statement; returns the count."""
+        with self.connection(write=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM transactions WHERE user_id = %s AND id = ANY(%s)', (user_id, list(ids)))
+            return cursor.rowcount
+
+    def update_transactions(self, user_id, updates):
+        """Apply (id, description, amount) updates in one statement.
+
+        A None description or amount leaves that field unchanged. Categories
+        for new descriptions must already exist. Returns the count.
+        """
+        ids, descriptions, amounts = zip(*updates) if updates else ((), (), ())
+        with self.connection(write=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE transactions t
+                SET description = COALESCE(v.description, t.description),
+                    amount = COALESCE(v.amount, t.amount),
+                    category_id = CASE WHEN v.description IS NULL THEN t.category_id ELSE (
+                        SELECT id FROM categories
+                        WHERE user_id = t.user_id AND normalized = normalize_category(v.description)
+                    ) END
+                FROM unnest(%s::int[], %s::text[], %s::int[]) AS v (id, description, amount)
+                WHERE t.id = v.id AND t.user_id = %s
+            ''', (list(ids), list(descriptions), list(amounts), user_id))
+            return cursor.rowcount
+
+    @reads
+    def latest_transaction_id(self, user_id):
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT max(id) AS id FROM transactions WHERE user_id = %s', (user_id,))
+            return cursor.fetchone()['id']
+
+    @reads
+    def search_transactions(self, user_id, terms, kind=None, date_from=None, date_to=None, limit=20, offset=0):
+        """Transactions whose description has a word starting with each term.
+
+        Terms are matched against the user's categories through the GIN
+        full-text index, and the hits read through the (user_id,
+        category_id) index. Returns one page of matches, newest first, with
+        the count and totals of the whole result.
+        """
+        params = {
+            'user_id': user_id,
+            'query': ' & '.join(f'{term}:*' for term in terms),
+            'kind': kind,
+            'date_from': date_from,
+            'date_to': date_to,
+            'start': self._midnight(date_from),
+            'end': self._after(date_to),
+            'limit': limit,
+            'offset': offset,
+        }
+        matches = '''
+            FROM transactions
+            WHERE user_id = %(user_id)s
+              AND category_id IN (
+                  SELECT id FROM categories
+                  WHERE user_id = %(user_id)s
+                    AND to_tsvector('simple', normalized) @@ to_tsquery('simple', %(query)s)
+              )
+              AND (%(kind)s::text IS NULL OR type = %(kind)s)
+              AND (%(date_from)s::date IS NULL OR day >= %(date_from)s)
+              AND (%(date_to)s::date IS NULL OR day <= %(date_to)s)
+              AND (%(start)s::timestamptz IS NULL OR date >= %(start)s)
+              AND (%(end)s::timestamptz IS NULL OR date < %(end)s)
+        '''
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT COUNT(*) AS matches,
+                       COALESCE(SUM(amount) FILTER (WHERE type = 'earning'), 0) AS total_earning,
+                       COALESCE(SUM(amount) FILTER (WHERE type = 'expense'), 0) AS total_expenses
+                {matches}
+            ''', params)
+            totals = cursor.fetchone()
+            cursor.execute(f'''
+                SELECT id, date, day, description, amount, type
+                {matches}
+                ORDER BY date DESC, id DESC
+                LIMIT %(limit)s OFFSET %(offset)s
+            ''', params)
+            transactions = [dict(row) for row in cursor.fetchall()]
+        return {
+            'matches': totals['matches'],
+            'total_earning': int(totals['total_earning']),
+            'total_expenses': int(totals['total_expenses']),
+            'transactions': transactions,
+        }
+
+    # -- history and aggregates ---------------------------------------------
+
+    def _midnight(self, day):
+        """Start of calendar ``day`` in the app's time zone (None stays None).
+
+        Filtering on date as well as day lets the planner skip the
+        partitions of other months, which it cannot do from day alone.
+        """
+        if day is None:
+            return None
+        return datetime(day.year, day.month, day.day, tzinfo=self.tz)
+
+    def _after(self, day):
+        """Start of the calendar day after ``day`` (None stays None)."""
+        return None if day is None else self._midnight(day + timedelta(days=1))
+
+    @reads
+    def history_days(self, user_id, before=None, date_from=None, date_to=None, limit=20):
+        """Daily totals newest first, for days older than ``before`` within the range."""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT day, total_earning, total_expenses
+                FROM daily_summary
+                WHERE user_id = %s
+                  AND (%s::date IS NULL OR day < %s)
+                  AND (%s::date IS NULL OR day >= %s)
+                  AND (%s::date IS NULL OR day <= %s)
+                ORDER BY day DESC
+                LIMIT %s
+            ''', (user_id, before, before, date_from, date_from, date_to, date_to, limit))
+            return [dict(row) for row in cursor.fetchall()]
+
+    @reads
+    def day_transactions(self, user_id, first_day, last_day):
+        """Transactions on days ``first_day``..``last_day``, newest first."""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, date, day, description, amount, type
+                FROM transactions
+                WHERE user_id = %s AND day BETWEEN %s AND %s
+                  AND date >= %s AND date < %s
+                ORDER BY date DESC, id
+            ''', (user_id, first_day, last_day, self._midnight(first_day), self._after(last_day)))
+            return [dict(row) for row in cursor.fetchall()]
+
+    @reads
+    def series(self, user_id, bucket, date_from, date_to, max_points):
+        """(label, earning, expense, balance) per bucket, merged down to ``max_points``.
+
+        ``balance`` is the running balance at the end of each point: the
+        cumulative net so far plus everything before ``date_from``, all
+        summed from daily_summary.
+        """
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                WITH buckets AS (
+                    SELECT date_trunc(%(bucket)s, day) AS bucket,
+                           SUM(total_earning) AS earning,
+                           SUM(total_expenses) AS expense
+                    FROM daily_summary
+                    WHERE user_id = %(user_id)s
+                      AND (%(date_from)s::date IS NULL OR day >= %(date_from)s)
+                      AND (%(date_to)s::date IS NULL OR day <= %(date_to)s)
+                    GROUP BY 1
+                ), grouped AS (
+                    SELECT *, ntile(%(max_points)s) OVER (ORDER BY bucket) AS grp FROM buckets
+                ), opening AS (
+                    SELECT COALESCE(SUM(total_earning - total_expenses), 0) AS balance
+                    FROM daily_summary
+                    WHERE user_id = %(user_id)s AND day < %(date_from)s
+                )
+                SELECT to_char(MIN(bucket), 'YYYY-MM-DD') AS label,
+                       SUM(earning) AS earning,
+                       SUM(expense) AS expense,
+                       (SELECT balance FROM opening) + SUM(SUM(earning - expense)) OVER (ORDER BY grp) AS balance
+                FROM grouped
+                GROUP BY grp
+                ORDER BY grp
+            ''', {'bucket': bucket, 'user_id': user_id, 'date_from': date_from, 'date_to': date_to,
+                  'max_points': max_points})
+            return [(row['label'], int(row['earning']), int(row['expense']), int(row['balance']))
+                    for row in cursor.fetchall()]
+
+    @reads
+    def daily_totals(self, user_id):
+        """Every (day, earning, expense) row of the user's daily_summary, oldest first."""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT day, total_earning, total_expenses
+                FROM daily_summary
+                WHERE user_id = %s
+                ORDER BY day
+            ''', (user_id,))
+            rows = cursor.fetchall()
+        return [(row['day'], row['total_earning'], row['total_expenses']) for row in rows]
+
+    @reads
+    def top_categories(self, user_id, kind, date_from, date_to, limit):
+        """Largest categories in the range; archived months count when wholly inside it."""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                WITH totals AS (
+                    SELECT category_id, type, SUM(amount) AS total, COUNT(*) AS entries
+                    FROM transactions
+                    WHERE user_id = %(user_id)s
+                      AND (%(kind)s::text IS NULL OR type = %(kind)s)
+                      AND (%(date_from)s::date IS NULL OR day >= %(date_from)s)
+                      AND (%(date_to)s::date IS NULL OR day <= %(date_to)s)
+                      AND (%(start)s::timestamptz IS NULL OR date >= %(start)s)
+                      AND (%(end)s::timestamptz IS NULL OR date < %(end)s)
+                    GROUP BY category_id, type
+                    UNION ALL
+                    SELECT category_id, type, total, entries
+                    FROM archived_categories
+                    WHERE user_id = %(user_id)s
+                      AND (%(kind)s::text IS NULL OR type = %(kind)s)
+                      AND (%(date_from)s::date IS NULL OR month >= %(date_from)s)
+                      AND (%(date_to)s::date IS NULL OR month + interval '1 month' <= %(date_to)s::date + 1)
+                ), top AS (
+                    SELECT category_id, type, SUM(total) AS total, SUM(entries) AS entries
+                    FROM totals
+                    GROUP BY category_id, type
+                    ORDER BY total DESC
+                    LIMIT %(limit)s
+                )
+                SELECT c.id, c.name, top.type, top.total, top.entries
+                FROM top JOIN categories c ON c.id = top.category_id
+                ORDER BY top.total DESC
+            ''', {'user_id': user_id, 'kind': kind, 'date_from': date_from, 'date_to': date_to,
+                  'start': self._midnight(date_from), 'end': self._after(date_to), 'limit': limit})
+            return [{'id': row['id'], 'name': row['name'], 'type': row['type'],
+                     'total': int(row['total']), 'entries': int(row['entries'])}
+                    for row in cursor.fetchall()]
+
+    @reads
+    def report_data(self, user_id, start, end, step):
+        """Totals, best/worst days, category breakdown and a timeline for a period.
+
+        The period is ``start`` (inclusive) to ``end`` (exclusive); ``step``
+        is 'day' or 'month' and sets the timeline's granularity.
+        """
+        period = (user_id, start, end)
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT COALESCE(SUM(total_earning), 0) AS total_earning,
+                       COALESCE(SUM(total_expenses), 0) AS total_expenses,
+                       COUNT(*) AS active_days
+                FROM daily_summary
+                WHERE user_id = %s AND day >= %s AND day < %s
+            ''', period)
+            totals = dict(cursor.fetchone())
+            # Best and worst days by net, ranked with window functions
+            cursor.execute('''
+                SELECT day, net, best_rank
+                FROM (
+                    SELECT day, total_earning - total_expenses AS net,
+                           row_number() OVER (ORDER BY total_earning - total_expenses DESC, day) AS best_rank,
+                           row_number() OVER (ORDER BY total_earning - total_expenses, day) AS worst_rank
+                    FROM daily_summary
+                    WHERE user_id = %s AND day >= %s AND day < %s
+                ) ranked
+                WHERE best_rank = 1 OR worst_rank = 1
+                ORDER BY best_rank
+            ''', period)
+            extremes = [dict(row) for row in cursor.fetchall()]
+            # Periods are whole months, so archived months count in full
+            cursor.execute('''
+                SELECT b.type, c.name AS description, SUM(b.total)::bigint AS total, SUM(b.entries)::bigint AS entries
+                FROM (
+                    SELECT category_id, type, SUM(amount) AS total, COUNT(*) AS entries
+                    FROM transactions
+                    WHERE user_id = %(user_id)s AND day >= %(start)s AND day < %(end)s
+                      AND date >= %(start_at)s AND date < %(end_at)s
+                    GROUP BY category_id, type
+                    UNION ALL
+                    SELECT category_id, type, total, entries
+                    FROM archived_categories
+                    WHERE user_id = %(user_id)s AND month >= %(start)s AND month < %(end)s
+                ) b
+                JOIN categories c ON c.id = b.category_id
+                GROUP BY b.type, c.id, c.name
+                ORDER BY b.type, total DESC
+            ''', {'user_id': user_id, 'start': start, 'end': end,
+                  'start_at': self._midnight(start), 'end_at': self._midnight(end)})
+            breakdown = [dict(row) for row in cursor.fetchall()]
+            # Timeline: days of a month, or months of a year, with a running net
+            cursor.execute('''
+                SELECT period, total_earning, total_expenses, net,
+                       SUM(net) OVER (ORDER BY period) AS running_net
+                FROM (
+                    SELECT date_trunc(%s, day)::date AS period,
+                           SUM(total_earning) AS total_earning,
+                           SUM(total_expenses) AS total_expenses,
+                           SUM(total_earning - total_expenses) AS net
+                    FROM daily_summary
+                    WHERE user_id = %s AND day >= %s AND day < %s
+                    GROUP BY 1
+                ) periods
+                ORDER BY period
+            ''', (step,) + period)
+            timeline = [dict(row) for row in cursor.fetchall()]
+        return {'totals': totals, 'extremes': extremes, 'breakdown': breakdown, 'timeline': timeline}
+
+    def stream_transactions(self, user_id, date_from=None, date_to=None):
+        """Yield a user's transactions as (id, date, type, description, amount), oldest first.
+
+        ``date_from``/``date_to`` are inclusive calendar days.
+
+        Rows are read through a server-side cursor on a connection of its
+        own (from the replica when it is usable), so memory stays flat and
+        the connection is held only while the caller is iterating (which,
+        for a streamed response, outlives the request).
+        """
+        start, end = self._midnight(date_from), self._after(date_to)
+        primary_reads = has_app_context() and g.get('db_primary_reads')
+        role = 'replica' if not primary_reads and self._replica_usable() else 'primary'
+        pool = get_pool(role)
+        conn = pool.getconn()
+        broken = False
+        try:
+            # A long download must not trip the timeout left by an earlier request
+            self._set_statement_timeout(conn, 0)
+            cursor = conn.cursor('export_transactions', cursor_factory=psycopg2.extensions.cursor)
+            cursor.itersize = EXPORT_FETCH_ROWS
+            cursor.execute('''
+                SELECT id, to_char(date, 'YYYY-MM-DD HH24:MI:SS'), type, description, amount
+                FROM transactions
+                WHERE user_id = %s
+                  AND (%s::date IS NULL OR day >= %s)
+                  AND (%s::date IS NULL OR day <= %s)
+                  AND (%s::timestamptz IS NULL OR date >= %s)
+                  AND (%s::timestamptz IS NULL OR date < %s)
+                ORDER BY date, id
+            ''', (user_id, date_from, date_from, date_to, date_to,
+                  start, start, end, end))
+            yield from cursor
+            cursor.close()
+            conn.rollback()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            broken = not isinstance(e, psycopg2.errors.QueryCanceled)
+            if broken and role == 'replica':
+                self._mark_replica_down()
+            raise
+        finally:
+            conn.statement_timeout = None  # The rollback undid the SET
+            pool.putconn(conn, close=broken)
@@ -0,0 +1,12 @@
+import sys
+
+from app import storage
+
+if __name__ == "__main__":
+    user_id = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    print("Rebuilding daily summary" + (f" for user {user_id}..." if user_id else " for all users..."))
+    try:
+        days = storage.rebuild_daily_summary(user_id)
+        print(f"Daily summary rebuilt: {days} day rows.")
+    except Exception as e:
+        print(f"Error rebuilding daily summary: {e}")
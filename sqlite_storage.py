@@ -0,0 +1,1125 @@
+"""
+Embedded SQLite storage backend (DATABASE_URL=sqlite:///path/to/file.db).
+
+Every thread keeps one connection open in WAL mode, so readers never block
+the writer and reads are served straight from the local file. Writes take
+the database lock up front (BEGIN IMMEDIATE) and wait up to the busy timeout
+for it instead of failing mid-transaction.
+
+Dates are stored as fixed-width UTC text and calendar days are cut in Python
+in the app's time zone; row-level triggers keep daily_summary in step with
+transactions.
+
+SQLite has no table partitioning, so ensure_partitions() does nothing here;
+archive_months() keeps the table small instead, moving closed months out
+to compressed files in the same format the PostgreSQL backend writes.
+"""
+
+import csv
+import gzip
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timezone as dt_timezone
+from zoneinfo import ZoneInfo
+
+from flask import g, has_app_context
+
+from db_pool import QueryTimeout
+from archive import ARCHIVE_COLUMNS, add_months, archive_path
+from metrics import InstrumentedSQLiteCursor
+
+SCHEMA_VERSION = 5  # Kept in PRAGMA user_version; bump whenever create_schema() changes
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S.%f'  # UTC, fixed width so text order is time order
+EXPORT_FETCH_ROWS = 2000
+INSERT_BATCH_ROWS = 4000  # 7 parameters a row keeps each INSERT under SQLite's 32766 limit
+
+TIMEOUT_CHECK_STEPS = 1000  # VM instructions between statement-timeout checks
+BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000'))
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',  # Durable at checkpoints; safe with WAL
+    'PRAGMA foreign_keys = ON',
+    f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}',
+    f"PRAGMA cache_size = -{int(os.getenv('SQLITE_CACHE_MB', '64')) * 1024}",
+    f"PRAGMA mmap_size = {int(os.getenv('SQLITE_MMAP_MB', '256')) * 1024 * 1024}",
+    'PRAGMA temp_store = MEMORY',
+)
+
+# Same grouping as date_trunc() on the Postgres backend; weeks start on Monday
+PERIOD_SQL = {
+    'day': 'day',
+    'week': "date(day, '-6 days', 'weekday 1')",
+    'month': "strftime('%Y-%m-01', day)",
+}
+
+_SUMMARY_ADD = '''
+        INSERT INTO daily_summary (user_id, day, total_earning, total_expenses, entries)
+        VALUES (NEW.user_id, NEW.day,
+                CASE WHEN NEW.type = 'earning' THEN NEW.amount ELSE 0 END,
+                CASE WHEN NEW.type = 'expense' THEN NEW.amount ELSE 0 END,
+                1)
+        ON CONFLICT (user_id, day) DO UPDATE SET
+            total_earning = total_earning + excluded.total_earning,
+            total_expenses = total_expenses + excluded.total_expenses,
+            entries = entries + 1;
+'''
+_SUMMARY_REMOVE = '''
+        UPDATE daily_summary SET
+            total_earning = total_earning - CASE WHEN OLD.type = 'earning' THEN OLD.amount ELSE 0 END,
+            total_expenses = total_expenses - CASE WHEN OLD.type = 'expense' THEN OLD.amount ELSE 0 END,
+            entries = entries - 1
+        WHERE user_id = OLD.user_id AND day = OLD.day;
+        DELETE FROM daily_summary WHERE user_id = OLD.user_id AND day = OLD.day AND entries <= 0;
+'''
+_BALANCE_ADD = '''
+        INSERT INTO balances (user_id, total_earning, total_expenses, entries)
+        VALUES (NEW.user_id,
+                CASE WHEN NEW.type = 'earning' THEN NEW.amount ELSE 0 END,
+                CASE WHEN NEW.type = 'expense' THEN NEW.amount ELSE 0 END,
+                1)
+        ON CONFLICT (user_id) DO UPDATE SET
+            total_earning = total_earning + excluded.total_earning,
+            total_expenses = total_expenses + excluded.total_expenses,
+            entries = entries + 1;
+'''
+_BALANCE_REMOVE = '''
+        UPDATE balances SET
+            total_earning = total_earning - CASE WHEN OLD.type = 'earning' THEN OLD.amount ELSE 0 END,
+            total_expenses = total_expenses - CASE WHEN OLD.type = 'expense' THEN OLD.amount ELSE 0 END,
+            entries = entries - 1
+        WHERE user_id = OLD.user_id;
+'''
+# Keep the full-text index over category names in step with categories
+CATEGORY_SEARCH_TRIGGERS = (
+    ('insert', 'AFTER INSERT', '''
+        INSERT INTO categories_search (rowid, normalized) VALUES (NEW.id, NEW.normalized);
+    '''),
+    ('update', 'AFTER UPDATE OF normalized', '''
+        INSERT INTO categories_search (categories_search, rowid, normalized) VALUES ('delete', OLD.id, OLD.normalized);
+        INSERT INTO categories_search (rowid, normalized) VALUES (NEW.id, NEW.normalized);
+    '''),
+    ('delete', 'AFTER DELETE', '''
+        INSERT INTO categories_search (categories_search, rowid, normalized) VALUES ('delete', OLD.id, OLD.normalized);
+    '''),
+)
+DAILY_SUMMARY_TRIGGERS = (
+    ('insert', 'AFTER INSERT', _SUMMARY_ADD),
+    ('update', 'AFTER UPDATE OF user_id, day, amount, type', _SUMMARY_REMOVE + _SUMMARY_ADD),
+    ('delete', 'AFTER DELETE', _SUMMARY_REMOVE),
+)
+BALANCE_TRIGGERS = (
+    ('insert', 'AFTER INSERT', _BALANCE_ADD),
+    ('update', 'AFTER UPDATE OF user_id, amount, type', _BALANCE_REMOVE + _BALANCE_ADD),
+    ('delete', 'AFTER DELETE', _BALANCE_REMOVE),
+)
+# Every write to a user's transactions bumps users.data_version
+DATA_VERSION_TRIGGERS = (
+    ('insert', 'AFTER INSERT', 'UPDATE users SET data_version = data_version + 1 WHERE id = NEW.user_id;'),
+    ('update', 'AFTER UPDATE', 'UPDATE users SET data_version = data_version + 1 WHERE id = NEW.user_id;'),
+    ('delete', 'AFTER DELETE', 'UPDATE users SET data_version = data_version + 1 WHERE id = OLD.user_id;'),
+)
+TRANSACTION_TRIGGERS = (
+    ('daily_summary', DAILY_SUMMARY_TRIGGERS),
+    ('balance', BALANCE_TRIGGERS),
+    ('data_version', DATA_VERSION_TRIGGERS),
+)
+# Every amount a user ever recorded: live transactions plus the per-category
+# totals of archived months (see archive_months())
+LEDGER_SQL = '''
+    (SELECT user_id, type, amount, 1 AS entries FROM transactions
+     UNION ALL
+     SELECT user_id, type, total, entries FROM archived_categories)
+'''
+
+
+def normalize_category(name):
+    """Python twin of the Postgres normalize_category() SQL function."""
+    if name is None:
+        return None
+    return re.sub(r'\s+', ' ', name.strip()).lower()
+
+
+def _day(value):
+    return value.isoformat() if value else None
+
+
+class _Connection(sqlite3.Connection):
+    """Connection whose cursors report their statements to metrics."""
+
+    def cursor(self, factory=InstrumentedSQLiteCursor):
+        return super().cursor(factory)
+
+
+class SQLiteStorage:
+    """Storage in a local SQLite database file."""
+
+    name = 'sqlite'
+
+    def __init__(self, path, timezone):
+        self.path = path
+        self.timezone = timezone
+        self.tz = ZoneInfo(timezone)
+        self._local = threading.local()
+        # Connections inherited from a parent process are kept referenced
+        # (never closed or garbage-collected) here, like db_pool does.
+        self._inherited = []
+
+    # -- connections --------------------------------------------------------
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000,
+                               isolation_level=None, factory=_Connection)
+        conn.row_factory = sqlite3.Row
+        conn.create_function('normalize_category', 1, normalize_category, deterministic=True)
+        cursor = conn.cursor(sqlite3.Cursor)
+        for pragma in PRAGMAS:
+            cursor.execute(pragma)
+        return conn
+
+    def _thread_connection(self):
+        local = self._local
+        conn = getattr(local, 'conn', None)
+        if conn is not None and local.pid == os.getpid():
+            return conn
+        if conn is not None:
+            self._inherited.append(conn)
+        local.conn = conn = self._connect()
+        local.pid = os.getpid()
+        local.depth = 0
+        return conn
+
+    @contextmanager
+    def connection(self, write=False):
+        """Context manager for this thread's connection.
+
+        The outermost block opens a transaction (BEGIN IMMEDIATE when
+        ``write`` is set, so the lock is taken before any reads) and commits
+        it on exit; nested blocks join it.
+
+        Inside a request, ``g.db_statement_timeout`` (ms) bounds the whole
+        outermost block: SQLite has no per-statement timeout, so a progress
+        handler interrupts whatever runs past the deadline and QueryTimeout
+        is raised.
+        """
+        conn = self._thread_connection()
+        local = self._local
+        depth = local.depth
+        if depth == 0:
+            timeout = g.get('db_statement_timeout', 0) if has_app_context() else 0
+            if timeout:
+                deadline = time.monotonic() + timeout / 1000
+                conn.set_progress_handler(lambda: time.monotonic() > deadline, TIMEOUT_CHECK_STEPS)
+            conn.cursor(sqlite3.Cursor).execute('BEGIN IMMEDIATE' if write else 'BEGIN')
+        local.depth = depth + 1
+        try:
+            yield conn
+            if depth == 0:
+                conn.commit()
+        except Exception as e:
+            if depth == 0:
+                conn.set_progress_handler(None, 0)  # So the rollback itself is not interrupted
+                conn.rollback()
+            if isinstance(e, sqlite3.OperationalError) and str(e) == 'interrupted':
+                raise QueryTimeout('statement timeout') from e
+            raise
+        finally:
+            local.depth = depth
+            if depth == 0:
+                conn.set_progress_handler(None, 0)
+
+    def release(self):
+        """Nothing to return: connections stay open with their thread."""
+
+    def reset(self):
+        """Close the calling thread's connection (e.g. before forking workers)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            if self._local.pid == os.getpid():
+                conn.close()
+            else:
+                self._inherited.append(conn)
+            self._local.conn = None
+
+    def stats(self):
+        return None
+
+    # -- dates --------------------------------------------------------------
+
+    def _date_columns(self, value):
+        """(stored date, day) for a datetime; naive values are in the app's zone."""
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=self.tz)
+        return (value.astimezone(dt_timezone.utc).strftime(DATE_FORMAT),
+                value.astimezone(self.tz).date().isoformat())
+
+    def _load_date(self, text):
+        return datetime.fromisoformat(text).replace(tzinfo=dt_timezone.utc).astimezone(self.tz)
+
+    def _transaction(self, row):
+        transaction = dict(row)
+        transaction['date'] = self._load_date(transaction['date'])
+        transaction['day'] = date.fromisoformat(transaction['day'])
+        return transaction
+
+    # -- schema -------------------------------------------------------------
+
+    def init_schema(self, force=False):
+        """Bring the database schema up to SCHEMA_VERSION.
+
+        Cheap when the schema is already current. The upgrade runs under
+        BEGIN IMMEDIATE, so with several processes starting at once only the
+        first applies it. Returns True if the schema was (re)applied.
+        """
+        with self.connection() as conn:
+            if not force and self.schema_version(conn) >= SCHEMA_VERSION:
+                return False
+        with self.connection(write=True) as conn:
+            if not force and self.schema_version(conn) >= SCHEMA_VERSION:
+                return False
+            self.create_schema(conn)
+            conn.cursor().execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        return True
+
+    @staticmethod
+    def schema_version(conn):
+        return conn.cursor().execute('PRAGMA user_version').fetchone()[0]
+
+    def create_schema(self, conn):
+        """Create or upgrade all tables, indexes and triggers (idempotent)."""
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL
+            )
+        ''')
+        if 'data_version' not in {row['name'] for row in cursor.execute('PRAGMA table_info(users)')}:
+            cursor.execute('ALTER TABLE users ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS categories (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                name TEXT NOT NULL,
+                normalized TEXT NOT NULL,
+                UNIQUE (user_id, normalized)
+            )
+        ''')
+        # Full-text search over descriptions runs against the (far smaller)
+        # category dictionary, indexed by FTS5
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'categories_search'")
+        search_missing = cursor.fetchone() is None
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS categories_search
+            USING fts5(normalized, content='categories', content_rowid='id')
+        ''')
+        for name, event, body in CATEGORY_SEARCH_TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS trg_categories_search_{name}')
+            cursor.execute(f'''
+                CREATE TRIGGER trg_categories_search_{name}
+                {event} ON categories
+                FOR EACH ROW BEGIN {body} END
+            ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS transactions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date TEXT NOT NULL,
+                day TEXT NOT NULL,
+                description TEXT NOT NULL,
+                category_id INTEGER NOT NULL REFERENCES categories(id),
+                amount INTEGER NOT NULL,
+                type TEXT CHECK(type IN ('earning','expense')) NOT NULL,
+                user_id INTEGER NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+            )
+        ''')
+        self.migrate_legacy_transactions(cursor)
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_transactions_user_date
+            ON transactions (user_id, date DESC, id)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_transactions_user_day
+            ON transactions (user_id, day)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_transactions_user_category
+            ON transactions (user_id, category_id)
+        ''')
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_summary'")
+        summary_missing = cursor.fetchone() is None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS daily_summary (
+                user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                day TEXT NOT NULL,
+                total_earning INTEGER NOT NULL DEFAULT 0,
+                total_expenses INTEGER NOT NULL DEFAULT 0,
+                entries INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, day)
+            ) WITHOUT ROWID
+        ''')
+        # All-time totals per user, so the current balance needs no scan
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'balances'")
+        balances_missing = cursor.fetchone() is None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS balances (
+                user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+                total_earning INTEGER NOT NULL DEFAULT 0,
+                total_expenses INTEGER NOT NULL DEFAULT 0,
+                entries INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        self._create_transaction_triggers(cursor)
+        # Closed months whose detail was archived: per-category totals, and
+        # where each batch of rows went (see archive_months())
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS archived_categories (
+                user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                month TEXT NOT NULL,
+                category_id INTEGER NOT NULL REFERENCES categories(id),
+                type TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                entries INTEGER NOT NULL,
+                PRIMARY KEY (user_id, month, category_id, type)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS archived_periods (
+                month TEXT NOT NULL,
+                location TEXT NOT NULL,
+                rows INTEGER NOT NULL,
+                archived_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (month, location)
+            )
+        ''')
+        if summary_missing:
+            self._rebuild_daily_summary(cursor)
+        if balances_missing:
+            self._rebuild_balances(cursor)
+        if search_missing:
+            cursor.execute("INSERT INTO categories_search (categories_search) VALUES ('rebuild')")
+
+    @staticmethod
+    def _create_transaction_triggers(cursor):
+        for trigger, triggers in TRANSACTION_TRIGGERS:
+            for name, event, body in triggers:
+                cursor.execute(f'DROP TRIGGER IF EXISTS trg_{trigger}_{name}')
+                cursor.execute(f'''
+                    CREATE TRIGGER trg_{trigger}_{name}
+                    {event} ON transactions
+                    FOR EACH ROW BEGIN {body} END
+                ''')
+
+    def migrate_legacy_transactions(self, cursor):
+        """Upgrade a transactions table from the old SQLite app (tracker_data.db).
+
+        Old rows hold naive "YYYY-MM-DD HH:MM:SS" local times and have no
+        day or category; both are filled in here.
+        """
+        columns = {row['name'] for row in cursor.execute('PRAGMA table_info(transactions)')}
+        if 'day' not in columns:
+            cursor.execute("ALTER TABLE transactions ADD COLUMN day TEXT NOT NULL DEFAULT ''")
+            rows = cursor.execute('SELECT id, date FROM transactions').fetchall()
+            cursor.executemany('UPDATE transactions SET date = ?, day = ? WHERE id = ?', [
+                self._date_columns(datetime.fromisoformat(row['date'])) + (row['id'],)
+                for row in rows
+            ])
+        if 'category_id' not in columns:
+            cursor.execute('ALTER TABLE transactions ADD COLUMN category_id INTEGER REFERENCES categories(id)')
+            # The first spelling seen for each normalized name becomes its display name
+            cursor.execute('''
+                INSERT INTO categories (user_id, name, normalized)
+                SELECT user_id, trim(description), normalize_category(description)
+                FROM transactions
+                WHERE true
+                ORDER BY id
+                ON CONFLICT (user_id, normalized) DO NOTHING
+            ''')
+            cursor.execute('''
+                UPDATE transactions SET category_id = (
+                    SELECT c.id FROM categories c
+                    WHERE c.user_id = transactions.user_id
+                      AND c.normalized = normalize_category(transactions.description)
+                )
+            ''')
+
+    def rebuild_daily_summary(self, user_id=None):
+        """Recompute daily_summary from transactions (all users, or just one).
+
+        Runs under the write lock, so no change can slip in meanwhile.
+        Returns the number of days.
+        """
+        with self.connection(write=True) as conn:
+            return self._rebuild_daily_summary(conn.cursor(), user_id)
+
+    @staticmethod
+    def _rebuild_daily_summary(cursor, user_id=None):
+        """Days in archived months are kept as they are: their detail is gone."""
+        params = {'user_id': user_id}
+        archived = '''
+            EXISTS (SELECT 1 FROM archived_periods a
+                    WHERE day >= a.month AND day < date(a.month, '+1 month'))
+        '''
+        cursor.execute(f'''
+            DELETE FROM daily_summary
+            WHERE (:user_id IS NULL OR user_id = :user_id) AND NOT {archived}
+        ''', params)
+        cursor.execute(f'''
+            INSERT INTO daily_summary (user_id, day, total_earning, total_expenses, entries)
+            SELECT user_id, day,
+                   SUM(CASE WHEN type = 'earning' THEN amount ELSE 0 END),
+                   SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END),
+                   COUNT(*)
+            FROM transactions
+            WHERE (:user_id IS NULL OR user_id = :user_id) AND NOT {archived}
+            GROUP BY 1, 2
+        ''', params)
+        return cursor.rowcount
+
+    @staticmethod
+    def _rebuild_balances(cursor, user_ids=None):
+        """Recompute balances from transactions and archived months for ``user_ids`` (None: everyone)."""
+        params = {'user_ids': None if user_ids is None else json.dumps(list(user_ids))}
+        cursor.execute('''
+            DELETE FROM balances
+            WHERE :user_ids IS NULL OR user_id IN (SELECT value FROM json_each(:user_ids))
+        ''', params)
+        cursor.execute(f'''
+            INSERT INTO balances (user_id, total_earning, total_expenses, entries)
+            SELECT user_id,
+                   SUM(CASE WHEN type = 'earning' THEN amount ELSE 0 END),
+                   SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END),
+                   SUM(entries)
+            FROM {LEDGER_SQL}
+            WHERE :user_ids IS NULL OR user_id IN (SELECT value FROM json_each(:user_ids))
+            GROUP BY 1
+        ''', params)
+
+    def check_balances(self, user_id=None, repair=False):
+        """Compare balances with totals recomputed from transactions and archived months.
+
+        Returns one dict per user whose stored (earning, expenses, entries)
+        differ from the actual ones. With ``repair`` the check runs in a
+        write transaction, so no other write can interleave, and the drifted
+        rows are rebuilt.
+        """
+        with self.connection(write=repair) as conn:
+            cursor = conn.cursor()
+            rows = cursor.execute(f'''
+                WITH actual AS (
+                    SELECT user_id,
+                           SUM(CASE WHEN type = 'earning' THEN amount ELSE 0 END) AS total_earning,
+                           SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END) AS total_expenses,
+                           SUM(entries) AS entries
+                    FROM {LEDGER_SQL}
+                    WHERE :user_id IS NULL OR user_id = :user_id
+                    GROUP BY user_id
+                ), compared AS (
+                    SELECT u.id AS user_id,
+                           COALESCE(b.total_earning, 0) AS stored_earning,
+                           COALESCE(b.total_expenses, 0) AS stored_expenses,
+                           COALESCE(b.entries, 0) AS stored_entries,
+                           COALESCE(a.total_earning, 0) AS actual_earning,
+                           COALESCE(a.total_expenses, 0) AS actual_expenses,
+                           COALESCE(a.entries, 0) AS actual_entries
+                    FROM users u
+                    LEFT JOIN balances b ON b.user_id = u.id
+                    LEFT JOIN actual a ON a.user_id = u.id
+                    WHERE :user_id IS NULL OR u.id = :user_id
+                )
+                SELECT * FROM compared
+                WHERE (stored_earning, stored_expenses, stored_entries)
+                   <> (actual_earning, actual_expenses, actual_entries)
+                ORDER BY user_id
+            ''', {'user_id': user_id}).fetchall()
+            drifted = [dict(row) for row in rows]
+            if repair and drifted:
+                self._rebuild_balances(cursor, [row['user_id'] for row in drifted])
+        return drifted
+
+    # -- partitions and archive ----------------------------------------------
+
+    def ensure_partitions(self):
+        """SQLite has no partitioning; archive_months() keeps transactions small instead."""
+        return []
+
+    def archive_months(self, before, directory, detach=False):
+        """Archive every month before ``before`` (a month's first day).
+
+        Each month is handled in its own write transaction: its
+        per-category totals are added to archived_categories and its rows
+        are written to a gzip CSV file in ``directory`` and deleted, with
+        the transaction triggers suspended so daily_summary and balances
+        still include them. Returns (month, rows, location) per month.
+        """
+        if detach:
+            raise ValueError("detached archives need PostgreSQL; on SQLite months are archived to files")
+        with self.connection() as conn:
+            months = [date.fromisoformat(row['month']) for row in conn.cursor().execute('''
+                SELECT DISTINCT strftime('%Y-%m-01', day) AS month
+                FROM transactions
+                WHERE day < :before
+                ORDER BY 1
+            ''', {'before': _day(before)})]
+        archived = []
+        for month in months:
+            period = {'start': _day(month), 'end': _day(add_months(month, 1))}
+            path = None
+            try:
+                with self.connection(write=True) as conn:
+                    cursor = conn.cursor()
+                    rows = cursor.execute(f'''
+                        SELECT {', '.join(ARCHIVE_COLUMNS)} FROM transactions
+                        WHERE day >= :start AND day < :end
+                        ORDER BY id
+                    ''', period).fetchall()
+                    users = sorted({row['user_id'] for row in rows})
+                    cursor.execute('''
+                        INSERT INTO archived_categories (user_id, month, category_id, type, total, entries)
+                        SELECT user_id, :start, category_id, type, SUM(amount), COUNT(*)
+                        FROM transactions
+                        WHERE day >= :start AND day < :end
+                        GROUP BY user_id, category_id, type
+                        ON CONFLICT (user_id, month, category_id, type) DO UPDATE SET
+                            total = total + excluded.total,
+                            entries = entries + excluded.entries
+                    ''', period)
+                    os.makedirs(directory, exist_ok=True)
+                    path = archive_path(directory, month)
+                    with gzip.open(path, 'wt', encoding='utf-8', newline='') as f:
+                        writer = csv.writer(f)
+                        writer.writerow(ARCHIVE_COLUMNS)
+                        writer.writerows(
+                            (row['id'], self._load_date(row['date']), row['description'], row['category_id'],
+                             row['amount'], row['type'], row['user_id'])
+                            for row in rows
+                        )
+                    with self._triggers_suspended(cursor):
+                        cursor.execute('DELETE FROM transactions WHERE day >= :start AND day < :end', period)
+                    cursor.execute('''
+                        INSERT INTO archived_periods (month, location, rows) VALUES (?, ?, ?)
+                    ''', (period['start'], path, len(rows)))
+                    self._bump_data_versions(cursor, users)
+            except Exception:
+                if path and os.path.exists(path):
+                    os.remove(path)
+                raise
+            archived.append((month, len(rows), path))
+        return archived
+
+    def restore_month(self, month):
+        """Bring an archived month's rows back into transactions; returns the row count.
+
+        The transaction triggers are suspended while the rows go back in:
+        daily_summary and balances never stopped counting them. Archive
+        files are left in place.
+        """
+        start = _day(month.replace(day=1))
+        with self.connection(write=True) as conn:
+            cursor = conn.cursor()
+            locations = [row['location'] for row in cursor.execute(
+                'SELECT location FROM archived_periods WHERE month = ? ORDER BY archived_at', (start,))]
+            users = set()
+            restored = 0
+            with self._triggers_suspended(cursor):
+                for location in locations:
+                    with gzip.open(location, 'rt', encoding='utf-8', newline='') as f:
+                        batch = []
+                        for row in csv.DictReader(f):
+                            when, day = self._date_columns(datetime.fromisoformat(row['date']))
+                            batch.append((int(row['id']), when, day, row['description'], int(row['category_id']),
+                                          int(row['amount']), row['type'], int(row['user_id'])))
+                            users.add(int(row['user_id']))
+                            if len(batch) >= INSERT_BATCH_ROWS:
+                                restored += self._restore_rows(cursor, batch)
+                        restored += self._restore_rows(cursor, batch)
+            cursor.execute('DELETE FROM archived_categories WHERE month = ?', (start,))
+            cursor.execute('DELETE FROM archived_periods WHERE month = ?', (start,))
+            self._bump_data_versions(cursor, users)
+        return restored
+
+    @staticmethod
+    def _restore_rows(cursor, batch):
+        cursor.executemany('''
+            INSERT INTO transactions (id, date, day, description, category_id, amount, type, user_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', batch)
+        count = len(batch)
+        batch.clear()
+        return count
+
+    @staticmethod
+    @contextmanager
+    def _triggers_suspended(cursor):
+        """Drop the transactions triggers for the block; they come back before it commits."""
+        for trigger, triggers in TRANSACTION_TRIGGERS:
+            for name, _, _ in triggers:
+                cursor.execute(f'DROP TRIGGER IF EXISTS trg_{trigger}_{name}')
+        yield
+        SQLiteStorage._create_transaction_triggers(cursor)
+
+    @staticmethod
+    def _bump_data_versions(cursor, user_ids):
+        cursor.execute('''
+            UPDATE users SET data_version = data_version + 1
+            WHERE id IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(sorted(user_ids)),))
+
+    # -- users --------------------------------------------------------------
+
+    def get_user(self, user_id):
+        """(id, username) for a user id, or None."""
+        with self.connection() as conn:
+            user = conn.cursor().execute('SELECT id, username FROM users WHERE id = ?', (user_id,)).fetchone()
+        return (user['id'], user['username']) if user else None
+
+    def find_user(self, username):
+        """The user's id, username and password_hash, or None."""
+        with self.connection() as conn:
+            user = conn.cursor().execute('SELECT id, username, password_hash FROM users WHERE username = ?',
+                                         (username,)).fetchone()
+        return dict(user) if user else None
+
+    def list_users(self, prefix=''):
+        """Users whose name starts with ``prefix``, oldest first."""
+        pattern = prefix.replace('\\', '\\\\').replace('%', r'\%').replace('_', r'\_') + '%'
+        with self.connection() as conn:
+            rows = conn.cursor().execute(r"SELECT id, username FROM users WHERE username LIKE ? ESCAPE '\' ORDER BY id",
+                                         (pattern,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def create_user(self, username, password_hash):
+        """Insert a user and return the new id."""
+        with self.connection(write=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute('INSERT INTO users (username, password_hash) VALUES (?, ?)', (username, password_hash))
+            return cursor.lastrowid
+
+    def set_password_hash(self, user_id, password_hash):
+        with self.connection(write=True) as conn:
+            conn.cursor().execute('UPDATE users SET password_hash = ? WHERE id = ?', (password_hash, user_id))
+
+    def data_version(self, user_id):
+        """Counter bumped by every write to the user's transactions."""
+        with self.connection() as conn:
+            row = conn.cursor().execute('SELECT data_version FROM users WHERE id = ?', (user_id,)).fetchone()
+        return row['data_version'] if row else 0
+
+    def balance(self, user_id):
+        """All-time earning, expenses, entries and running balance from balances."""
+        with self.connection() as conn:
+            row = conn.cursor().execute(
+                'SELECT total_earning, total_expenses, entries FROM balances WHERE user_id = ?', (user_id,)).fetchone()
+        totals = dict(row) if row else {'total_earning': 0, 'total_expenses': 0, 'entries': 0}
+        totals['balance'] = totals['total_earning'] - totals['total_expenses']
+        return totals
+
+    # -- categories ---------------------------------------------------------
+
+    def ensure_categories(self, user_id, names):
+        """Create any missing categories for ``names``; returns how many were created."""
+        chosen = {}
+        for name in sorted(names):
+            chosen.setdefault(normalize_category(name), name)
+        with self.connection(write=True) as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                INSERT INTO categories (user_id, name, normalized) VALUES (?, ?, ?)
+                ON CONFLICT (user_id, normalized) DO NOTHING
+            ''', [(user_id, name.strip(), key) for key, name in chosen.items()])
+            return max(cursor.rowcount, 0)
+
+    def category_names(self, user_id, limit):
+        """The user's category names, most-used first."""
+        with self.connection() as conn:
+            rows = conn.cursor().execute('''
+                SELECT c.name
+                FROM categories c
+                LEFT JOIN (
+                    SELECT category_id, COUNT(*) AS uses
+                    FROM transactions WHERE user_id = :user_id
+                    GROUP BY category_id
+                ) u ON u.category_id = c.id
+                WHERE c.user_id = :user_id
+                ORDER BY u.uses DESC NULLS LAST, c.name
+                LIMIT :limit
+            ''', {'user_id': user_id, 'limit': limit}).fetchall()
+        return [row['name'] for row in rows]
+
+    # -- transactions -------------------------------------------------------
+
+    def insert_transactions(self, rows):
+        """Insert (date, description, amount, type, user_id) rows.
+
+        Category ids for the distinct names are fetched in one query per
+        batch, then rows go in as plain multi-row INSERTs (per-row category
+        subqueries make large statements slow to prepare). The categories
+        must already exist. Returns the new ids.
+        """
+        ids = []
+        with self.connection(write=True) as conn:
+            cursor = conn.cursor()
+            for start in range(0, len(rows), INSERT_BATCH_ROWS):
+                batch = rows[start:start + INSERT_BATCH_ROWS]
+                keys = {(user_id, normalize_category(description)) for _, description, _, _, user_id in batch}
+                category_ids = {
+                    (row['user_id'], row['normalized']): row['id']
+                    for row in cursor.execute('''
+                        SELECT user_id, normalized, id FROM categories
+                        WHERE (user_id, normalized) IN (SELECT value ->> 0, value ->> 1 FROM json_each(?))
+                    ''', (json.dumps(list(keys)),)).fetchall()
+                }
+                params = []
+                for when, description, amount, kind, user_id in batch:
+                    params.extend(self._date_columns(when))
+                    params.extend((description, amount, kind, user_id,
+                                   category_ids.get((user_id, normalize_category(description)))))
+                cursor.execute(f'''
+                    INSERT INTO transactions (date, day, description, amount, type, user_id, category_id)
+                    VALUES {', '.join(['(?, ?, ?, ?, ?, ?, ?)'] * len(batch))}
+                    RETURNING id
+                ''', params)
+                ids.extend(row['id'] for row in cursor.fetchall())
+        return ids
+
+    def load_transactions(self, user_id, batches):
+        """Bulk-load one user's (date, description, amount, type) rows.
+
+        SQLite has no COPY, so each batch from the ``batches`` iterable gets
+        one category upsert and batched multi-row INSERTs, all in one
+        transaction. Returns the number of rows loaded.
+        """
+        loaded = 0
+        with self.connection(write=True):
+            for batch in batches:
+                self.ensure_categories(user_id, {description for _, description, _, _ in batch})
+                loaded += len(self.insert_transactions(
+                    [(when, description, amount, kind, user_id) for when, description, amount, kind in batch]))
+        return loaded
+
+    def get_transaction(self, user_id, transaction_id):
+        with self.connection() as conn:
+            row = conn.cursor().execute('SELECT * FROM transactions WHERE id = ? AND user_id = ?',
+                                        (transaction_id, user_id)).fetchone()
+        return self._transaction(row) if row else None
+
+    def update_transaction(self, user_id, transaction_id, description, amount):
+        """Change a transaction's description and amount; returns its day or None."""
+        with self.connection(write=True) as conn:
+            rows = conn.cursor().execute('''
+                UPDATE transactions
+                SET description = :description, amount = :amount,
+                    category_id = (SELECT id FROM categories
+                                   WHERE user_id = :user_id AND normalized = normalize_category(:description))
+                WHERE id = :id AND user_id = :user_id
+                RETURNING day
+            ''', {'description': description, 'amount': amount, 'user_id': user_id, 'id': transaction_id}).fetchall()
+        return date.fromisoformat(rows[0]['day']) if rows else None
+
+    def delete_transaction(self, user_id, transaction_id):
+        """Delete a transaction; returns its day, or None if there was none."""
+        with self.connection(write=True) as conn:
+            rows = conn.cursor().execute('DELETE FROM transactions WHERE id = ? AND user_id = ? RETURNING day',
+                                         (transaction_id, user_id)).fetchall()
+        return date.fromisoformat(rows[0]['day']) if rows else None
+
+    def owned_transactions(self, user_id, ids):
+        """{id: day} for those of ``ids`` that belong to the user, in one query."""
+        with self.connection() as conn:
+            rows = conn.cursor().execute('''
+                SELECT id, day FROM transactions
+                WHERE user_id = ? AND id IN (SELECT value FROM json_each(?))
+            ''', (user_id, json.dumps(list(ids)))).fetchall()
+        return {row['id']: date.fromisoformat(row['day']) for row in rows}
+
+    def delete_transactions(self, user_id, ids):
+        """Delete many of the user's transactions in one statement; returns the count."""
+        with self.connection(write=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                DELETE FROM transactions
+                WHERE user_id = ? AND id IN (SELECT value FROM json_each(?))
+            ''', (user_id, json.dumps(list(ids))))
+            return cursor.rowcount
+
+    def update_transactions(self, user_id, updates):
+        """Apply (id, description, amount) updates in one statement.
+
+        A None description or amount leaves that field unchanged. Categories
+        for new descriptions must already exist. Returns the count.
+        """
+        with self.connection(write=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE transactions
+                SET description = COALESCE(v.description, transactions.description),
+                    amount = COALESCE(v.amount, transactions.amount),
+                    category_id = CASE WHEN v.description IS NULL THEN transactions.category_id ELSE (
+                        SELECT id FROM categories
+                        WHERE user_id = transactions.user_id AND normalized = normalize_category(v.description)
+                    ) END
+                FROM (
+                    SELECT value ->> 0 AS id, value ->> 1 AS description, value ->> 2 AS amount
+                    FROM json_each(?)
+                ) AS v
+                WHERE transactions.id = v.id AND transactions.user_id = ?
+            ''', (json.dumps([list(update) for update in updates]), user_id))
+            return cursor.rowcount
+
+    def latest_transaction_id(self, user_id):
+        with self.connection() as conn:
+            return conn.cursor().execute('SELECT max(id) AS id FROM transactions WHERE user_id = ?',
+                                         (user_id,)).fetchone()['id']
+
+    def search_transactions(self, user_id, terms, kind=None, date_from=None, date_to=None, limit=20, offset=0):
+        """Transactions whose description has a word starting with each term.
+
+        Terms are matched against category names through the FTS5 index,
+        and the hits read through the (user_id, category_id) index. Returns
+        one page of matches, newest first, with the count and totals of the
+        whole result.
+        """
+        params = {
+            'user_id': user_id,
+            'query': ' '.join(f'"{term}"*' for term in terms),
+            'kind': kind,
+            'date_from': _day(date_from),
+            'date_to': _day(date_to),
+            'limit': limit,
+            'offset': offset,
+        }
+        matches = '''
+            FROM transactions
+            WHERE user_id = :user_id
+              AND category_id IN (
+                  SELECT c.id
+                  FROM categories_search s JOIN categories c ON c.id = s.rowid
+                  WHERE categories_search MATCH :query AND c.user_id = :user_id
+              )
+              AND (:kind IS NULL OR type = :kind)
+              AND (:date_from IS NULL OR day >= :date_from)
+              AND (:date_to IS NULL OR day <= :date_to)
+        '''
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            totals = cursor.execute(f'''
+                SELECT COUNT(*) AS matches,
+                       COALESCE(SUM(CASE WHEN type = 'earning' THEN amount END), 0) AS total_earning,
+                       COALESCE(SUM(CASE WHEN type = 'expense' THEN amount END), 0) AS total_expenses
+                {matches}
+            ''', params).fetchone()
+            rows = cursor.execute(f'''
+                SELECT id, date, day, description, amount, type
+                {matches}
+                ORDER BY date DESC, id DESC
+                LIMIT :limit OFFSET :offset
+            ''', params).fetchall()
+        return dict(totals, transactions=[self._transaction(row) for row in rows])
+
+    # -- history and aggregates ---------------------------------------------
+
+    def history_days(self, user_id, before=None, date_from=None, date_to=None, limit=20):
+        """Daily totals newest first, for days older than ``before`` within the range."""
+        with self.connection() as conn:
+            rows = conn.cursor().execute('''
+                SELECT day, total_earning, total_expenses
+                FROM daily_summary
+                WHERE user_id = :user_id
+                  AND (:before IS NULL OR day < :before)
+                  AND (:date_from IS NULL OR day >= :date_from)
+                  AND (:date_to IS NULL OR day <= :date_to)
+                ORDER BY day DESC
+                LIMIT :limit
+            ''', {'user_id': user_id, 'before': _day(before), 'date_from': _day(date_from),
+                  'date_to': _day(date_to), 'limit': limit}).fetchall()
+        return [dict(row, day=date.fromisoformat(row['day'])) for row in rows]
+
+    def day_transactions(self, user_id, first_day, last_day):
+        """Transactions on days ``first_day``..``last_day``, newest first."""
+        with self.connection() as conn:
+            rows = conn.cursor().execute('''
+                SELECT id, date, day, description, amount, type
+                FROM transactions
+                WHERE user_id = ? AND day BETWEEN ? AND ?
+                ORDER BY date DESC, id
+            ''', (user_id, _day(first_day), _day(last_day))).fetchall()
+        return [self._transaction(row) for row in rows]
+
+    def series(self, user_id, bucket, date_from, date_to, max_points):
+        """(label, earning, expense, balance) per bucket, merged down to ``max_points``.
+
+        ``balance`` is the running balance at the end of each point: the
+        cumulative net so far plus everything before ``date_from``, all
+        summed from daily_summary.
+        """
+        with self.connection() as conn:
+            rows = conn.cursor().execute(f'''
+                WITH buckets AS (
+                    SELECT {PERIOD_SQL[bucket]} AS bucket,
+                           SUM(total_earning) AS earning,
+                           SUM(total_expenses) AS expense
+                    FROM daily_summary
+                    WHERE user_id = :user_id
+                      AND (:date_from IS NULL OR day >= :date_from)
+                      AND (:date_to IS NULL OR day <= :date_to)
+                    GROUP BY 1
+                ), grouped AS (
+                    SELECT *, ntile(:max_points) OVER (ORDER BY bucket) AS grp FROM buckets
+                ), opening AS (
+                    SELECT COALESCE(SUM(total_earning - total_expenses), 0) AS balance
+                    FROM daily_summary
+                    WHERE user_id = :user_id AND day < :date_from
+                )
+                SELECT MIN(bucket) AS label,
+                       SUM(earning) AS earning,
+                       SUM(expense) AS expense,
+                       (SELECT balance FROM opening) + SUM(SUM(earning - expense)) OVER (ORDER BY grp) AS balance
+                FROM grouped
+                GROUP BY grp
+                ORDER BY grp
+            ''', {'user_id': user_id, 'date_from': _day(date_from), 'date_to': _day(date_to),
+                  'max_points': max_points}).fetchall()
+        return [(row['label'], row['earning'], row['expense'], row['balance']) for row in rows]
+
+    def daily_totals(self, user_id):
+        """Every (day, earning, expense) row of the user's daily_summary, oldest first."""
+        with self.connection() as conn:
+            rows = conn.cursor().execute('''
+                SELECT day, total_earning, total_expenses
+                FROM daily_summary
+                WHERE user_id = ?
+                ORDER BY day
+            ''', (user_id,)).fetchall()
+        return [(date.fromisoformat(row['day']), row['total_earning'], row['total_expenses']) for row in rows]
+
+    def top_categories(self, user_id, kind, date_from, date_to, limit):
+        """Largest categories in the range; archived months count when wholly inside it."""
+        with self.connection() as conn:
+            rows = conn.cursor().execute('''
+                WITH totals AS (
+                    SELECT category_id, type, SUM(amount) AS total, COUNT(*) AS entries
+                    FROM transactions
+                    WHERE user_id = :user_id
+                      AND (:kind IS NULL OR type = :kind)
+                      AND (:date_from IS NULL OR day >= :date_from)
+                      AND (:date_to IS NULL OR day <= :date_to)
+                    GROUP BY category_id, type
+                    UNION ALL
+                    SELECT category_id, type, total, entries
+                    FROM archived_categories
+                    WHERE user_id = :user_id
+                      AND (:kind IS NULL OR type = :kind)
+                      AND (:date_from IS NULL OR month >= :date_from)
+                      AND (:date_to IS NULL OR date(month, '+1 month') <= date(:date_to, '+1 day'))
+                ), top AS (
+                    SELECT category_id, type, SUM(total) AS total, SUM(entries) AS entries
+                    FROM totals
+                    GROUP BY category_id, type
+                    ORDER BY total DESC
+                    LIMIT :limit
+                )
+                SELECT c.id, c.name, top.type, top.total, top.entries
+                FROM top JOIN categories c ON c.id = top.category_id
+                ORDER BY top.total DESC
+            ''', {'user_id': user_id, 'kind': kind, 'date_from': _day(date_from),
+                  'date_to': _day(date_to), 'limit': limit}).fetchall()
+        return [dict(row) for row in rows]
+
+    def report_data(self, user_id, start, end, step):
+        """Totals, best/worst days, category breakdown and a timeline for a period.
+
+        The period is ``start`` (inclusive) to ``end`` (exclusive); ``step``
+        is 'day' or 'month' and sets the timeline's granularity.
+        """
+        period = {'user_id': user_id, 'start': _day(start), 'end': _day(end)}
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            totals = dict(cursor.execute('''
+                SELECT COALESCE(SUM(total_earning), 0) AS total_earning,
+                       COALESCE(SUM(total_expenses), 0) AS total_expenses,
+                       COUNT(*) AS active_days
+                FROM daily_summary
+                WHERE user_id = :user_id AND day >= :start AND day < :end
+            ''', period).fetchone())
+            extremes = cursor.execute('''
+                SELECT day, net, best_rank
+                FROM (
+                    SELECT day, total_earning - total_expenses AS net,
+                           row_number() OVER (ORDER BY total_earning - total_expenses DESC, day) AS best_rank,
+                           row_number() OVER (ORDER BY total_earning - total_expenses, day) AS worst_rank
+                    FROM daily_summary
+                    WHERE user_id = :user_id AND day >= :start AND day < :end
+                ) ranked
+                WHERE best_rank = 1 OR worst_rank = 1
+                ORDER BY best_rank
+            ''', period).fetchall()
+            # Periods are whole months, so archived months count in full
+            breakdown = cursor.execute('''
+                SELECT b.type, c.name AS description, SUM(b.total) AS total, SUM(b.entries) AS entries
+                FROM (
+                    SELECT category_id, type, SUM(amount) AS total, COUNT(*) AS entries
+                    FROM transactions
+                    WHERE user_id = :user_id AND day >= :start AND day < :end
+                    GROUP BY category_id, type
+                    UNION ALL
+                    SELECT category_id, type, total, entries
+                    FROM archived_categories
+                    WHERE user_id = :user_id AND month >= :start AND month < :end
+                ) b
+                JOIN categories c ON c.id = b.category_id
+                GROUP BY b.type, c.id, c.name
+                ORDER BY b.type, total DESC
+            ''', period).fetchall()
+            timeline = cursor.execute(f'''
+                SELECT period, total_earning, total_expenses, net,
+                       SUM(net) OVER (ORDER BY period) AS running_net
+                FROM (
+                    SELECT {PERIOD_SQL[step]} AS period,
+                           SUM(total_earning) AS total_earning,
+                           SUM(total_expenses) AS total_expenses,
+                           SUM(total_earning - total_expenses) AS net
+                    FROM daily_summary
+                    WHERE user_id = :user_id AND day >= :start AND day < :end
+                    GROUP BY 1
+                ) periods
+                ORDER BY period
+            ''', period).fetchall()
+        return {
+            'totals': totals,
+            'extremes': [dict(row, day=date.fromisoformat(row['day'])) for row in extremes],
+            'breakdown': [dict(row) for row in breakdown],
+            'timeline': [dict(row, period=date.fromisoformat(row['period'])) for row in timeline],
+        }
+
+    def stream_transactions(self, user_id, date_from=None, date_to=None):
+        """Yield a user's transactions as (id, date, type, description, amount), oldest first.
+
+        ``date_from``/``date_to`` are inclusive calendar days. Rows are read
+        in batches on a connection of its own, which lives only as long as
+        the caller keeps iterating.
+        """
+        conn = self._connect()
+        try:
+            conn.row_factory = None
+            cursor = conn.cursor(sqlite3.Cursor)
+            cursor.execute('''
+                SELECT id, date, type, description, amount
+                FROM transactions
+                WHERE user_id = :user_id
+                  AND (:date_from IS NULL OR day >= :date_from)
+                  AND (:date_to IS NULL OR day <= :date_to)
+                ORDER BY date, id
+            ''', {'user_id': user_id, 'date_from': _day(date_from), 'date_to': _day(date_to)})
+            while True:
+                rows = cursor.fetchmany(EXPORT_FETCH_ROWS)
+                if not rows:
+                    break
+                for id_, when, kind, description, amount in rows:
+                    yield (id_, self._load_date(when).strftime('%Y-%m-%d %H:%M:%S'), kind, description, amount)
+        finally:
+            conn.close()
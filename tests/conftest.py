@@ -0,0 +1,23 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app.py builds its storage from DATABASE_URL on import; point it at a
+# throwaway SQLite file so the tests never reach a configured database.
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='tracker-tests-'), 'app.db')
+os.environ.setdefault('SECRET_KEY', 'test')
+
+
+@pytest.fixture
+def sqlite_storage(tmp_path):
+    """A fresh SQLiteStorage (UTC) with the current schema."""
+    from sqlite_storage import SQLiteStorage
+
+    storage = SQLiteStorage(str(tmp_path / 'tracker.db'), 'UTC')
+    storage.init_schema()
+    yield storage
+    storage.reset()
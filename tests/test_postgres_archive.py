@@ -0,0 +1,200 @@
+"""
+PostgreSQL partitioning and archiving checks.
+
+These need a scratch PostgreSQL database whose contents may be thrown away:
+
+    TEST_DATABASE_URL=postgresql://localhost/tracker_test python -m pytest tests
+
+They are skipped when TEST_DATABASE_URL is not set (DATABASE_URL is never
+used, so a real database cannot be wiped by accident).
+"""
+
+import gzip
+import os
+from datetime import date, datetime, timezone
+
+import pytest
+
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason='TEST_DATABASE_URL is not set')
+
+TZ = 'UTC'
+
+# (date, description, amount, type) over three months, oldest first
+ROWS = [
+    (datetime(2023, 1, 5, 9, 30, tzinfo=timezone.utc), 'Salary', 3000, 'earning'),
+    (datetime(2023, 1, 6, 12, 0, tzinfo=timezone.utc), 'Food', 120, 'expense'),
+    (datetime(2023, 2, 1, 8, 0, tzinfo=timezone.utc), 'Food', 80, 'expense'),
+    (datetime(2023, 2, 28, 23, 59, tzinfo=timezone.utc), 'Rent', 900, 'expense'),
+    (datetime(2023, 3, 15, 10, 0, tzinfo=timezone.utc), 'Salary', 3000, 'earning'),
+]
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    import db_pool
+    from postgres_storage import PostgresStorage
+
+    monkeypatch.setenv('DATABASE_URL', TEST_DATABASE_URL)
+    monkeypatch.delenv('DATABASE_REPLICA_URL', raising=False)
+    monkeypatch.setenv('APP_TIMEZONE', TZ)
+    db_pool.reset_pool()
+    storage = PostgresStorage(TZ)
+    with storage.connection(write=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute('DROP SCHEMA IF EXISTS archive CASCADE')
+        cursor.execute('DROP SCHEMA public CASCADE')
+        cursor.execute('CREATE SCHEMA public')
+    yield storage
+    db_pool.reset_pool()
+
+
+def create_v5_schema(storage):
+    """The tables a version 5 database had, with the unpartitioned transactions table."""
+    with storage.connection(write=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE users (
+                id SERIAL PRIMARY KEY,
+                username TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL,
+                data_version BIGINT NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute(r'''
+            CREATE FUNCTION normalize_category(name TEXT) RETURNS TEXT AS $$
+                SELECT lower(regexp_replace(btrim(name), '\s+', ' ', 'g'))
+            $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE
+        ''')
+        cursor.execute('''
+            CREATE TABLE categories (
+                id SERIAL PRIMARY KEY,
+                user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                name TEXT NOT NULL,
+                normalized TEXT NOT NULL,
+                UNIQUE (user_id, normalized)
+            )
+        ''')
+        cursor.execute(f'''
+            CREATE TABLE transactions (
+                id SERIAL PRIMARY KEY,
+                date TIMESTAMPTZ NOT NULL DEFAULT now(),
+                day DATE GENERATED ALWAYS AS ({storage.day_sql}) STORED,
+                description TEXT NOT NULL,
+                category_id INTEGER NOT NULL REFERENCES categories(id),
+                amount INTEGER NOT NULL,
+                type TEXT CHECK(type IN ('earning','expense')) NOT NULL,
+                user_id INTEGER NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+            )
+        ''')
+        cursor.execute('CREATE INDEX idx_transactions_user_date ON transactions (user_id, date DESC, id)')
+        cursor.execute('CREATE INDEX idx_transactions_user_day ON transactions (user_id, day)')
+        cursor.execute('CREATE INDEX idx_transactions_user_category ON transactions (user_id, category_id)')
+        cursor.execute('''
+            CREATE TABLE schema_version (
+                version INTEGER NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        ''')
+        cursor.execute('INSERT INTO schema_version (version) VALUES (5)')
+        cursor.execute("INSERT INTO users (username, password_hash) VALUES ('alice', 'x') RETURNING id")
+        user_id = cursor.fetchone()['id']
+        for name in sorted({description for _, description, _, _ in ROWS}):
+            cursor.execute('''
+                INSERT INTO categories (user_id, name, normalized) VALUES (%s, %s, normalize_category(%s))
+            ''', (user_id, name, name))
+        for day, description, amount, kind in ROWS:
+            cursor.execute('''
+                INSERT INTO transactions (date, description, category_id, amount, type, user_id)
+                SELECT %s, %s, id, %s, %s, %s FROM categories
+                WHERE user_id = %s AND normalized = normalize_category(%s)
+            ''', (day, description, amount, kind, user_id, user_id, description))
+    return user_id
+
+
+def add_user(storage):
+    user_id = storage.create_user('alice', 'x')
+    storage.ensure_categories(user_id, {description for _, description, _, _ in ROWS})
+    storage.insert_transactions([(day, description, amount, kind, user_id)
+                                 for day, description, amount, kind in ROWS])
+    return user_id
+
+
+def snapshot(storage, user_id):
+    """What the pages show: balance, daily totals, and the report for 2023."""
+    return (storage.balance(user_id),
+            storage.daily_totals(user_id),
+            storage.report_data(user_id, date(2023, 1, 1), date(2024, 1, 1), 'month'))
+
+
+def test_migrates_v5_transactions_into_partitions(storage):
+    user_id = create_v5_schema(storage)
+    with storage.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, date, amount FROM transactions ORDER BY id')
+        before = [tuple(row.values()) for row in cursor.fetchall()]
+
+    assert storage.init_schema()
+
+    with storage.connection() as conn:
+        cursor = conn.cursor()
+        assert storage.schema_version(conn) == 6
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = 'transactions'::regclass")
+        assert cursor.fetchone()['relkind'] == 'p'
+        cursor.execute("SELECT to_regclass('transactions_unpartitioned') IS NULL AS gone")
+        assert cursor.fetchone()['gone']
+        cursor.execute('SELECT id, date, amount FROM transactions ORDER BY id')
+        assert [tuple(row.values()) for row in cursor.fetchall()] == before
+        cursor.execute('SELECT count(*) AS rows FROM ONLY transactions_default')
+        assert cursor.fetchone()['rows'] == 0
+        for month in ('202301', '202302', '202303'):
+            cursor.execute(f'SELECT count(*) AS rows FROM transactions_p{month}')
+            assert cursor.fetchone()['rows'] > 0
+
+    assert storage.balance(user_id)['entries'] == len(ROWS)
+    assert storage.check_balances(user_id) == []
+    # New ids continue after the migrated ones
+    storage.ensure_categories(user_id, {'Food'})
+    [new_id] = storage.insert_transactions([(datetime.now(timezone.utc), 'Food', 5, 'expense', user_id)])
+    assert new_id > max(row[0] for row in before)
+    assert not storage.init_schema()
+
+
+@pytest.mark.parametrize('detach', [False, True])
+def test_archive_and_restore_round_trip(storage, tmp_path, detach):
+    storage.init_schema()
+    user_id = add_user(storage)
+    before = snapshot(storage, user_id)
+
+    archived = storage.archive_months(date(2023, 3, 1), str(tmp_path), detach)
+
+    assert [(month, rows) for month, rows, _ in archived] == [(date(2023, 1, 1), 2), (date(2023, 2, 1), 2)]
+    for _, _, location in archived:
+        if detach:
+            assert location.startswith('archive.')
+        else:
+            with gzip.open(location, 'rt') as f:
+                assert f.readline().strip() == 'id,date,description,category_id,amount,type,user_id'
+    with storage.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT to_regclass('transactions_p202301') IS NULL AS gone")
+        assert cursor.fetchone()['gone']
+        cursor.execute('SELECT count(*) AS rows FROM transactions')
+        assert cursor.fetchone()['rows'] == 1
+    assert snapshot(storage, user_id) == before
+    assert storage.check_balances(user_id) == []
+
+    assert storage.restore_month(date(2023, 1, 1)) == 2
+    assert storage.restore_month(date(2023, 2, 1)) == 2
+    assert storage.restore_month(date(2023, 2, 1)) == 0
+
+    with storage.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT count(*) AS rows FROM transactions')
+        assert cursor.fetchone()['rows'] == len(ROWS)
+        cursor.execute('SELECT count(*) AS rows FROM archived_categories')
+        assert cursor.fetchone()['rows'] == 0
+    assert snapshot(storage, user_id) == before
+    assert storage.check_balances(user_id) == []
@@ -0,0 +1,149 @@
+"""
+Read routing against a real PostgreSQL primary and streaming replica.
+
+Needs a scratch primary database and a replica streaming from it (see
+"Read replica" in the README), connected as a superuser so the test can
+pause replay and stop the WAL receiver:
+
+    TEST_DATABASE_URL=postgresql://localhost:5432/tracker_test \\
+    TEST_DATABASE_REPLICA_URL=postgresql://localhost:5433/tracker_test \\
+    python -m pytest tests/test_postgres_replica.py
+
+Skipped unless both are set; DATABASE_URL is never used.
+"""
+
+import os
+import time
+from datetime import datetime, timezone
+
+import pytest
+from flask import Flask, g
+
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+TEST_DATABASE_REPLICA_URL = os.getenv('TEST_DATABASE_REPLICA_URL')
+
+pytestmark = pytest.mark.skipif(not (TEST_DATABASE_URL and TEST_DATABASE_REPLICA_URL),
+                                reason='TEST_DATABASE_URL and TEST_DATABASE_REPLICA_URL are not set')
+
+MAX_LAG = 1.0  # Seconds; short so the test does not wait long for lag to show
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    import db_pool
+    import postgres_storage
+    from postgres_storage import PostgresStorage
+
+    monkeypatch.setenv('DATABASE_URL', TEST_DATABASE_URL)
+    monkeypatch.setenv('DATABASE_REPLICA_URL', TEST_DATABASE_REPLICA_URL)
+    monkeypatch.setenv('APP_TIMEZONE', 'UTC')
+    monkeypatch.setattr(postgres_storage, 'REPLICA_MAX_LAG', MAX_LAG)
+    monkeypatch.setattr(postgres_storage, 'REPLICA_CHECK_INTERVAL', 0)
+    monkeypatch.setattr(postgres_storage, 'REPLICA_RETRY_AFTER', 0)
+    db_pool.reset_pool()
+    storage = PostgresStorage('UTC')
+    with storage.connection(write=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute('DROP SCHEMA IF EXISTS archive CASCADE')
+        cursor.execute('DROP SCHEMA public CASCADE')
+        cursor.execute('CREATE SCHEMA public')
+    storage.init_schema()
+    wait_for(lambda: usable(storage), 'the replica to catch up')
+    yield storage
+    replica_sql(storage, 'SELECT pg_wal_replay_resume()')
+    db_pool.reset_pool()
+
+
+def wait_for(condition, what, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            pytest.fail(f'timed out waiting for {what}')
+        time.sleep(0.1)
+
+
+def usable(storage):
+    storage._replica.update(checked_at=None, down_until=0.0)
+    return storage._replica_usable()
+
+
+def replica_sql(storage, sql):
+    import db_pool
+
+    pool = db_pool.get_pool('replica')
+    conn = pool.getconn()
+    try:
+        conn.cursor().execute(sql)
+        conn.rollback()
+    finally:
+        pool.putconn(conn)
+
+
+def read_server(storage):
+    """Which server a read block outside a request runs on."""
+    with storage.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT pg_is_in_recovery() AS replica')
+        return 'replica' if cursor.fetchone()['replica'] else 'primary'
+
+
+def write(storage, user_id, amount=5):
+    storage.ensure_categories(user_id, {'Food'})
+    storage.insert_transactions([(datetime.now(timezone.utc), 'Food', amount, 'expense', user_id)])
+
+
+def test_reads_go_to_a_caught_up_replica(storage):
+    user_id = storage.create_user('alice', 'x')
+    write(storage, user_id)
+    wait_for(lambda: usable(storage), 'the replica to replay the write')
+
+    assert read_server(storage) == 'replica'
+    assert storage.balance(user_id)['total_expenses'] == 5
+    # Idle for longer than MAX_LAG: still no lag, since nothing is left to replay
+    time.sleep(MAX_LAG * 2)
+    assert usable(storage)
+    assert storage._replica['lag'] == 0
+
+
+def test_requests_read_their_own_writes_from_the_primary(storage):
+    user_id = storage.create_user('alice', 'x')
+    wait_for(lambda: usable(storage), 'the replica to replay the new user')
+    app = Flask(__name__)
+    with app.test_request_context('/'):
+        with storage.connection() as conn:
+            assert conn is g.db_replica_conn
+        storage.release()
+        with storage.connection(write=True):
+            write(storage, user_id, 7)
+        with storage.connection() as conn:
+            assert conn is g.db_primary_conn
+        assert storage.balance(user_id)['total_expenses'] == 7
+        storage.release()
+
+
+def test_lagging_replica_is_skipped_until_it_catches_up(storage):
+    user_id = storage.create_user('alice', 'x')
+    replica_sql(storage, 'SELECT pg_wal_replay_pause()')
+    write(storage, user_id)
+    time.sleep(MAX_LAG * 2)
+    write(storage, user_id)
+
+    assert not usable(storage)
+    assert storage._replica['lag'] > MAX_LAG
+    assert read_server(storage) == 'primary'
+    assert storage.balance(user_id)['entries'] == 2
+
+    replica_sql(storage, 'SELECT pg_wal_replay_resume()')
+    wait_for(lambda: usable(storage), 'the replica to catch up')
+    assert read_server(storage) == 'replica'
+
+
+def test_replica_without_wal_receiver_is_skipped(storage):
+    # The receiver restarts after wal_retrieve_retry_interval (5s by default);
+    # until then the replica cannot know how far behind it is
+    replica_sql(storage, 'SELECT pg_terminate_backend(pid) FROM pg_stat_wal_receiver')
+    wait_for(lambda: not usable(storage), 'the replica to report no WAL receiver', timeout=4)
+    assert storage._replica['lag'] is None
+    assert read_server(storage) == 'primary'
+
+    wait_for(lambda: usable(storage), 'the WAL receiver to come back')
@@ -0,0 +1,31 @@
+"""
+The report cache must not outlive a write made anywhere else.
+"""
+
+from datetime import datetime
+
+import app
+
+
+def test_report_sees_writes_made_outside_this_worker():
+    app.storage.init_schema()
+    client = app.app.test_client()
+    client.post('/register', data={'username': 'reports', 'password': 'secret'})
+    client.post('/login', data={'username': 'reports', 'password': 'secret'})
+    now = datetime.now(app.APP_TZ)
+    client.post('/calculate', data={'earning_name_1': 'Job', 'earning_amount_1': '100'})
+    paths = (f'/reports/{now.year}/{now.month}', f'/reports/{now.year}')
+    for path in paths:
+        page = client.get(path)
+        assert page.status_code == 200 and b'Bonus' not in page.data
+
+    # As another gunicorn worker or import_legacy.py would: storage only,
+    # nothing in this process's caches is touched
+    user_id = app.storage.find_user('reports')['id']
+    app.storage.ensure_categories(user_id, {'Bonus'})
+    app.storage.insert_transactions([(now, 'Bonus', 12345, 'earning', user_id)])
+
+    for path in paths:
+        page = client.get(path)
+        assert page.status_code == 200
+        assert b'Bonus' in page.data
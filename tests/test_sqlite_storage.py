@@ -0,0 +1,163 @@
+"""
+daily_summary and balances on the SQLite backend.
+
+Both are kept in step with transactions by triggers; after every kind of
+write they must match totals recomputed from the rows themselves.
+"""
+
+from datetime import date, datetime, timezone
+
+import pytest
+
+
+def add_user(storage, name='alice'):
+    return storage.create_user(name, 'x')
+
+
+def add(storage, user_id, rows):
+    """Insert (datetime, description, amount, type) rows for the user; returns the ids."""
+    storage.ensure_categories(user_id, {description for _, description, _, _ in rows})
+    return storage.insert_transactions([(when, description, amount, kind, user_id)
+                                        for when, description, amount, kind in rows])
+
+
+def at(day, hour=12):
+    return datetime(day.year, day.month, day.day, hour, tzinfo=timezone.utc)
+
+
+def recomputed(storage, user_id):
+    """(daily totals, balance) worked out from the transactions table."""
+    with storage.connection() as conn:
+        rows = conn.cursor().execute('''
+            SELECT day,
+                   SUM(CASE WHEN type = 'earning' THEN amount ELSE 0 END) AS earning,
+                   SUM(CASE WHEN type = 'expense' THEN amount ELSE 0 END) AS expense,
+                   COUNT(*) AS entries
+            FROM transactions WHERE user_id = ?
+            GROUP BY day ORDER BY day
+        ''', (user_id,)).fetchall()
+    days = [(date.fromisoformat(row['day']), row['earning'], row['expense']) for row in rows]
+    earning = sum(row['earning'] for row in rows)
+    expenses = sum(row['expense'] for row in rows)
+    balance = {'total_earning': earning, 'total_expenses': expenses,
+               'entries': sum(row['entries'] for row in rows), 'balance': earning - expenses}
+    return days, balance
+
+
+def assert_in_step(storage, user_id):
+    days, balance = recomputed(storage, user_id)
+    assert storage.daily_totals(user_id) == days
+    assert storage.balance(user_id) == balance
+    assert storage.check_balances(user_id) == []
+
+
+def test_insert_updates_summary_and_balance(sqlite_storage):
+    user_id = add_user(sqlite_storage)
+    add(sqlite_storage, user_id, [
+        (at(date(2024, 3, 1), 9), 'Salary', 1000, 'earning'),
+        (at(date(2024, 3, 1), 18), 'Food', 30, 'expense'),
+        (at(date(2024, 3, 2)), 'Bus', 5, 'expense'),
+    ])
+
+    assert sqlite_storage.daily_totals(user_id) == [(date(2024, 3, 1), 1000, 30), (date(2024, 3, 2), 0, 5)]
+    assert sqlite_storage.balance(user_id) == {'total_earning': 1000, 'total_expenses': 35,
+                                               'entries': 3, 'balance': 965}
+    assert_in_step(sqlite_storage, user_id)
+
+
+def test_update_and_delete_keep_totals_in_step(sqlite_storage):
+    user_id = add_user(sqlite_storage)
+    salary, food, bus = add(sqlite_storage, user_id, [
+        (at(date(2024, 3, 1)), 'Salary', 1000, 'earning'),
+        (at(date(2024, 3, 1)), 'Food', 30, 'expense'),
+        (at(date(2024, 3, 2)), 'Bus', 5, 'expense'),
+    ])
+    version = sqlite_storage.data_version(user_id)
+
+    sqlite_storage.ensure_categories(user_id, {'Groceries'})
+    assert sqlite_storage.update_transaction(user_id, food, 'Groceries', 45) == date(2024, 3, 1)
+    assert_in_step(sqlite_storage, user_id)
+    assert sqlite_storage.daily_totals(user_id)[0] == (date(2024, 3, 1), 1000, 45)
+
+    # Deleting a day's only entry removes the day
+    assert sqlite_storage.delete_transaction(user_id, bus) == date(2024, 3, 2)
+    assert_in_step(sqlite_storage, user_id)
+    assert [day for day, _, _ in sqlite_storage.daily_totals(user_id)] == [date(2024, 3, 1)]
+    assert sqlite_storage.data_version(user_id) > version
+
+    assert sqlite_storage.delete_transaction(user_id, bus) is None
+    assert sqlite_storage.update_transaction(user_id, bus, 'Bus', 1) is None
+
+
+def test_bulk_operations_keep_totals_in_step(sqlite_storage):
+    user_id = add_user(sqlite_storage)
+    other = add_user(sqlite_storage, 'bob')
+    ids = add(sqlite_storage, user_id, [(at(date(2024, 1, day)), 'Food', day, 'expense') for day in range(1, 11)])
+    theirs = add(sqlite_storage, other, [(at(date(2024, 1, 1)), 'Salary', 500, 'earning')])
+
+    assert sqlite_storage.delete_transactions(user_id, ids[:3] + theirs) == 3
+    sqlite_storage.ensure_categories(user_id, {'Rent'})
+    assert sqlite_storage.update_transactions(user_id, [(ids[3], 'Rent', 700), (ids[4], None, 1), (theirs[0], None, 1)]) == 2
+
+    assert_in_step(sqlite_storage, user_id)
+    assert_in_step(sqlite_storage, other)
+    assert sqlite_storage.balance(other)['total_earning'] == 500
+    assert sqlite_storage.get_transaction(user_id, ids[3])['description'] == 'Rent'
+
+
+def test_load_transactions_keeps_totals_in_step(sqlite_storage):
+    user_id = add_user(sqlite_storage)
+    batches = [[(at(date(2024, 2, 1 + n % 28)), f'Item {n % 7}', n, 'expense' if n % 3 else 'earning')
+                for n in range(start, start + 500)]
+               for start in range(0, 2000, 500)]
+
+    assert sqlite_storage.load_transactions(user_id, iter(batches)) == 2000
+    assert sqlite_storage.balance(user_id)['entries'] == 2000
+    assert_in_step(sqlite_storage, user_id)
+
+
+def test_repair_rebuilds_drifted_balances(sqlite_storage):
+    user_id = add_user(sqlite_storage)
+    add(sqlite_storage, user_id, [(at(date(2024, 3, 1)), 'Salary', 1000, 'earning')])
+    with sqlite_storage.connection(write=True) as conn:
+        conn.cursor().execute('UPDATE balances SET total_earning = 1 WHERE user_id = ?', (user_id,))
+
+    [drifted] = sqlite_storage.check_balances(user_id, repair=True)
+    assert (drifted['stored_earning'], drifted['actual_earning']) == (1, 1000)
+    assert_in_step(sqlite_storage, user_id)
+
+
+@pytest.mark.parametrize('restore', [False, True])
+def test_archive_and_restore_keep_balances(sqlite_storage, tmp_path, restore):
+    user_id = add_user(sqlite_storage)
+    add(sqlite_storage, user_id, [
+        (at(date(2023, 1, 5)), 'Salary', 3000, 'earning'),
+        (at(date(2023, 1, 6)), 'Food', 120, 'expense'),
+        (at(date(2023, 2, 1)), 'Rent', 900, 'expense'),
+        (at(date(2023, 3, 15)), 'Salary', 3000, 'earning'),
+    ])
+    balance = sqlite_storage.balance(user_id)
+    daily_totals = sqlite_storage.daily_totals(user_id)
+    report = sqlite_storage.report_data(user_id, date(2023, 1, 1), date(2024, 1, 1), 'month')
+
+    archived = sqlite_storage.archive_months(date(2023, 3, 1), str(tmp_path / 'archive'))
+
+    assert [(month, rows) for month, rows, _ in archived] == [(date(2023, 1, 1), 2), (date(2023, 2, 1), 1)]
+    assert sqlite_storage.latest_transaction_id(user_id) is not None
+    assert sqlite_storage.balance(user_id) == balance
+    assert sqlite_storage.daily_totals(user_id) == daily_totals
+    assert sqlite_storage.report_data(user_id, date(2023, 1, 1), date(2024, 1, 1), 'month') == report
+    assert sqlite_storage.check_balances(user_id) == []
+
+    if restore:
+        assert sqlite_storage.restore_month(date(2023, 1, 1)) == 2
+        assert sqlite_storage.restore_month(date(2023, 2, 1)) == 1
+        assert sqlite_storage.restore_month(date(2023, 2, 1)) == 0
+        assert_in_step(sqlite_storage, user_id)
+        assert sqlite_storage.balance(user_id) == balance
+        assert sqlite_storage.daily_totals(user_id) == daily_totals
+
+    # Writes after archiving still move the totals
+    add(sqlite_storage, user_id, [(at(date(2023, 3, 16)), 'Food', 10, 'expense')])
+    assert sqlite_storage.balance(user_id)['total_expenses'] == balance['total_expenses'] + 10
+    assert sqlite_storage.check_balances(user_id) == []
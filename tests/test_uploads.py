@@ -0,0 +1,123 @@
+"""
+Validation of user input: uploaded files, the edit form and bulk requests.
+"""
+
+import io
+from datetime import datetime, timezone
+
+import pytest
+
+import app
+from app import iter_upload_rows, parse_bulk_request, parse_edit_form, parse_line_items, parse_upload_row
+
+
+def rows(text):
+    return list(iter_upload_rows(io.StringIO(text)))
+
+
+def test_csv_header_is_case_and_space_insensitive():
+    assert rows('Date, Type ,Description,AMOUNT\n2024-03-01,expense,Food,12\n') == [
+        (2, {'date': '2024-03-01', 'type': 'expense', 'description': 'Food', 'amount': '12'}),
+    ]
+
+
+def test_jsonl_lines_are_numbered_and_bad_ones_yield_none():
+    assert rows('{"date": "2024-03-01", "amount": 5}\n\nnot json\n') == [
+        (1, {'date': '2024-03-01', 'amount': 5}),
+        (3, None),
+    ]
+
+
+def test_empty_file_has_no_rows():
+    assert rows('') == []
+
+
+def test_parse_upload_row():
+    when, description, amount, kind = parse_upload_row(
+        {'date': '2024-03-01 09:30', 'type': ' Expense ', 'description': ' Food ', 'amount': ' 12 '})
+    assert (when, description, amount, kind) == (datetime(2024, 3, 1, 9, 30, tzinfo=app.APP_TZ), 'Food', 12, 'expense')
+    assert parse_upload_row({'date': '2024-03-01T09:30:00+00:00', 'name': 'Job', 'amount': 5})[0] == \
+        datetime(2024, 3, 1, 9, 30, tzinfo=timezone.utc)
+
+
+def test_untyped_upload_rows_take_the_type_from_the_sign():
+    assert parse_upload_row({'date': '2024-03-01', 'description': 'Food', 'amount': '-12'})[2:] == (12, 'expense')
+    assert parse_upload_row({'date': '2024-03-01', 'description': 'Job', 'amount': '40'})[2:] == (40, 'earning')
+
+
+@pytest.mark.parametrize('row, message', [
+    (None, 'not a row'),
+    ({'date': '01/03/2024', 'description': 'Food', 'amount': '1'}, 'bad date'),
+    ({'date': '2024-03-01', 'description': ' ', 'amount': '1'}, 'missing description'),
+    ({'date': '2024-03-01', 'description': 'x' * 201, 'amount': '1'}, 'longer than'),
+    ({'date': '2024-03-01', 'description': 'Food', 'amount': '1.5'}, 'whole number'),
+    ({'date': '2024-03-01', 'description': 'Food', 'amount': 'ten'}, 'whole number'),
+    ({'date': '2024-03-01', 'type': 'expense', 'description': 'Food', 'amount': '-1'}, 'must not be negative'),
+    ({'date': '2024-03-01', 'type': 'refund', 'description': 'Food', 'amount': '1'}, 'earning or expense'),
+    ({'date': '2024-03-01', 'type': 'earning', 'description': 'Job', 'amount': '2147483648'}, 'must not exceed'),
+    ({'date': '2024-03-01', 'description': 'Job', 'amount': '-2147483648'}, 'must not exceed'),
+    ({'date': '2024-03-01', 'description': 'Fo\x00od', 'amount': '1'}, 'NUL'),
+])
+def test_invalid_upload_rows_are_rejected(row, message):
+    with pytest.raises(ValueError, match=message):
+        parse_upload_row(row)
+
+
+def test_amounts_up_to_the_integer_column_limit_are_accepted():
+    assert parse_upload_row({'date': '2024-03-01', 'description': 'Job', 'amount': '2147483647'})[2] == app.MAX_AMOUNT
+    assert parse_edit_form({'description': 'Job', 'amount': '2147483647'}) == ('Job', app.MAX_AMOUNT)
+    assert parse_bulk_request({'update': [{'id': 1, 'amount': app.MAX_AMOUNT}]}) == ([], [(1, None, app.MAX_AMOUNT)])
+
+
+def test_upload_summary_lists_out_of_range_rows_without_failing_the_rest():
+    summary = {'rows': 0, 'loaded': 0, 'rejected': 0, 'errors': [], 'days': set()}
+    batches = list(app.upload_batches(rows(
+        'date,type,description,amount\n'
+        '2024-03-01,earning,Job,100\n'
+        '2024-03-01,earning,Lottery,99999999999\n'
+        '2024-03-02,expense,"Fo\x00od",5\n'), summary))
+    assert [[row[1] for row in batch] for batch in batches] == [['Job']]
+    assert summary['rejected'] == 2
+    assert [error['line'] for error in summary['errors']] == [3, 4]
+
+
+def test_parse_edit_form():
+    assert parse_edit_form({'description': ' Rent ', 'amount': '700'}) == ('Rent', 700)
+    assert parse_edit_form({'description': 'Gift', 'amount': '0'}) == ('Gift', 0)
+
+
+@pytest.mark.parametrize('form, message', [
+    ({'description': 'Rent', 'amount': 'abc'}, 'whole number'),
+    ({'description': 'Rent', 'amount': '3.5'}, 'whole number'),
+    ({'description': 'Rent', 'amount': ''}, 'whole number'),
+    ({'description': 'Rent'}, 'whole number'),
+    ({'description': 'Rent', 'amount': '-5'}, 'must not be negative'),
+    ({'description': '  ', 'amount': '5'}, 'must not be empty'),
+    ({'description': 'Rent', 'amount': '2147483648'}, 'must not exceed'),
+    ({'description': 'Re\x00nt', 'amount': '5'}, 'NUL'),
+])
+def test_invalid_edit_forms_are_rejected(form, message):
+    with pytest.raises(ValueError, match=message):
+        parse_edit_form(form)
+
+
+def test_line_items_skip_empty_and_non_positive_amounts():
+    form = {'earning_name_1': 'Job', 'earning_amount_1': '100',
+            'expense_name_1': 'Food', 'expense_amount_1': '-5',
+            'expense_name_2': ' ', 'expense_amount_2': '7',
+            'expense_name_3': 'Bus', 'expense_amount_3': '3'}
+    assert parse_line_items(form) == ([{'name': 'Job', 'amount': 100}], [{'name': 'Bus', 'amount': 3}])
+
+
+@pytest.mark.parametrize('payload, message', [
+    ({'update': [{'id': 1, 'amount': -1}]}, 'integer from 0 to'),
+    ({'update': [{'id': 1, 'amount': '5'}]}, 'integer from 0 to'),
+    ({'update': [{'id': 1, 'amount': 2.5}]}, 'integer from 0 to'),
+    ({'update': [{'id': 1, 'amount': 2**31}]}, 'integer from 0 to'),
+    ({'update': [{'id': 1, 'description': 'a\x00b'}]}, 'NUL'),
+    ({'update': [{'id': 1}]}, "a 'description' or an 'amount'"),
+    ({'delete': [1], 'update': [{'id': 1, 'amount': 1}]}, 'only once'),
+])
+def test_invalid_bulk_requests_are_rejected(payload, message):
+    with pytest.raises(ValueError, match=message):
+        parse_bulk_request(payload)